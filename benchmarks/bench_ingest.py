@@ -0,0 +1,37 @@
+import argparse
+import contextlib
+import io
+import time
+from benchmarks.generate import make_frame
+from pipeline.ingest import validate_metrics
+
+"""
+Benchmarks the vectorized validation engine on synthetic data (benchmarks.generate)
+and reports rows/second for each size, so linear scaling can be checked from 10k to
+10M rows. benchmarks.bench_pipeline covers the whole pipeline.
+
+Usage:
+    python -m benchmarks.bench_ingest --sizes 10000 100000 1000000 10000000
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion validation benchmark")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10_000, 100_000, 1_000_000, 10_000_000], help="Row counts to benchmark")
+    parser.add_argument("--error-rate", type=float, default=0.001, help="Fraction of rows with an invalid value")
+    parser.add_argument("--disorder-rate", type=float, default=0.0, help="Fraction of rows arriving out of order")
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'rows':>12} {'seconds':>10} {'rows/s':>14} {'s per 10k rows':>16}")
+    for size in args.sizes:
+        df = make_frame(size, args.error_rate, args.disorder_rate)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            validate_metrics(df)
+        elapsed = time.perf_counter() - start
+        per_10k = elapsed / size * 10_000
+        baseline = baseline or per_10k
+        print(f"{size:>12} {elapsed:>10.3f} {size / elapsed:>14,.0f} {per_10k:>16.5f} ({per_10k / baseline:.2f}x)")
+
+if __name__ == "__main__":
+    main()
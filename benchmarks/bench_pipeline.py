@@ -0,0 +1,188 @@
+import argparse
+import contextlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from benchmarks.generate import cached_csv
+
+"""
+Benchmarks run_ingestion, run_transformation and run_analytics on their own and end to
+end, on synthetic CSVs from benchmarks.generate (cached in --data-dir), and compares the
+results against a JSON baseline.
+
+Every case runs in a fresh process, so its peak RSS is its own. The stages a case
+depends on (ingestion before transformation, both before analytics) run untimed in the
+same process first, so a stage's peak RSS also covers the data it is handed. Timings come
+from pipeline.instrument: wall time, CPU time and peak RSS of the measured stage. With
+--repeat N the fastest of N runs is kept.
+
+--save-baseline writes the results to the baseline file. With a baseline, a case whose
+throughput drops more than --tolerance below it, or whose peak RSS grows more than
+--memory-tolerance above it, is reported and the command exits with status 1. Baselines
+are only comparable on the same machine and library versions; both are recorded.
+
+Usage:
+    python -m benchmarks.bench_pipeline --sizes 10000 1000000 10000000 --save-baseline
+    python -m benchmarks.bench_pipeline --sizes 10000 1000000 10000000
+"""
+
+CASES = ["ingestion", "transformation", "analytics", "end_to_end"]
+
+"""
+Runs one case in the current process.
+
+Returns:
+    dict: wall_seconds, cpu_seconds and peak_rss_bytes of the measured stage
+"""
+def run_case(case, csv_path, window_sizes, fmt):
+    from pipeline import analytics, ingest, instrument, transform
+    logging.disable(logging.WARNING)
+    output_dir = tempfile.mkdtemp(prefix="metrics_bench_")
+    os.makedirs(f"{output_dir}/processed")
+    os.makedirs(f"{output_dir}/analytics")
+    report = instrument.start_run(["bench", case])
+    try:
+        # validation prints one line per rejected row
+        with contextlib.redirect_stdout(io.StringIO()):
+            if case == "end_to_end":
+                with report.stage(case):
+                    frames = transform.run_transformation(ingest.run_ingestion(csv_path), output_dir, window_sizes, fmt=fmt, return_frames=True)
+                    analytics.run_analytics(frames, output_dir, plots=False)
+            elif case == "ingestion":
+                with report.stage(case):
+                    ingest.run_ingestion(csv_path)
+            else:
+                df = ingest.run_ingestion(csv_path)
+                if case == "transformation":
+                    with report.stage(case):
+                        transform.run_transformation(df, output_dir, window_sizes, fmt=fmt, return_frames=True)
+                else:
+                    frames = transform.run_transformation(df, output_dir, window_sizes, fmt=fmt, return_frames=True)
+                    with report.stage(case):
+                        analytics.run_analytics(frames, output_dir, plots=False)
+        stage = next(stage for stage in report.snapshot()['stages'] if stage['name'] == case)
+    finally:
+        instrument.finish(os.devnull)
+        shutil.rmtree(output_dir)
+    return {
+        "wall_seconds": stage['wall_seconds'],
+        "cpu_seconds": stage['cpu_seconds'],
+        "peak_rss_bytes": stage['peak_rss_bytes'],
+    }
+
+"""
+Runs every case at every size, each in a fresh process.
+
+Returns:
+    dict[str, dict[str, dict]]: size -> case -> measurements
+"""
+def run_benchmarks(sizes, data_dir, error_rate, disorder_rate, window_sizes, fmt, repeat=1, cases=CASES):
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for size in sizes:
+        csv_path = cached_csv(data_dir, size, error_rate, disorder_rate)
+        results[str(size)] = {}
+        for case in cases:
+            runs = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    runs.append(pool.submit(run_case, case, csv_path, window_sizes, fmt).result())
+            best = min(runs, key=lambda run: run['wall_seconds'])
+            best['rows_per_second'] = round(size / best['wall_seconds']) if best['wall_seconds'] > 0 else None
+            results[str(size)][case] = best
+            _print_result(size, case, best)
+    return results
+
+"""
+Compares results with a baseline. Throughput may drop by at most tolerance and peak RSS
+may grow by at most memory_tolerance (fractions of the baseline).
+
+Returns:
+    list[str]: one message per regression
+"""
+def find_regressions(results, baseline, tolerance=0.2, memory_tolerance=0.2):
+    regressions = []
+    for size, cases in results.items():
+        for case, measured in cases.items():
+            expected = baseline.get(size, {}).get(case)
+            if expected is None:
+                continue
+            if expected.get('rows_per_second') and measured['rows_per_second'] < expected['rows_per_second'] * (1 - tolerance):
+                regressions.append(f"{case} at {size} rows: {measured['rows_per_second']:,} rows/s, baseline {expected['rows_per_second']:,} rows/s")
+            if expected.get('peak_rss_bytes') and measured['peak_rss_bytes'] and measured['peak_rss_bytes'] > expected['peak_rss_bytes'] * (1 + memory_tolerance):
+                regressions.append(f"{case} at {size} rows: peak RSS {measured['peak_rss_bytes'] / 2**20:,.0f} MiB, baseline {expected['peak_rss_bytes'] / 2**20:,.0f} MiB")
+    return regressions
+
+"""
+Returns:
+    dict: platform and library versions the results were measured with
+"""
+def environment():
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+def _print_result(size, case, result):
+    print(f"{size:>12} {case:>16} {result['wall_seconds']:>10.3f} {result['cpu_seconds']:>10.3f} {result['rows_per_second'] or 0:>14,} {result['peak_rss_bytes'] / 2**20:>12,.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000], help="Row counts to benchmark")
+    parser.add_argument("--cases", nargs='+', choices=CASES, default=CASES, help="Stages to benchmark")
+    parser.add_argument("--error-rate", type=float, default=0.001, help="Fraction of rows with an invalid value")
+    parser.add_argument("--disorder-rate", type=float, default=0.001, help="Fraction of rows arriving out of order")
+    parser.add_argument("--window-sizes", type=int, nargs='+', default=[5, 15], help="Window sizes in seconds")
+    parser.add_argument("--format", choices=["columnar", "csv"], default="columnar", help="Storage format for processed windows")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case, the fastest is kept")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "metrics_bench"), help="Where generated CSVs are cached")
+    parser.add_argument("--results", default="benchmarks/results.json", help="Where to write the results")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json", help="Baseline to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to the baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed throughput drop, as a fraction of the baseline")
+    parser.add_argument("--memory-tolerance", type=float, default=0.2, help="Allowed peak RSS growth, as a fraction of the baseline")
+    args = parser.parse_args()
+
+    print(f"{'rows':>12} {'case':>16} {'seconds':>10} {'cpu s':>10} {'rows/s':>14} {'peak MiB':>12}")
+    results = run_benchmarks(args.sizes, args.data_dir, args.error_rate, args.disorder_rate, args.window_sizes, args.format, args.repeat, args.cases)
+    document = {
+        "environment": environment(),
+        "settings": {"error_rate": args.error_rate, "disorder_rate": args.disorder_rate, "window_sizes": args.window_sizes, "format": args.format, "repeat": args.repeat},
+        "results": results,
+    }
+    with open(args.results, "w") as f:
+        json.dump(document, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['environment'] != document['environment'] or baseline['settings'] != document['settings']:
+        print("Warning: the baseline was measured with a different environment or settings")
+    regressions = find_regressions(results, baseline['results'], args.tolerance, args.memory_tolerance)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+"""
+Measures the cold start of main.py: every command runs in a new interpreter, and the
+median over --runs is checked against --budget-ms (exit status 1 when it is over).
+A bare interpreter start (python -c pass) is measured too, as the floor no change
+to main.py can go below.
+
+Usage:
+    python -m benchmarks.bench_startup --budget-ms 150
+    python -X importtime main.py --help    # which imports the time goes to
+"""
+
+COMMANDS = [["main.py", "--help"], ["main.py", "query", "--help"], ["main.py", "compact", "--help"]]
+
+"""
+Returns:
+    float: median wall time of running the command in a new interpreter, in milliseconds
+"""
+def median_start_ms(command, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *command], stdout=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="main.py cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=20, help="Runs per command, the median is reported")
+    parser.add_argument("--budget-ms", type=float, default=150, help="Allowed median start time of every command")
+    args = parser.parse_args()
+
+    floor = median_start_ms(["-c", "pass"], args.runs)
+    print(f"{'command':>28} {'median ms':>10}")
+    print(f"{'python -c pass':>28} {floor:>10.1f}")
+    over = []
+    for command in COMMANDS:
+        elapsed = median_start_ms(command, args.runs)
+        print(f"{' '.join(command):>28} {elapsed:>10.1f}")
+        if elapsed > args.budget_ms:
+            over.append(" ".join(command))
+    if over:
+        print(f"Over the {args.budget_ms:g} ms budget: {', '.join(over)}")
+        sys.exit(1)
+    print(f"All commands start within {args.budget_ms:g} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from pipeline.collect import HEADER
+
+"""
+Deterministic synthetic metrics in the collect_metrics CSV schema.
+
+Samples follow a daily CPU load cycle with noise, a random walk for memory and a slowly
+filling disk. A fraction of rows (error_rate) is made invalid, cycling through the
+rejection rules of ingestion (value out of range, null value, CPU sum above 100, bad
+timestamp), and a fraction (disorder_rate) is swapped with the previous row, so it
+arrives out of chronological order. The same arguments always give the same rows.
+
+Usage:
+    python -m benchmarks.generate --rows 1000000 --error-rate 0.001 --disorder-rate 0.001 --output data/raw/synthetic.csv
+"""
+
+ERROR_KINDS = ["range", "null", "cpu_sum", "timestamp"]
+
+"""
+Generates samples chunk by chunk, so files far larger than memory can be written.
+
+Returns:
+    iterator[dataframe]: chunks of at most chunk_rows rows with the collect.HEADER columns
+"""
+def iter_frames(num_rows, error_rate=0.001, disorder_rate=0.0, seed=0, chunk_rows=1_000_000, start="2026-01-01T00:00:00", interval=1.0):
+    rng = np.random.default_rng(seed)
+    start_ns = pd.Timestamp(start).as_unit("ns").value
+    step_ns = int(interval * 1e9)
+    memory = 50.0
+    for first in range(0, num_rows, chunk_rows):
+        size = min(chunk_rows, num_rows - first)
+        positions = first + np.arange(size)
+        ns = start_ns + positions * step_ns
+        hours = ns / 3.6e12 % 24
+        user = np.clip(15 + 10 * np.sin((hours - 9) / 24 * 2 * np.pi) + rng.normal(0, 5, size), 0, 60).round(1)
+        system = np.clip(user * 0.4 + rng.normal(0, 2, size), 0, 30).round(1)
+        memory_walk = np.clip(memory + np.cumsum(rng.normal(0, 0.05, size)), 20, 95)
+        memory = memory_walk[-1]
+        timestamps = np.datetime_as_string(ns.astype("datetime64[ns]"), unit="ms").astype(object)
+        df = pd.DataFrame({
+            "timestamp": timestamps,
+            "cpu_user_percent": user,
+            "cpu_system_percent": system,
+            "cpu_idle_percent": (100 - user - system).round(1),
+            "memory_used_percent": memory_walk.round(1),
+            "disk_used_percent": (40 + 20 * positions / max(num_rows, 1)).round(1),
+        }, columns=HEADER)
+        _add_errors(df, rng, error_rate)
+        _add_disorder(df, rng, disorder_rate)
+        yield df
+
+"""
+Returns:
+    dataframe: num_rows synthetic samples (see iter_frames)
+"""
+def make_frame(num_rows, error_rate=0.001, disorder_rate=0.0, seed=0):
+    return pd.concat(iter_frames(num_rows, error_rate, disorder_rate, seed, chunk_rows=max(num_rows, 1)), ignore_index=True)
+
+"""
+Writes synthetic samples to a CSV in the collect_metrics schema.
+
+Returns:
+    str: path of the CSV
+"""
+def write_csv(path, num_rows, error_rate=0.001, disorder_rate=0.0, seed=0):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w", newline="") as f:
+        f.write(",".join(HEADER) + "\n")
+        for df in iter_frames(num_rows, error_rate, disorder_rate, seed):
+            df.to_csv(f, header=False, index=False)
+    os.replace(path + ".tmp", path)
+    return path
+
+"""
+Path of a cached synthetic CSV in data_dir, generated on first use.
+
+Returns:
+    str: path of the CSV
+"""
+def cached_csv(data_dir, num_rows, error_rate=0.001, disorder_rate=0.0, seed=0):
+    path = os.path.join(data_dir, f"metrics_{num_rows}_{error_rate:g}_{disorder_rate:g}_{seed}.csv")
+    if not os.path.exists(path):
+        write_csv(path, num_rows, error_rate, disorder_rate, seed)
+    return path
+
+# invalid rows cycle through the ingestion rejection rules
+def _add_errors(df, rng, error_rate):
+    bad = np.flatnonzero(rng.random(len(df)) < error_rate)
+    kinds = rng.integers(0, len(ERROR_KINDS), len(bad))
+    rows = df.index[bad]
+    df.loc[rows[kinds == 0], "memory_used_percent"] = 101.0
+    df.loc[rows[kinds == 1], "cpu_user_percent"] = np.nan
+    df.loc[rows[kinds == 2], ["cpu_user_percent", "cpu_system_percent"]] = [70.0, 40.0]
+    df.loc[rows[kinds == 3], "timestamp"] = "not-a-timestamp"
+
+# a swapped pair puts the later sample first, so the earlier one arrives out of order
+def _add_disorder(df, rng, disorder_rate):
+    swapped = np.flatnonzero(rng.random(len(df)) < disorder_rate)
+    swapped = swapped[swapped > 0]
+    timestamps = df['timestamp'].to_numpy(copy=True)
+    timestamps[swapped], timestamps[swapped - 1] = timestamps[swapped - 1], timestamps[swapped]
+    df['timestamp'] = timestamps
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic metrics generator")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of samples")
+    parser.add_argument("--error-rate", type=float, default=0.001, help="Fraction of invalid rows")
+    parser.add_argument("--disorder-rate", type=float, default=0.0, help="Fraction of rows arriving out of order")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output", default="data/raw/synthetic_metrics.csv", help="CSV to write")
+    args = parser.parse_args()
+    write_csv(args.output, args.rows, args.error_rate, args.disorder_rate, args.seed)
+    print(f"Wrote {args.rows} rows to {args.output}")
+
+if __name__ == "__main__":
+    main()
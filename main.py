@@ -1,11 +1,10 @@
 import argparse
 import logging
 import sys
-import yaml
-from pipeline import ingest, transform, analytics, collect
 
-with open("config.yaml", "r") as f:
-    config = yaml.safe_load(f)
+# config.yaml and the pipeline modules (with pandas, numpy and psutil behind them) are
+# only loaded once the arguments are parsed, so --help and usage errors return at once.
+# Run `python -m benchmarks.bench_startup` to check the cold-start budget.
 
 def setup_logging(level="INFO"):
     logging.basicConfig(
@@ -16,38 +15,144 @@ def setup_logging(level="INFO"):
 def parse_args():
     parser = argparse.ArgumentParser(description="System Metrics Pipeline")
     parser.add_argument("--collect", action="store_true", help="Collect system metrics instead of reading an existing CSV")
-    parser.add_argument("--duration", type=int, default=60, help="Collection duration in seconds")
-    parser.add_argument("--interval", type=int, default=1, help="Sampling interval in seconds")
-    parser.add_argument("--input", default="data/raw/metrics_collected.csv", help="Path to raw metrics CSV, skipped if using --collect")
+    parser.add_argument("--live", action="store_true", help="Collect and process metrics concurrently, emitting each window and its alerts as soon as it closes")
+    parser.add_argument("--duration", type=float, default=60, help="Collection duration in seconds")
+    parser.add_argument("--interval", type=float, default=1, help="Sampling interval in seconds (fractions allowed, e.g. 0.1 for 10 Hz)")
+    parser.add_argument("--wide", action="store_true", default=None, help="Collect the wide schema: per-CPU, per-disk, I/O rates and top processes (default: collect.schema in config.yaml)")
+    parser.add_argument("--input", default="data/raw/metrics_collected.csv", help="Path to raw metrics CSV, or a directory / glob pattern of one CSV per host (fleet mode); skipped if using --collect")
     parser.add_argument("--output", default="data", help="Directory to store outputs")
-    parser.add_argument("--window-sizes", type=int, nargs='+', default=config['windows']['default'], help="Window sizes in seconds")
+    parser.add_argument("--window-sizes", type=int, nargs='+', default=None, help="Window sizes in seconds (default: windows.default in config.yaml)")
+    parser.add_argument("--chunk-rows", type=int, default=None, help="Stream the input CSV in chunks of this many rows to keep memory bounded")
+    parser.add_argument("--incremental", action="store_true", help="Only process rows appended since the last --incremental run, using the window state saved in the output directory")
+    parser.add_argument("--format", choices=["columnar", "csv"], default=None, help="Storage format for processed windows (default: storage.format in config.yaml)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to ingest host files in fleet mode and to compute per-window analytics and plots")
+    parser.add_argument("--no-plots", action="store_true", help="Skip plotting (matplotlib is not imported)")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
+    parser.add_argument("--report", default=None, help="Path of the JSON run report (default: {output}/analytics/run_report.json)")
+    parser.add_argument("--profile", action="store_true", help="Run every stage under cProfile and tracemalloc and write the results to {output}/analytics/profile/")
+    parser.add_argument("--serve", action="store_true", help="Serve the latest windows, flags, anomalies and stage timings over HTTP (/metrics for Prometheus, /metrics.json) and keep serving after the run until interrupted")
+    parser.add_argument("--serve-port", type=int, default=None, help="Port of the --serve endpoint (default: serve.port in config.yaml)")
+    commands = parser.add_subparsers(dest="command")
+    query_parser = commands.add_parser("query", help="Query processed windows (or raw samples) in a time range")
+    query_parser.add_argument("--start", required=True, help="Range start, ISO timestamp (inclusive)")
+    query_parser.add_argument("--end", required=True, help="Range end, ISO timestamp (exclusive)")
+    query_parser.add_argument("--granularity", type=int, default=None, help="Row resolution in seconds; the coarsest processed window that divides it is used")
+    query_parser.add_argument("--output", default="data", help="Directory holding the processed datasets")
+    query_parser.add_argument("--raw", action="store_true", help="Return raw samples from --input instead of processed windows")
+    query_parser.add_argument("--input", default="data/raw/metrics_collected.csv", help="Raw metrics CSV queried with --raw")
+    query_parser.add_argument("--rows", action="store_true", help="Also print the rows in range as CSV")
+    query_parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
+    compact_parser = commands.add_parser("compact", help="Roll processed windows up into the retention tiers of config.yaml and delete expired data")
+    compact_parser.add_argument("--output", default="data", help="Directory holding the processed datasets")
+    compact_parser.add_argument("--input", default="data/raw/metrics_collected.csv", help="Raw metrics CSV whose expired samples are deleted")
+    compact_parser.add_argument("--now", default=None, help="ISO timestamp used as the current time (default: now)")
+    compact_parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
     return parser.parse_args()
 
+# options whose default comes from config.yaml
+def apply_config_defaults(args, config):
+    if args.wide is None:
+        args.wide = config['collect']['schema'] == "wide"
+    if args.window_sizes is None:
+        args.window_sizes = config['windows']['default']
+    if args.format is None:
+        args.format = config['storage']['format']
+    if args.serve_port is None:
+        args.serve_port = config['serve']['port']
+
 def main():
     args = parse_args()
     setup_logging("DEBUG" if args.verbose else "INFO")
+    from pipeline import instrument, settings
+    config = settings.load()
+    apply_config_defaults(args, config)
+    cache = server = None
+    if args.serve and args.command is None:
+        from pipeline import serve
+        cache = serve.MetricsCache(config['serve']['recent_anomalies'])
+        server = serve.start_server(cache, config['serve']['host'], args.serve_port)
+    instrument.start_run(sys.argv, f"{args.output}/analytics/profile" if args.profile else None, on_record=cache.stages if cache else None)
+    status = "failed"
+    try:
+        run_command(args, config, cache)
+        status = "ok"
+    finally:
+        instrument.finish(args.report or f"{args.output}/analytics/run_report.json", status)
+    if server:
+        logging.info("Run finished, still serving its results (Ctrl-C to stop)")
+        serve.wait(server)
+
+def run_command(args, config, cache=None):
+    if args.command == "query":
+        run_query(args, config)
+        return
+    if args.command == "compact":
+        run_compact(args, config)
+        return
+    from pipeline import instrument
+    if args.live:
+        from pipeline import live
+        with instrument.stage("live"):
+            metrics = live.run_live(args.output, args.window_sizes, args.duration, args.interval, config['thresholds'],
+                                    raw_path="data/raw/metrics_collected.csv", fmt=args.format, wide=args.wide, top_n=config['collect']['top_n'],
+                                    percentiles=config['percentiles'], anomalies=config['anomaly'], cache=cache, ingestion=config['ingestion'], top_k=config['analytics']['top_k_peaks'])
+        instrument.record("live", rows_in=metrics['samples_accepted'] + metrics['samples_rejected'], rows_out=sum(metrics['windows_closed'].values()))
+        return
     if args.collect:
+        from pipeline import collect
         logging.info("Collecting system metrics from local machine")
-        input_path = collect.collect_metrics(
-            output_path="data/raw/metrics_collected.csv",
-            duration=args.duration,
-            interval=args.interval
-        )
+        with instrument.stage("collection"):
+            input_path = collect.collect_metrics(
+                output_path="data/raw/metrics_collected.csv",
+                duration=args.duration,
+                interval=args.interval,
+                flush_rows=config['collect']['flush_rows'],
+                flush_seconds=config['collect']['flush_seconds'],
+                wide=args.wide,
+                top_n=config['collect']['top_n']
+            )
     else:
         input_path = args.input
+    from pipeline import analytics, fleet, ingest, transform
+    if fleet.is_fleet_input(input_path):
+        run_fleet(args, input_path, config)
+        return
     try:
         logging.info("=== Starting Ingestion Stage ===")
-        df_valid = ingest.run_ingestion(input_path)
-        logging.info(f"Ingestion complete: {len(df_valid)} valid rows")
+        ordering = {"lateness": config['ingestion']['allowed_lateness_seconds'], "duplicates": config['ingestion']['duplicates']}
+        cursor = None
+        state = None
+        if args.incremental:
+            state = transform.load_state(args.output, args.window_sizes, input_path, args.format)
+            if state is None:
+                logging.info("No usable incremental state found, processing the whole input")
+            offset, high_water_mark = transform.resume_point(state)
+            with instrument.stage("ingestion"):
+                df_valid, offset = ingest.run_incremental_ingestion(input_path, offset, high_water_mark, **ordering)
+            cursor = {"input_path": input_path, "input_offset": offset, "high_water_mark": high_water_mark}
+            logging.info(f"Ingestion complete: {len(df_valid)} new valid rows")
+        elif args.chunk_rows:
+            # valid chunks are consumed lazily by the transformation stage (and timed with it)
+            df_valid = ingest.iter_ingestion(input_path, args.chunk_rows, **ordering)
+        else:
+            with instrument.stage("ingestion"):
+                df_valid = ingest.run_ingestion(input_path, **ordering)
+            logging.info(f"Ingestion complete: {len(df_valid)} valid rows")
 
         logging.info("=== Starting Transformation Stage ===")
-        processed_outputs = transform.run_transformation(df_valid, args.output, args.window_sizes)
+        # in a plain batch run hand the windows to analytics in memory instead of re-reading them
+        return_frames = not (args.incremental or args.chunk_rows)
+        with instrument.stage("transformation"):
+            processed_outputs = transform.run_transformation(df_valid, args.output, args.window_sizes, state=state, cursor=cursor, fmt=args.format, return_frames=return_frames, config=config)
         logging.info("Transformation complete")
 
         logging.info("=== Starting Analytics Stage ===")
-        analytics.run_analytics(processed_outputs, args.output, config['plots']['default'])
+        with instrument.stage("analytics"):
+            summaries = analytics.run_analytics(processed_outputs, args.output, config['plots']['default'] and not args.no_plots, args.workers, config['plots']['format'], config=config)
         logging.info("Analytics complete")
+        if cache:
+            from pipeline import serve
+            serve.publish_batch(cache, processed_outputs, summaries)
 
         logging.info("=== Pipeline Completed Successfully ===")
 
@@ -55,5 +160,52 @@ def main():
         logging.error(f"Pipeline failed: {e}")
         sys.exit(1)
 
+def run_query(args, config):
+    import json
+    from pipeline import instrument, query
+    try:
+        with instrument.stage("query"):
+            if args.raw:
+                rows = query.read_csv_range(args.input, args.start, args.end)
+            else:
+                result = query.query(args.output, args.start, args.end, args.granularity, config=config)
+                rows = result['rows']
+        instrument.record("query", rows_out=len(rows))
+        if args.raw:
+            print(json.dumps({"source": args.input, "rows": len(rows)}, indent=2))
+        else:
+            print(query.format_result(result))
+        if args.rows:
+            print(rows.to_csv(index=False, date_format="%Y-%m-%dT%H:%M:%S.%f" if args.raw else "%Y-%m-%dT%H:%M:%S"), end="")
+    except Exception as e:
+        logging.error(f"Query failed: {e}")
+        sys.exit(1)
+
+def run_compact(args, config):
+    import json
+    from pipeline import instrument, retention
+    try:
+        with instrument.stage("compaction"):
+            report = retention.compact(args.output, args.input, now=args.now, config=config)
+        print(json.dumps(report, indent=2))
+    except Exception as e:
+        logging.error(f"Compaction failed: {e}")
+        sys.exit(1)
+
+def run_fleet(args, input_path, config):
+    from pipeline import fleet, instrument
+    if args.incremental or args.chunk_rows:
+        logging.error("--incremental and --chunk-rows are not supported with a directory or glob input")
+        sys.exit(1)
+    try:
+        logging.info("=== Starting Fleet Ingestion and Transformation Stage ===")
+        with instrument.stage("fleet"):
+            fleet.run_fleet(input_path, args.output, args.window_sizes, fmt=args.format, workers=args.workers, percentiles=config['percentiles'], config=config)
+        logging.info("Fleet transformation complete")
+        logging.info("=== Pipeline Completed Successfully ===")
+    except Exception as e:
+        logging.error(f"Pipeline failed: {e}")
+        sys.exit(1)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,280 @@
+import math
+import numpy as np
+import pandas as pd
+from pipeline import schema, sketch
+
+NS_PER_SECOND = 1_000_000_000
+
+# every partial aggregate frame starts with these, followed by one "<reduction>_<column>" column per schema.partial_spec entry
+TIME_PARTIALS = ["window_start", "window_end", "sample_count"]
+REDUCTIONS = ["sum", "min", "max"]
+
+OUTPUT_COLUMNS = ["window_start", "window_end", "sample_count", "avg_cpu_total_percent", "min_cpu_idle_percent", "max_memory_usage_percent", "avg_disk_usage_percent", "memory_pressure_flag", "cpu_saturation_flag"]
+OUTPUT_DTYPES = {"window_start": "datetime64[ns]", "window_end": "datetime64[ns]", "sample_count": "int64", "avg_cpu_total_percent": "float64", "min_cpu_idle_percent": "float64", "max_memory_usage_percent": "float64", "avg_disk_usage_percent": "float64", "memory_pressure_flag": "bool", "cpu_saturation_flag": "bool"}
+
+"""
+Finest window every requested size is a multiple of, so raw samples only need to be
+aggregated once and every other window is rolled up from it.
+
+Returns:
+    int: base window size in seconds
+"""
+def base_window(window_sizes):
+    return math.gcd(*window_sizes)
+
+"""
+Aggregates raw samples into partial aggregates (min/max/sum/count) per window.
+Windows are aligned to the unix epoch and indexed by their start in epoch seconds.
+Which columns are kept comes from schema.partial_spec; all columns sharing a
+reduction are reduced in a single groupby call.
+
+Returns:
+    dataframe: partial aggregates indexed by window start
+"""
+def sample_partials(df, window):
+    timestamps = pd.to_datetime(df['timestamp'])
+    buckets = pd.Index(bucket_starts(timestamps, window), name="bucket")
+    spec = schema.partial_spec(tuple(df.columns))
+    grouped = df.assign(timestamp=timestamps).groupby(buckets, sort=True)
+    parts = [grouped['timestamp'].agg(['min', 'max', 'count']).set_axis(TIME_PARTIALS, axis=1)]
+    for reduction in REDUCTIONS:
+        columns = [column for r, column in spec if r == reduction]
+        if columns:
+            part = getattr(grouped[columns], reduction)()
+            parts.append(part.set_axis([f"{reduction}_{column}" for column in columns], axis=1))
+    return pd.concat(parts, axis=1)[partial_columns(spec)]
+
+"""
+Start of the epoch-aligned window every timestamp falls in.
+
+Returns:
+    ndarray: window starts in epoch seconds
+"""
+def bucket_starts(timestamps, window):
+    ns = pd.to_datetime(timestamps).to_numpy(dtype="datetime64[ns]").view("int64")
+    return ns // (window * NS_PER_SECOND) * window
+
+"""
+Column names of the partial aggregates for a schema.partial_spec.
+
+Returns:
+    list[str]: partial aggregate columns
+"""
+def partial_columns(spec=schema.BASE_PARTIALS):
+    return TIME_PARTIALS + [f"{reduction}_{column}" for reduction, column in spec]
+
+"""
+Rolls partial aggregates up into a coarser window that is a multiple of theirs.
+
+Returns:
+    dataframe: partial aggregates indexed by window start
+"""
+def rollup(partials, window):
+    buckets = partials.index.to_numpy() // window * window
+    return _reduce(partials.groupby(pd.Index(buckets, name="bucket"), sort=True), partials.columns)
+
+"""
+Combines partial aggregates, merging rows that describe the same window.
+
+Returns:
+    dataframe: partial aggregates indexed by window start
+"""
+def merge(*partials):
+    partials = [p for p in partials if p is not None and not p.empty]
+    if len(partials) == 1:
+        return partials[0]
+    combined = pd.concat(partials)
+    return _reduce(combined.groupby(level=0, sort=True), combined.columns)
+
+# how two partials of the same window combine: counts and sums add, min/max are kept as-is
+def _merge_reduction(column):
+    if column == "window_start":
+        return "min"
+    if column == "window_end":
+        return "max"
+    if column == "sample_count":
+        return "sum"
+    return column.split("_", 1)[0]
+
+def _reduce(grouped, columns):
+    columns = list(columns)
+    parts = []
+    for reduction in REDUCTIONS:
+        selected = [column for column in columns if _merge_reduction(column) == reduction]
+        if selected:
+            parts.append(getattr(grouped[selected], reduction)())
+    return pd.concat(parts, axis=1)[columns]
+
+"""
+Turns partial aggregates into the processed window rows written by the transformation stage.
+
+Returns:
+    dataframe: one row per window with OUTPUT_COLUMNS
+"""
+def finalize(partials, thresholds):
+    count = partials['sample_count']
+    df_out = pd.DataFrame({
+        "window_start": partials['window_start'],
+        "window_end": partials['window_end'],
+        "sample_count": count,
+        "avg_cpu_total_percent": ((partials['sum_cpu_user_percent'] + partials['sum_cpu_system_percent']) / count).round(1),
+        "min_cpu_idle_percent": partials['min_cpu_idle_percent'],
+        "max_memory_usage_percent": partials['max_memory_used_percent'].round(1),
+        "avg_disk_usage_percent": (partials['sum_disk_used_percent'] / count).round(1),
+    }, columns=OUTPUT_COLUMNS)
+    df_out['memory_pressure_flag'] = df_out['max_memory_usage_percent'] > thresholds['memory_pressure_percent']
+    df_out['cpu_saturation_flag'] = df_out['min_cpu_idle_percent'] < thresholds['cpu_saturation_percent']
+    df_out = df_out.astype(OUTPUT_DTYPES).reset_index(drop=True)
+
+    # wide schema columns: sums become averages, min/max are kept as-is; percentiles
+    # (p{q}_ columns joined from the window's sketch) pass through unchanged
+    base = set(partial_columns())
+    extra = [column for column in partials.columns if column not in base]
+    if not extra:
+        return df_out
+    values = partials[extra].to_numpy(dtype=float, copy=True)
+    is_sum = np.array([column.startswith("sum_") for column in extra])
+    values[:, is_sum] = values[:, is_sum] / count.to_numpy(dtype=float)[:, None]
+    names = ["avg_" + column[len("sum_"):] if column.startswith("sum_") else column for column in extra]
+    return pd.concat([df_out, pd.DataFrame(values.round(2), columns=names)], axis=1)
+
+"""
+Orders the windows so each is rolled up from the largest smaller window that divides it.
+
+Returns:
+    list[tuple[int, int]]: (window, source window) pairs, sources always come first
+"""
+def rollup_plan(base, window_sizes):
+    plan = []
+    done = [base]
+    for window in sorted(set(window_sizes)):
+        if window == base:
+            continue
+        plan.append((window, max(w for w in done if window % w == 0)))
+        done.append(window)
+    return plan
+
+"""
+Streaming aggregation of every window size over chunks of raw samples.
+
+Each chunk is reduced once into the base window and rolled up into the other sizes.
+Windows that may still receive samples are kept open as partial aggregates and merged
+with the next chunk; add() returns the partials of windows the chunk closed. A window
+closes once the watermark, the newest sample seen minus lateness seconds, has passed its
+end. With the default lateness of 0 that is the last window of each size; with a
+lateness, samples up to lateness seconds late (see ingest.validate_metrics) still land
+in an open window instead of one already closed.
+
+With a percentiles config (config.yaml percentiles section) a quantile sketch is kept
+per window alongside the partials and rolled up the same way (see pipeline.sketch).
+The partials of every closed window then carry its p{q}_ percentile columns, and the
+sketches of closed windows are collected until take_sketches() hands them out.
+"""
+class WindowAggregator:
+    def __init__(self, window_sizes, percentiles=None, lateness=0):
+        self.window_sizes = list(window_sizes)
+        self.lateness = lateness
+        self.base = base_window(self.window_sizes)
+        self.plan = rollup_plan(self.base, self.window_sizes)
+        self.open_partials = {window: None for window in self.window_sizes}
+        self.percentiles = percentiles
+        self.open_sketches = {window: None for window in self.window_sizes}
+        self.closed_sketches = {window: [] for window in self.window_sizes}
+
+    """
+    Returns:
+        dict[int, dataframe]: partial aggregates of the windows closed by this chunk
+    """
+    def add(self, df):
+        if df.empty:
+            return {}
+        computed = {self.base: sample_partials(df, self.base)}
+        for window, source in self.plan:
+            computed[window] = rollup(computed[source], window)
+        sketches = self._sketches(df) if self.percentiles else {}
+        closed = {}
+        for window in self.window_sizes:
+            partials = merge(self.open_partials[window], computed[window])
+            is_open = self._is_open(partials, window)
+            self.open_partials[window] = partials[is_open]
+            closed[window] = partials[~is_open]
+            if self.percentiles:
+                window_sketch = sketch.merge(self.open_sketches[window], sketches[window])
+                sketch_open = np.isin(window_sketch['bucket'].to_numpy(), partials.index[is_open])
+                self.open_sketches[window] = window_sketch[sketch_open]
+                closed[window] = self._close_sketch(window, closed[window], window_sketch[~sketch_open])
+        return closed
+
+    """
+    Closes every open window that ends at or before timestamp, for callers that know no
+    more samples can arrive for it (e.g. a live stream whose clock has moved on).
+
+    Returns:
+        dict[int, dataframe]: partial aggregates of the windows closed
+    """
+    def close_until(self, timestamp):
+        seconds = pd.Timestamp(timestamp).as_unit("ns").value / NS_PER_SECOND
+        closed = {}
+        for window in self.window_sizes:
+            partials = self.open_partials[window]
+            if partials is None or partials.empty:
+                continue
+            ended = partials.index.to_numpy() + window <= seconds
+            if not ended.any():
+                continue
+            window_sketch = self.open_sketches[window]
+            if window_sketch is not None:
+                sketch_ended = np.isin(window_sketch['bucket'].to_numpy(), partials.index[ended])
+                self.open_sketches[window] = window_sketch[~sketch_ended]
+                window_sketch = window_sketch[sketch_ended]
+            closed[window] = self._close_sketch(window, partials[ended], window_sketch)
+            self.open_partials[window] = partials[~ended]
+        return closed
+
+    """
+    Returns:
+        dict[int, dataframe]: partial aggregates of the open windows (empty if none), which are then reset
+    """
+    def flush(self):
+        flushed = {}
+        for window in self.window_sizes:
+            partials = self.open_partials[window]
+            flushed[window] = partials if partials is not None else pd.DataFrame(columns=partial_columns())
+            if self.percentiles:
+                flushed[window] = self._close_sketch(window, flushed[window], self.open_sketches[window])
+            self.open_partials[window] = None
+            self.open_sketches[window] = None
+        return flushed
+
+    """
+    Returns:
+        dict[int, dataframe]: sketches of the windows closed since the last call
+    """
+    def take_sketches(self):
+        taken = {window: sketch.merge(*sketches) for window, sketches in self.closed_sketches.items()}
+        self.closed_sketches = {window: [] for window in self.window_sizes}
+        return taken
+
+    # windows ending after the watermark may still receive samples
+    def _is_open(self, partials, window):
+        watermark = partials['window_end'].max().value - round(self.lateness * NS_PER_SECOND)
+        return (partials.index.to_numpy() + window) * NS_PER_SECOND > watermark
+
+    def _sketches(self, df):
+        accuracy = self.percentiles['relative_accuracy']
+        exact = sketch.is_exact(self.base, self.percentiles)
+        computed = {self.base: sketch.sample_sketches(df, bucket_starts(df['timestamp'], self.base), exact, accuracy)}
+        for window, source in self.plan:
+            source_sketch = computed[source]
+            if sketch.is_exact(source, self.percentiles) and not sketch.is_exact(window, self.percentiles):
+                source_sketch = sketch.to_bins(source_sketch, accuracy)
+            computed[window] = sketch.rollup(source_sketch, window)
+        return computed
+
+    def _close_sketch(self, window, partials, window_sketch):
+        if not self.percentiles:
+            return partials
+        window_sketch = window_sketch if window_sketch is not None else sketch.empty()
+        self.closed_sketches[window].append(window_sketch)
+        quantiles = sketch.quantiles(window_sketch, self.percentiles['quantiles'], sketch.is_exact(window, self.percentiles), self.percentiles['relative_accuracy'])
+        return partials.join(quantiles, how="left")
@@ -1,69 +1,169 @@
 import pandas as pd
 import json
 import logging
-import yaml
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from pipeline import anomaly, instrument, settings, storage, kernels, sketch
 
-with open("config.yaml", "r") as f:
-    config = yaml.safe_load(f)
+"""
+Summarizes each window size and writes analytics_summary_{window}s.json.
 
-def run_analytics(processed_data, output, plots=True):
-    fig, (cpu, mem) = plt.subplots(2, 1)
-    for window, csv_path in processed_data.items():
-        df = pd.read_csv(csv_path)
-        
-        total_windows = len(df)
-        memory_pressure_windows = df['memory_pressure_flag'].sum()
-        cpu_saturation_windows = int(df['cpu_saturation_flag'].sum())
-        percent_memory_pressure = ((memory_pressure_windows / total_windows) * 100).round(2) if total_windows > 0 else 0
-        avg_cpu = df['avg_cpu_total_percent'].mean().round(2)
-        max_cpu = df['avg_cpu_total_percent'].max()
-        peak_memory_usage = df['max_memory_usage_percent'].max()
-        longest_memory_pressure_streak = 0
-        current_streak = 0
-        for flag in df['memory_pressure_flag']:
-            if flag:
-                current_streak += 1
-                if current_streak > longest_memory_pressure_streak:
-                    longest_memory_pressure_streak = current_streak
-            else:
-                current_streak = 0
-
-        logging.info(f"{window}-second windows: Total={total_windows}, Percent Memory Pressure={percent_memory_pressure}, CPU Saturation={cpu_saturation_windows}, Max CPU={max_cpu}, Avg CPU={avg_cpu}, Longest Memory Pressure Streak={longest_memory_pressure_streak}, Peak Memory Usage={peak_memory_usage}")
-        if percent_memory_pressure == 0:
-            logging.info(f"Memory pressure threshold: > {config['thresholds']['memory_pressure_percent']}%")
-        if cpu_saturation_windows == 0:
-            logging.info(f"CPU saturation threshold: cpu_idle < {config['thresholds']['cpu_saturation_percent']}%")
-        logging.info(f"Time range with highest CPU usage in {window}s windows: {df.loc[df['avg_cpu_total_percent'].idxmax()]['window_start']} to {df.loc[df['avg_cpu_total_percent'].idxmax()]['window_end']}")
-        
-        analytics_summary = {
-            "window_size_seconds": window,
-            "total_windows": total_windows,
-            "percent_memory_pressure": percent_memory_pressure,
-            "cpu_saturation_count": cpu_saturation_windows,
-            "max_cpu_total_percent": max_cpu,
-            "avg_cpu_total_percent": avg_cpu,
-            "longest_memory_pressure_streak": longest_memory_pressure_streak,
-            "peak_memory_used_percent": peak_memory_usage,
-            "peak_cpu_time_range": {
-                "start": df.loc[df['avg_cpu_total_percent'].idxmax()]['window_start'],
-                "end": df.loc[df['avg_cpu_total_percent'].idxmax()]['window_end']
-            }
-        }
+processed_data maps window size to a processed dataset: a CSV path, a columnar
+dataset path or an in-memory dataframe returned by run_transformation(return_frames=True).
+
+With workers > 1 every window's summary and plot is computed in a process pool. Plots
+are rendered headless (matplotlib Agg backend) to {output}/analytics/metrics_{window}s.{plot_format};
+matplotlib is not imported at all when plots are off.
+
+Whole-run percentiles of CPU and memory come from merging the quantile sketches the
+transformation stage wrote next to each processed dataset (looked up in {output}/processed
+for in-memory frames); they are null when no sketch is found.
+
+Anomaly intervals of the metrics in the anomaly section of config.yaml (EWMA, hour-of-day
+and CUSUM baselines per window size, see pipeline.anomaly) are listed under anomalies.
+
+config is the loaded configuration, by default settings.load(); it is handed to the
+workers so they do not parse config.yaml again.
+
+Returns:
+    dict[int, dict]: analytics summary per window size
+"""
+def run_analytics(processed_data, output, plots=True, workers=1, plot_format="png", config=None):
+    config = config or settings.load()
+    if workers > 1 and len(processed_data) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            summary_jobs = {window: pool.submit(summarize_window, window, source, _sketch_source(window, source, output), config) for window, source in processed_data.items()}
+            plot_jobs = [pool.submit(plot_window, window, source, output, plot_format) for window, source in processed_data.items()] if plots else []
+            summaries = {window: job.result() for window, job in summary_jobs.items()}
+            for job in plot_jobs:
+                job.result()
+    else:
+        summaries = {}
+        for window, source in processed_data.items():
+            summaries[window] = summarize_window(window, source, _sketch_source(window, source, output), config)
+            if plots:
+                plot_window(window, source, output, plot_format)
+
+    for window, analytics_summary in summaries.items():
+        _log_summary(window, analytics_summary, config['thresholds'])
         with open(output+"/analytics/analytics_summary_"+str(window)+"s.json", "w") as f:
             json.dump(analytics_summary, f)
+    instrument.record("analytics", rows_in=sum(int(s['total_windows']) for s in summaries.values()), rows_out=len(summaries))
+    return summaries
+
+"""
+Computes the analytics summary of one window size.
+
+Returns:
+    dict: analytics summary
+"""
+def summarize_window(window, source, sketch_source=None, config=None):
+    config = config or settings.load()
+    df = storage.load(source)
+
+    total_windows = len(df)
+    memory_pressure_windows = df['memory_pressure_flag'].sum()
+    cpu_saturation_windows = int(df['cpu_saturation_flag'].sum())
+    percent_memory_pressure = ((memory_pressure_windows / total_windows) * 100).round(2) if total_windows > 0 else 0
+    # an empty dataset (every sample rejected) has no statistics, only zero counts
+    avg_cpu = df['avg_cpu_total_percent'].mean().round(2) if total_windows > 0 else None
+    max_cpu = df['avg_cpu_total_percent'].max() if total_windows > 0 else None
+    peak_memory_usage = df['max_memory_usage_percent'].max() if total_windows > 0 else None
+    memory_pressure_streaks = kernels.streak_summary(df['memory_pressure_flag'], df['window_start'], df['window_end'])
+    cpu_saturation_streaks = kernels.streak_summary(df['cpu_saturation_flag'], df['window_start'], df['window_end'])
+    window_start = df['window_start'].to_numpy()
+    window_end = df['window_end'].to_numpy()
+    cpu_values = df['avg_cpu_total_percent'].to_numpy()
+    top_cpu_peaks = [
+        {"start": kernels.format_time(window_start[pos]), "end": kernels.format_time(window_end[pos]), "value": float(cpu_values[pos])}
+        for pos in kernels.top_k_peaks(cpu_values, config['analytics']['top_k_peaks'])
+    ]
+
+    return {
+        "window_size_seconds": window,
+        "total_windows": total_windows,
+        "percent_memory_pressure": percent_memory_pressure,
+        "cpu_saturation_count": cpu_saturation_windows,
+        "max_cpu_total_percent": max_cpu,
+        "avg_cpu_total_percent": avg_cpu,
+        "longest_memory_pressure_streak": memory_pressure_streaks['longest'],
+        "longest_cpu_saturation_streak": cpu_saturation_streaks['longest'],
+        "peak_memory_used_percent": peak_memory_usage,
+        "peak_cpu_time_range": {
+            "start": top_cpu_peaks[0]['start'] if top_cpu_peaks else None,
+            "end": top_cpu_peaks[0]['end'] if top_cpu_peaks else None
+        },
+        # nested lists live one level down so the summary still loads with pd.read_json
+        "streaks": {
+            "memory_pressure": memory_pressure_streaks['streaks'],
+            "cpu_saturation": cpu_saturation_streaks['streaks']
+        },
+        "peaks": {
+            "avg_cpu_total_percent": top_cpu_peaks
+        },
+        "percentiles": summarize_percentiles(window, sketch_source, config['percentiles']),
+        "anomalies": {
+            "intervals": anomaly.detect_intervals(df, config['anomaly'])
+        }
+    }
+
+"""
+Percentiles of every sample of the run, merged from the per-window sketches.
+
+Returns:
+    dict[str, dict]: metric -> {p{q}: value}, values are None without a sketch
+"""
+def summarize_percentiles(window, sketch_source, percentiles):
+    window_sketch = storage.load(sketch_source) if sketch_source is not None else sketch.empty()
+    return sketch.percentile_summary(window_sketch, percentiles['quantiles'], sketch.is_exact(window, percentiles), percentiles['relative_accuracy'])
+
+"""
+Renders the CPU and memory plot of one window size to a file with the headless Agg backend.
+
+Returns:
+    str: path of the written plot
+"""
+def plot_window(window, source, output, plot_format="png"):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    df = storage.load(source, ['window_start', 'avg_cpu_total_percent', 'max_memory_usage_percent'])
+    fig, (cpu, mem) = plt.subplots(2, 1)
+    cpu.plot(pd.to_datetime(df['window_start']), df['avg_cpu_total_percent'], label=str(window)+'s Avg CPU %')
+    mem.plot(pd.to_datetime(df['window_start']), df['max_memory_usage_percent'], label=str(window)+'s Max Memory %')
+    cpu.set_xlabel('Time')
+    cpu.set_ylabel('CPU Usage (%)')
+    cpu.set_title('CPU Usage Over Time')
+    cpu.legend()
+    mem.set_xlabel('Time')
+    mem.set_ylabel('Max Memory (%)')
+    mem.set_title('Max Memory Over Time')
+    mem.legend()
+    fig.tight_layout()
+    plot_path = output+"/analytics/metrics_"+str(window)+"s."+plot_format
+    fig.savefig(plot_path)
+    plt.close(fig)
+    return plot_path
+
+def _sketch_source(window, source, output):
+    if isinstance(source, str):
+        path = storage.sketch_path(source)
+        return path if storage.exists(path) else None
+    for fmt in storage.FORMATS:
+        path = storage.sketch_path(storage.output_path(output, window, fmt))
+        if storage.exists(path):
+            return path
+    return None
 
-        if plots:
-            cpu.plot(pd.to_datetime(df['window_start']), df['avg_cpu_total_percent'], label=str(window)+'s Avg CPU %')
-            mem.plot(pd.to_datetime(df['window_start']), df['max_memory_usage_percent'], label=str(window)+'s Max Memory %')
-
-    if plots:
-        cpu.set_xlabel('Time')
-        cpu.set_ylabel('CPU Usage (%)')
-        cpu.set_title('CPU Usage Over Time')
-        cpu.legend()
-        mem.set_xlabel('Time')
-        mem.set_ylabel('Max Memory (%)')
-        mem.set_title('Max Memory Over Time')
-        mem.legend()
-        plt.show()
\ No newline at end of file
+def _log_summary(window, analytics_summary, thresholds):
+    logging.info(f"{window}-second windows: Total={analytics_summary['total_windows']}, Percent Memory Pressure={analytics_summary['percent_memory_pressure']}, CPU Saturation={analytics_summary['cpu_saturation_count']}, Max CPU={analytics_summary['max_cpu_total_percent']}, Avg CPU={analytics_summary['avg_cpu_total_percent']}, Longest Memory Pressure Streak={analytics_summary['longest_memory_pressure_streak']}, Peak Memory Usage={analytics_summary['peak_memory_used_percent']}")
+    if analytics_summary['percent_memory_pressure'] == 0:
+        logging.info(f"Memory pressure threshold: > {thresholds['memory_pressure_percent']}%")
+    if analytics_summary['cpu_saturation_count'] == 0:
+        logging.info(f"CPU saturation threshold: cpu_idle < {thresholds['cpu_saturation_percent']}%")
+    cpu_percentiles = analytics_summary['percentiles']['cpu_total_percent']
+    if any(value is not None for value in cpu_percentiles.values()):
+        logging.info(f"CPU total percent percentiles in {window}s windows: " + ", ".join(f"{label}={value}" for label, value in cpu_percentiles.items()))
+    logging.info(f"Time range with highest CPU usage in {window}s windows: {analytics_summary['peak_cpu_time_range']['start']} to {analytics_summary['peak_cpu_time_range']['end']}")
+    for interval in analytics_summary['anomalies']['intervals']:
+        logging.warning(f"Anomaly in {window}s windows: {interval['metric']} from {interval['start']} to {interval['end']} ({', '.join(interval['detectors'])}), peak {interval['peak_value']}")
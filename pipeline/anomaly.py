@@ -0,0 +1,297 @@
+"""
+Anomaly detection over processed windows.
+
+Every metric in the anomaly section of config.yaml gets rolling baselines, kept per
+window size (each processed dataset is scored on its own):
+
+ewma       exponentially weighted mean and variance of the previous windows. A window
+           further than z_threshold standard deviations from them is anomalous, unless
+           the seasonal baseline finds it normal for its hour of day (a daily ramp).
+seasonal   hour-of-day profile: mean and variance of the windows in the same hour on
+           previous days, so a busy hour is compared with the same hour yesterday
+           rather than with the quiet hour before it. Hours and days are those of the
+           sample timestamps, which are naive local time, not UTC.
+cusum      two-sided CUSUM change-point detection on the window scores, which adds up
+           small persistent shifts that never cross z_threshold in a single window (a
+           regression). When a sum crosses cusum_threshold it is reset, and every
+           window since the sum last left zero (the estimated change point) is flagged.
+
+A window's score is its seasonal z-score, or its EWMA z-score while its hour has no
+seasonal baseline yet. Windows flagged by any detector are merged into anomaly
+intervals. Scores only use windows before the one scored, so detect_intervals
+(vectorized over whole columns) and AnomalyTracker (O(1) work per window, for live
+data) find the same intervals.
+"""
+import math
+import numpy as np
+import pandas as pd
+from pipeline import kernels
+
+DETECTORS = ["ewma", "seasonal", "cusum"]
+
+NS_PER_HOUR = 3600 * 1_000_000_000
+HOURS_PER_DAY = 24
+
+"""
+Scores every window of one metric against the baselines of the windows before it.
+Windows with a null value are not scored and do not update the baselines.
+
+Returns:
+    dataframe: one row per window with the EWMA z-score (z), seasonal z-score
+    (seasonal_z), score and one boolean flag column per detector
+"""
+def score(values, window_start, settings):
+    values = pd.Series(np.asarray(values, dtype=float))
+    valid = values.notna().to_numpy()
+    x = values[valid].reset_index(drop=True)
+    min_std = settings['min_std']
+    threshold = settings['z_threshold']
+
+    # baseline before each window: EWMA state after the previous valid window
+    ewm = x.ewm(alpha=settings['ewma_alpha'], adjust=False)
+    mean = ewm.mean().shift(1)
+    std = np.sqrt(ewm.var(bias=True).shift(1)).clip(lower=min_std)
+    z = ((x - mean) / std).where(np.arange(len(x)) >= settings['warmup_windows'])
+
+    # seasonal baseline: sums of the same hour on previous days (the current day excluded)
+    ns = pd.to_datetime(pd.Series(np.asarray(window_start)[valid])).to_numpy(dtype="datetime64[ns]").view("int64")
+    hour = ns // NS_PER_HOUR % HOURS_PER_DAY
+    day = ns // (NS_PER_HOUR * HOURS_PER_DAY)
+    sums = pd.DataFrame({"hour": hour, "day": day, "count": 1, "sum": x, "sumsq": x * x}).groupby(["hour", "day"], sort=True).sum()
+    before = (sums.groupby(level="hour").cumsum() - sums).reindex(pd.MultiIndex.from_arrays([hour, day])).reset_index(drop=True)
+    seasonal_mean = before['sum'] / before['count']
+    seasonal_std = np.sqrt((before['sumsq'] / before['count'] - seasonal_mean ** 2).clip(lower=0)).clip(lower=min_std)
+    seasonal_z = ((x - seasonal_mean) / seasonal_std).where(before['count'] >= settings['warmup_windows'])
+    window_score = seasonal_z.fillna(z)
+
+    scores = pd.DataFrame({
+        "z": z,
+        "seasonal_z": seasonal_z,
+        "score": window_score,
+        "ewma": (z.abs() > threshold) & ~(seasonal_z.abs() <= threshold),
+        "seasonal": seasonal_z.abs() > threshold,
+    })
+    scores.index = np.flatnonzero(valid)
+    scores = scores.reindex(range(len(values)))
+    scores[["ewma", "seasonal"]] = scores[["ewma", "seasonal"]].fillna(False).astype(bool)
+
+    cusum = np.zeros(len(values), dtype=bool)
+    steps = window_score.fillna(0).to_numpy()
+    positions = np.flatnonzero(valid)
+    for sign in (1, -1):
+        for start, alarm in _cusum_alarms(sign * steps - settings['cusum_drift'], settings['cusum_threshold']):
+            cusum[positions[start]:positions[alarm] + 1] = True
+    scores['cusum'] = cusum
+    return scores
+
+"""
+Anomaly intervals of every configured metric of a processed dataset.
+
+Returns:
+    list[dict]: one entry (metric, start, end, windows, detectors, peak_value, peak_score)
+    per run of consecutive flagged windows, ordered by metric then time
+"""
+def detect_intervals(df, settings):
+    intervals = []
+    window_start = df['window_start'].to_numpy()
+    window_end = df['window_end'].to_numpy()
+    for metric in settings['metrics']:
+        if metric not in df:
+            continue
+        values = df[metric].to_numpy(dtype=float)
+        scores = score(values, window_start, settings)
+        flags = scores[DETECTORS].to_numpy()
+        window_scores = scores['score'].to_numpy()
+        starts, lengths = kernels.find_streaks(flags.any(axis=1))
+        for start, length in zip(starts, lengths):
+            span = slice(start, start + length)
+            peak = start + _peak(np.abs(window_scores[span]))
+            intervals.append(_interval(
+                metric, window_start[start], window_end[start + length - 1], int(length),
+                [name for name, hit in zip(DETECTORS, flags[span].any(axis=0)) if hit],
+                values[peak], window_scores[peak],
+            ))
+    return intervals
+
+"""
+Online anomaly detection for one metric: feed one window at a time with update(). Only
+the EWMA state, 24 hour-of-day slots, the two CUSUM sums and the flagged stretches a
+running CUSUM sum may still join are kept. update() (and close(), at the end) return
+the intervals that can no longer change.
+"""
+class AnomalyTracker:
+    def __init__(self, metric, settings):
+        self.metric = metric
+        self.settings = settings
+        self.position = 0
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        # per hour of day: [count, sum, sum of squares] of previous days and of the current day
+        self.history = [[0, 0.0, 0.0] for _ in range(HOURS_PER_DAY)]
+        self.today = [[0, 0.0, 0.0] for _ in range(HOURS_PER_DAY)]
+        self.day = None
+        # per direction: sum, first window since it left zero and its highest scoring window
+        self.cusum = [{"sum": 0.0, "start": None, "peak": None} for _ in range(2)]
+        self.pending = []
+
+    """
+    Returns:
+        list[dict]: anomaly intervals finished by this window (see detect_intervals)
+    """
+    def update(self, value, window_start=None, window_end=None):
+        position = self.position
+        self.position += 1
+        if value is None or math.isnan(value):
+            return self._settled(position)
+        settings = self.settings
+        threshold = settings['z_threshold']
+        z = math.nan
+        if self.count >= settings['warmup_windows']:
+            z = (value - self.mean) / max(math.sqrt(self.var), settings['min_std'])
+        seasonal_z = self._seasonal(value, pd.Timestamp(window_start).as_unit("ns").value)
+        window_score = seasonal_z if not math.isnan(seasonal_z) else z
+        if self.count == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            self.mean += settings['ewma_alpha'] * diff
+            self.var = (1 - settings['ewma_alpha']) * (self.var + settings['ewma_alpha'] * diff * diff)
+        self.count += 1
+
+        # (position, window start, value, score) of this window
+        window = (position, window_start, value, window_score)
+        flagged = []
+        step = 0.0 if math.isnan(window_score) else window_score
+        for sign, side in zip((1, -1), self.cusum):
+            side['sum'] = max(0.0, side['sum'] + sign * step - settings['cusum_drift'])
+            if side['sum'] == 0:
+                side['start'] = None
+                continue
+            if side['start'] is None:
+                side['start'] = window
+                side['peak'] = window
+            side['peak'] = _higher(side['peak'], window)
+            if side['sum'] > settings['cusum_threshold']:
+                flagged.append((side['start'], side['peak'], "cusum"))
+                side['sum'] = 0.0
+                side['start'] = None
+        if abs(z) > threshold and not abs(seasonal_z) <= threshold:
+            flagged.append((window, window, "ewma"))
+        if abs(seasonal_z) > threshold:
+            flagged.append((window, window, "seasonal"))
+        for start, peak, detector in sorted(flagged, key=lambda item: item[0][0]):
+            self._flag(start, position, window_end, peak, detector)
+        return self._settled(position)
+
+    """
+    Returns:
+        list[dict]: the intervals still pending
+    """
+    def close(self):
+        finished = [self._report(segment) for segment in self.pending]
+        self.pending = []
+        return finished
+
+    # flags the windows from start to end, joining the stretches they touch
+    def _flag(self, start, end, end_time, peak, detector):
+        segment = {"start": start, "end": end, "end_time": end_time, "detectors": {detector}, "peak": peak}
+        while self.pending and self.pending[-1]['end'] >= start[0] - 1:
+            joined = self.pending.pop()
+            if joined['start'][0] < segment['start'][0]:
+                segment['start'] = joined['start']
+            segment['detectors'] |= joined['detectors']
+            segment['peak'] = _higher(joined['peak'], segment['peak'])
+        self.pending.append(segment)
+
+    # a stretch is finished once this window did not extend it and no running CUSUM sum started next to it
+    def _settled(self, position):
+        finished = []
+        while self.pending:
+            segment = self.pending[0]
+            if segment['end'] >= position or any(side['start'] is not None and side['start'][0] <= segment['end'] + 1 for side in self.cusum):
+                break
+            finished.append(self._report(self.pending.pop(0)))
+        return finished
+
+    def _report(self, segment):
+        _, _, peak_value, peak_score = segment['peak']
+        return _interval(self.metric, segment['start'][1], segment['end_time'], segment['end'] - segment['start'][0] + 1,
+                         [name for name in DETECTORS if name in segment['detectors']], peak_value, peak_score)
+
+    def _seasonal(self, value, ns):
+        day = ns // (NS_PER_HOUR * HOURS_PER_DAY)
+        if day != self.day:
+            # a new day: today's windows become history for the days after it
+            for slot, current in zip(self.history, self.today):
+                for i in range(3):
+                    slot[i] += current[i]
+                    current[i] = 0
+            self.day = day
+        hour = ns // NS_PER_HOUR % HOURS_PER_DAY
+        count, total, total_squares = self.history[hour]
+        seasonal_z = math.nan
+        if count >= self.settings['warmup_windows']:
+            mean = total / count
+            std = max(math.sqrt(max(total_squares / count - mean * mean, 0.0)), self.settings['min_std'])
+            seasonal_z = (value - mean) / std
+        current = self.today[hour]
+        current[0] += 1
+        current[1] += value
+        current[2] += value * value
+        return seasonal_z
+
+"""
+Runs one direction of the CUSUM: S_t = max(0, S_(t-1) + step_t), reset to 0 after an
+alarm (S_t > threshold). Between alarms S_t equals C_t - min(0, C_1..C_t) with C the
+cumulative sum of the steps, so the next alarm is searched in vectorized blocks that
+double in size until one contains it.
+
+Returns:
+    list[tuple[int, int]]: (first window since the sum left zero, alarm window) per alarm
+"""
+def _cusum_alarms(steps, threshold):
+    alarms = []
+    begin = 0
+    size = 256
+    while begin < len(steps):
+        end = min(begin + size, len(steps))
+        cumulative = np.cumsum(steps[begin:end])
+        sums = cumulative - np.minimum(np.minimum.accumulate(cumulative), 0)
+        crossed = np.flatnonzero(sums > threshold)
+        if not len(crossed):
+            if end == len(steps):
+                break
+            size *= 2
+            continue
+        alarm = crossed[0]
+        zeros = np.flatnonzero(sums[:alarm] <= 0)
+        alarms.append((begin + (zeros[-1] + 1 if len(zeros) else 0), begin + alarm))
+        begin += alarm + 1
+        size = 256
+    return alarms
+
+# the window with the larger absolute score, the earlier one on a tie (unscored windows lose)
+def _higher(current, candidate):
+    def key(window):
+        return -1.0 if math.isnan(window[3]) else abs(window[3])
+    if key(candidate) > key(current) or (key(candidate) == key(current) and candidate[0] < current[0]):
+        return candidate
+    return current
+
+# position of the largest absolute score in an interval, the first window when none is scored
+def _peak(abs_scores):
+    if np.isnan(abs_scores).all():
+        return 0
+    return int(np.nanargmax(abs_scores))
+
+def _interval(metric, start, end, windows, detectors, peak_value, peak_score):
+    return {
+        "metric": metric,
+        "start": kernels.format_time(start),
+        "end": kernels.format_time(end),
+        "windows": int(windows),
+        "detectors": detectors,
+        "peak_value": round(float(peak_value), 2),
+        "peak_score": None if math.isnan(peak_score) else round(float(peak_score), 2),
+    }
@@ -1,26 +1,166 @@
-import psutil as ps
 import csv
+import logging
+import re
+import time
 from datetime import datetime
 
+HEADER = ["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"]
+
 """
 Collect system metrics and write to CSV.
 
+Samples are taken every `interval` seconds (fractional intervals allowed) for `duration`
+seconds in total, scheduled against a monotonic clock so timing errors do not
+accumulate. Rows are buffered and flushed every flush_rows rows or flush_seconds seconds.
+The collector's own CPU time is measured and logged as a percentage of one core.
+
 Returns:
     str: path to generated CSV file
 """
-def collect_metrics(output_path, duration, interval):
-    with open(output_path, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"])  # Add headers
-
-    for i in range(duration):
-        cpu_times = ps.cpu_times_percent(interval=interval)
-        cpu_user_percent = cpu_times.user
-        cpu_system_percent = cpu_times.system
-        cpu_idle_percent = cpu_times.idle
-        memory_usage = ps.virtual_memory()
-        disc_usage = ps.disk_usage('/')
-        with open(output_path, "a", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow([datetime.now().replace(microsecond=0).isoformat(), cpu_user_percent, cpu_system_percent, cpu_idle_percent, memory_usage.percent, disc_usage.percent])
+def collect_metrics(output_path, duration, interval, flush_rows=100, flush_seconds=5.0, wide=False, top_n=5):
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    header, sample = make_sampler(wide, top_n)
+    with BufferedCsvWriter(output_path, flush_rows, flush_seconds) as writer:
+        writer.writerow(header)
+        for row in iter_samples(duration, interval, sample):
+            writer.writerow(row)
+    wall_time = time.monotonic() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    overhead = (cpu_time / wall_time * 100) if wall_time > 0 else 0.0
+    logging.info(f"Collector overhead: {overhead:.2f}% of one core ({cpu_time:.3f}s CPU over {wall_time:.1f}s, {writer.rows - 1} samples, {writer.flushes} flushes)")
     return output_path
+
+"""
+Yields one metrics row per tick for `duration` seconds. Ticks are scheduled at
+start + n * interval on the monotonic clock; if the collector falls more than one
+interval behind, the missed ticks are skipped (and logged) instead of bursting.
+CPU percentages cover the time since the previous sample, so sampling never blocks.
+
+Returns:
+    iterator[list]: one row per sample, matching the header from make_sampler
+"""
+def iter_samples(duration, interval, sample=None):
+    if sample is None:
+        header, sample = make_sampler()
+    num_ticks = max(1, int(round(duration / interval)))
+    start = time.monotonic()
+    tick = 1
+    while tick <= num_ticks:
+        delay = start + tick * interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        elif -delay > interval:
+            missed = int(-delay // interval)
+            logging.warning(f"Collector fell behind, skipping {missed} samples")
+            tick += missed
+            if tick > num_ticks:
+                break
+        yield sample()
+        tick += 1
+
+"""
+Builds the sampling function for the basic six-column schema or, with wide, the
+wide schema declared in pipeline.schema: the basic columns plus per-CPU times, usage
+of every mounted disk, disk/network I/O rates and the top_n processes by RSS and by CPU.
+The set of CPUs and mounts is fixed when the sampler is built so every row matches
+the header. psutil is imported here, so modules that only need HEADER do not load it.
+
+Returns:
+    list[str]: CSV header
+    callable: returns one row per call
+"""
+def make_sampler(wide=False, top_n=5):
+    import psutil as ps
+    ps.cpu_times_percent(interval=None)  # first call only sets the reference point
+    if not wide:
+        def sample():
+            cpu_times = ps.cpu_times_percent(interval=None)
+            memory_usage = ps.virtual_memory()
+            disc_usage = ps.disk_usage('/')
+            return [datetime.now().isoformat(timespec="milliseconds"), cpu_times.user, cpu_times.system, cpu_times.idle, memory_usage.percent, disc_usage.percent]
+        return list(HEADER), sample
+
+    num_cpus = len(ps.cpu_times_percent(interval=None, percpu=True))
+    mounts = [partition.mountpoint for partition in ps.disk_partitions(all=False)]
+    header = list(HEADER)
+    header += [f"cpu{i}_{kind}_percent" for i in range(num_cpus) for kind in ("user", "system", "idle")]
+    header += [f"disk_{_mount_name(mount)}_used_percent" for mount in mounts]
+    header += ["disk_read_bytes_per_s", "disk_write_bytes_per_s", "net_sent_bytes_per_s", "net_recv_bytes_per_s"]
+    header += [f"top_rss_{i}_{field}" for i in range(1, top_n + 1) for field in ("pid", "name", "rss_mb")]
+    header += [f"top_cpu_{i}_{field}" for i in range(1, top_n + 1) for field in ("pid", "name", "percent")]
+    last = {"time": time.monotonic(), "disk": ps.disk_io_counters(), "net": ps.net_io_counters()}
+    header_basic, sample_basic = make_sampler(wide=False)
+
+    def sample():
+        row = sample_basic()
+        for cpu_times in ps.cpu_times_percent(interval=None, percpu=True):
+            row += [cpu_times.user, cpu_times.system, cpu_times.idle]
+        for mount in mounts:
+            try:
+                row.append(ps.disk_usage(mount).percent)
+            except OSError:
+                row.append(None)
+        now, disk, net = time.monotonic(), ps.disk_io_counters(), ps.net_io_counters()
+        elapsed = max(now - last["time"], 1e-9)
+        row += [
+            _rate(disk, last["disk"], "read_bytes", elapsed), _rate(disk, last["disk"], "write_bytes", elapsed),
+            _rate(net, last["net"], "bytes_sent", elapsed), _rate(net, last["net"], "bytes_recv", elapsed),
+        ]
+        last.update(time=now, disk=disk, net=net)
+        processes = [p.info for p in ps.process_iter(["pid", "name", "memory_info", "cpu_percent"]) if p.info["memory_info"] is not None]
+        by_rss = sorted(processes, key=lambda p: p["memory_info"].rss, reverse=True)[:top_n]
+        by_cpu = sorted(processes, key=lambda p: p["cpu_percent"] or 0.0, reverse=True)[:top_n]
+        for i in range(top_n):
+            p = by_rss[i] if i < len(by_rss) else None
+            row += [p["pid"], p["name"], round(p["memory_info"].rss / 2**20, 1)] if p else [None, None, None]
+        for i in range(top_n):
+            p = by_cpu[i] if i < len(by_cpu) else None
+            row += [p["pid"], p["name"], p["cpu_percent"] or 0.0] if p else [None, None, None]
+        return row
+
+    return header, sample
+
+def _mount_name(mount):
+    return re.sub(r"[^0-9a-zA-Z]+", "_", mount).strip("_") or "root"
+
+def _rate(current, previous, field, elapsed):
+    if current is None or previous is None:
+        return None
+    return round(max(getattr(current, field) - getattr(previous, field), 0) / elapsed, 1)
+
+"""
+CSV writer that keeps the file open and flushes after flush_rows rows or
+flush_seconds seconds, whichever comes first.
+"""
+class BufferedCsvWriter:
+    def __init__(self, output_path, flush_rows=100, flush_seconds=5.0):
+        self.output_path = output_path
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.rows = 0
+        self.flushes = 0
+
+    def __enter__(self):
+        self._file = open(self.output_path, "w", newline="", buffering=1024 * 1024)
+        self._writer = csv.writer(self._file)
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        return self
+
+    def writerow(self, row):
+        self._writer.writerow(row)
+        self.rows += 1
+        self._pending += 1
+        if self._pending >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self.flushes += 1
+
+    def __exit__(self, *exc):
+        self.flush()
+        self._file.close()
@@ -0,0 +1,177 @@
+"""
+Fleet mode: one raw metrics CSV per host.
+
+The input is a directory of host files or a glob pattern; each file's stem is its
+host name. Every host is ingested, validated and aggregated independently in a process
+pool, so the expensive per-sample work scales with the number of cores and only the
+(much smaller) per-host windows travel back to the parent. Windows are aligned to the
+unix epoch, so the fleet-wide view is a group-by over the epoch bucket of each host
+window. A host window's window_start is its first sample, which differs between hosts
+that sample at different offsets, so it is not the grouping key.
+
+Per-host datasets are written to {output}/hosts/{host}/processed/ and the fleet
+aggregates to {output}/processed/fleet_metrics_{window}s. Percentiles over every sample
+of every host (sample_p{q}_ columns) come from merging the hosts' window sketches, so
+the raw samples are not read again.
+"""
+import glob
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from pipeline import aggregate, ingest, instrument, settings, sketch, storage, transform
+
+FLEET_COLUMNS = ["window_start", "window_end", "host_count", "sample_count", "avg_cpu_total_percent", "p50_cpu_total_percent", "p95_cpu_total_percent", "max_cpu_total_percent", "min_cpu_idle_percent", "max_memory_usage_percent", "avg_disk_usage_percent", "hosts_memory_pressure", "hosts_cpu_saturation"]
+
+"""
+Whether an --input value names several host files (a directory or a glob pattern)
+rather than a single CSV.
+
+Returns:
+    bool: True for fleet input
+"""
+def is_fleet_input(input_spec):
+    return os.path.isdir(input_spec) or glob.has_magic(input_spec)
+
+"""
+Resolves a directory or glob pattern to the host files it names. The host name is the
+file name without its extension; if two files share a stem (e.g. web01/metrics.csv and
+web02/metrics.csv) their parent directory names are used instead.
+
+Returns:
+    dict[str, str]: host name -> CSV path, sorted by host
+"""
+def resolve_inputs(input_spec):
+    pattern = os.path.join(input_spec, "*.csv") if os.path.isdir(input_spec) else input_spec
+    paths = sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+    if not paths:
+        raise FileNotFoundError(f"No host CSV files match {input_spec}")
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    if len(set(stems)) < len(stems):
+        stems = [os.path.basename(os.path.dirname(os.path.abspath(path))) for path in paths]
+    if len(set(stems)) < len(stems):
+        raise ValueError(f"Host names in {input_spec} are not unique, use one file per host")
+    return dict(sorted(zip(stems, paths)))
+
+"""
+Ingests every host file and writes per-host and fleet-wide window aggregates.
+With workers > 1 hosts are processed in a process pool. config (by default
+settings.load()) is handed to every host's transformation.
+
+Returns:
+    dict[int, str]: mapping window size -> fleet output path
+    dict[int, dataframe]: processed windows of every host, tagged with a host column
+"""
+def run_fleet(input_spec, output_dir, window_sizes, fmt="csv", workers=1, percentiles=None, config=None):
+    config = config or settings.load()
+    inputs = resolve_inputs(input_spec)
+    logging.info(f"Fleet ingestion started: {len(inputs)} hosts, {workers} workers")
+    if workers > 1 and len(inputs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(inputs))) as pool:
+            jobs = {host: pool.submit(process_host, host, path, output_dir, window_sizes, fmt, config) for host, path in inputs.items()}
+            results = {host: job.result() for host, job in jobs.items()}
+    else:
+        results = {host: process_host(host, path, output_dir, window_sizes, fmt, config) for host, path in inputs.items()}
+
+    host_windows = {}
+    outputs = {}
+    for window in window_sizes:
+        host_windows[window] = pd.concat([frames[window].assign(host=host) for host, frames in results.items()], ignore_index=True)
+        fleet = fleet_windows(host_windows[window], window)
+        if percentiles:
+            host_sketches = [storage.read_frame(storage.sketch_path(storage.output_path(host_output_dir(output_dir, host), window, fmt))) for host in results]
+            fleet = fleet_percentiles(fleet, window, sketch.merge(*host_sketches), percentiles)
+        outputs[window] = fleet_output_path(output_dir, window, fmt)
+        storage.write_frame(fleet, outputs[window])
+        instrument.record("fleet", rows_in=len(host_windows[window]), rows_out=len(fleet))
+        _log_fleet(window, fleet)
+    return outputs, host_windows
+
+"""
+Ingests and aggregates one host file into {output_dir}/hosts/{host}/. Runs in a worker process.
+
+Returns:
+    dict[int, dataframe]: processed windows per window size
+"""
+def process_host(host, input_path, output_dir, window_sizes, fmt="csv", config=None):
+    config = config or settings.load()
+    df = ingest.run_ingestion(input_path, lateness=config['ingestion']['allowed_lateness_seconds'], duplicates=config['ingestion']['duplicates'])
+    df['host'] = host
+    host_dir = host_output_dir(output_dir, host)
+    os.makedirs(f"{host_dir}/processed", exist_ok=True)
+    return transform.run_transformation(df, host_dir, window_sizes, fmt=fmt, return_frames=True, config=config)
+
+"""
+Combines the processed windows of every host into one fleet row per epoch-aligned
+window of `window` seconds: the number of reporting hosts, sample-weighted means, the
+median / 95th percentile / max of the hosts' average CPU, extremes of idle CPU and
+memory, and how many hosts were under memory pressure or CPU saturation.
+window_start and window_end span the hosts' first and last samples in the window.
+
+Returns:
+    dataframe: one row per window with FLEET_COLUMNS
+"""
+def fleet_windows(host_windows, window):
+    if host_windows.empty:
+        return pd.DataFrame({column: pd.Series(dtype="datetime64[ns]" if column in ("window_start", "window_end") else "float64") for column in FLEET_COLUMNS})
+    weighted = host_windows.assign(
+        cpu_weighted=host_windows['avg_cpu_total_percent'] * host_windows['sample_count'],
+        disk_weighted=host_windows['avg_disk_usage_percent'] * host_windows['sample_count'],
+    )
+    grouped = weighted.groupby(pd.Index(aggregate.bucket_starts(host_windows['window_start'], window), name="bucket"), sort=True)
+    fleet = grouped.agg(
+        window_start=('window_start', 'min'),
+        window_end=('window_end', 'max'),
+        host_count=('host', 'nunique'),
+        sample_count=('sample_count', 'sum'),
+        cpu_weighted=('cpu_weighted', 'sum'),
+        disk_weighted=('disk_weighted', 'sum'),
+        max_cpu_total_percent=('avg_cpu_total_percent', 'max'),
+        min_cpu_idle_percent=('min_cpu_idle_percent', 'min'),
+        max_memory_usage_percent=('max_memory_usage_percent', 'max'),
+        hosts_memory_pressure=('memory_pressure_flag', 'sum'),
+        hosts_cpu_saturation=('cpu_saturation_flag', 'sum'),
+    )
+    quantiles = grouped['avg_cpu_total_percent'].quantile([0.5, 0.95]).unstack()
+    fleet['avg_cpu_total_percent'] = (fleet['cpu_weighted'] / fleet['sample_count']).round(1)
+    fleet['avg_disk_usage_percent'] = (fleet['disk_weighted'] / fleet['sample_count']).round(1)
+    fleet['p50_cpu_total_percent'] = quantiles[0.5].round(1)
+    fleet['p95_cpu_total_percent'] = quantiles[0.95].round(1)
+    fleet = fleet.reset_index(drop=True)[FLEET_COLUMNS]
+    return fleet.astype({"host_count": "int64", "sample_count": "int64", "hosts_memory_pressure": "int64", "hosts_cpu_saturation": "int64"})
+
+"""
+Adds percentiles over all samples of all hosts to the fleet windows, from the merged
+sketches of every host.
+
+Returns:
+    dataframe: fleet windows with sample_p{q}_{metric} columns
+"""
+def fleet_percentiles(fleet, window, merged_sketch, percentiles):
+    quantiles = sketch.quantiles(merged_sketch, percentiles['quantiles'], sketch.is_exact(window, percentiles), percentiles['relative_accuracy'])
+    buckets = aggregate.bucket_starts(fleet['window_start'], window)
+    quantiles = quantiles.reindex(buckets).add_prefix("sample_").reset_index(drop=True)
+    return pd.concat([fleet, quantiles], axis=1)
+
+"""
+Returns:
+    str: output directory of one host
+"""
+def host_output_dir(output_dir, host):
+    return f"{output_dir}/hosts/{host}"
+
+"""
+Returns:
+    str: path of the fleet aggregates of a window size
+"""
+def fleet_output_path(output_dir, window, fmt="csv"):
+    return f"{output_dir}/processed/fleet_metrics_{window}s{storage.EXTENSIONS[fmt]}"
+
+def _log_fleet(window, fleet):
+    if fleet.empty:
+        logging.info(f"{window}-second fleet windows: no valid samples")
+        return
+    hosts = int(fleet['host_count'].max())
+    busiest = int(np.argmax(fleet['p95_cpu_total_percent'].to_numpy()))
+    logging.info(f"{window}-second fleet windows: Total={len(fleet)}, Hosts={hosts}, Max p95 CPU={fleet['p95_cpu_total_percent'].iloc[busiest]} at {fleet['window_start'].iloc[busiest]:%Y-%m-%dT%H:%M:%S}, Max hosts under memory pressure={int(fleet['hosts_memory_pressure'].max())}, Max hosts CPU saturated={int(fleet['hosts_cpu_saturation'].max())}")
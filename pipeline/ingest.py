@@ -1,15 +1,147 @@
+import io
+import itertools
 import logging
+import os
 import pandas as pd
+import numpy as np
 import math
 from datetime import datetime
+from pipeline import instrument, schema
+
+REJECTION_COLUMNS = ["row", "column", "rule", "value", "message"]
+DUPLICATE_POLICIES = ["keep", "first", "last"]
 
 """
-Makes sure data is good and logs/gets rid of bad data
+Makes sure data is good and logs/gets rid of bad data. lateness and duplicates
+control how out-of-order and repeated timestamps are handled (see validate_metrics).
 
 Returns:
     dataframe: valid data
+    dataframe: rejection report (only if return_report is True)
+"""
+def run_ingestion(input_path, return_report=False, lateness=0, duplicates="keep"):
+    _require_input(input_path)
+    df = _read_csv(input_path)
+
+    logging.info(f"Ingestion started: {input_path}")
+
+    initial_num_rows = len(df)
+    ingestion_start_time = datetime.now()
+    #Validate data
+    df, rejections = validate_metrics(df, lateness=lateness, duplicates=duplicates)
+    ingestion_end_time = datetime.now()
+    final_num_rows = len(df)
+    num_rows_deleted = initial_num_rows - final_num_rows
+    logging.info(f"Total number of rows: {initial_num_rows}")
+    logging.info(f"Valid rows ingested: {final_num_rows}")
+    logging.warning(f"Number of rows deleted during validation: {num_rows_deleted}")
+    for rule, count in rejections['rule'].value_counts(sort=False).items():
+        logging.debug(f"Rows rejected by rule '{rule}': {count}")
+    # Compute statistics
+    cpu_user_min = df['cpu_user_percent'].min()
+    cpu_user_max = df['cpu_user_percent'].max()
+    cpu_user_avg = df['cpu_user_percent'].mean()
+    logging.info(f"CPU user percent — min: {cpu_user_min:.1f}, max: {cpu_user_max:.1f}, avg: {cpu_user_avg:.1f}")
+    memory_used_avg = df['memory_used_percent'].mean()
+    logging.info(f"Memory used percent — avg: {memory_used_avg:.1f}")
+    time_elapsed = (ingestion_end_time - ingestion_start_time).total_seconds()
+    logging.info(f"Ingestion completed in {time_elapsed} seconds")
+    instrument.record("ingestion", rows_in=initial_num_rows, rows_out=final_num_rows)
+
+    # Return results
+    if return_report:
+        return df, rejections
+    return df
+
+"""
+Streams the CSV in chunks of chunk_rows, validating each one and carrying the newest
+timestamp that passed the order check across chunk boundaries, as validate_metrics does
+from row to row, so the chunked result matches run_ingestion.
+
+The samples of a chunk within lateness seconds of its newest one are held back in a
+reorder buffer and merged with the next chunk, since that chunk may still hold samples
+that precede them or share their timestamp. Every chunk handed on is therefore in
+order, also across chunk boundaries, and duplicates are resolved across chunks too.
+
+Returns:
+    iterator[dataframe]: valid rows, one frame per chunk
 """
-def run_ingestion(input_path):
+def iter_ingestion(input_path, chunk_rows, lateness=0, duplicates="keep"):
+    _require_input(input_path)
+    reader = _read_csv(input_path, chunksize=chunk_rows)
+    logging.info(f"Streaming ingestion started: {input_path} ({chunk_rows} rows per chunk)")
+
+    ingestion_start_time = datetime.now()
+    last_timestamp = None
+    held = None
+    # raw timestamps of the held rows and the current chunk, by row label, for duplicate messages
+    raw_timestamps = None
+    initial_num_rows = 0
+    final_num_rows = 0
+    cpu_user_min = math.inf
+    cpu_user_max = -math.inf
+    cpu_user_sum = 0.0
+    memory_used_sum = 0.0
+    # a final None releases whatever is still held back
+    for chunk in itertools.chain(reader, [None]):
+        if chunk is not None:
+            initial_num_rows += len(chunk)
+            raw_timestamps = chunk['timestamp'] if held is None else pd.concat([raw_timestamps.loc[held.index], chunk['timestamp']])
+            chunk, rejections, last_timestamp = validate_metrics(chunk, last_timestamp, lateness, duplicates, return_newest=True)
+        chunk, held = _release(held, chunk, lateness, duplicates, raw_timestamps)
+        if chunk is None or chunk.empty:
+            continue
+        final_num_rows += len(chunk)
+        cpu_user_min = min(cpu_user_min, chunk['cpu_user_percent'].min())
+        cpu_user_max = max(cpu_user_max, chunk['cpu_user_percent'].max())
+        cpu_user_sum += chunk['cpu_user_percent'].sum()
+        memory_used_sum += chunk['memory_used_percent'].sum()
+        yield chunk
+    ingestion_end_time = datetime.now()
+
+    logging.info(f"Total number of rows: {initial_num_rows}")
+    logging.info(f"Valid rows ingested: {final_num_rows}")
+    logging.warning(f"Number of rows deleted during validation: {initial_num_rows - final_num_rows}")
+    if final_num_rows > 0:
+        logging.info(f"CPU user percent — min: {cpu_user_min:.1f}, max: {cpu_user_max:.1f}, avg: {cpu_user_sum / final_num_rows:.1f}")
+        logging.info(f"Memory used percent — avg: {memory_used_sum / final_num_rows:.1f}")
+    time_elapsed = (ingestion_end_time - ingestion_start_time).total_seconds()
+    logging.info(f"Ingestion completed in {time_elapsed} seconds")
+    instrument.record("ingestion", rows_in=initial_num_rows, rows_out=final_num_rows)
+
+"""
+Ingests only the complete lines appended to input_path after byte offset, validating
+them against the newest timestamp accepted by a previous run. A trailing line without a
+newline (a sample still being written) is left for the next run. With a lateness, new
+samples up to lateness seconds older than that timestamp are accepted; the transformation
+stage merges them into the windows it kept open for them.
+
+Returns:
+    dataframe: valid new rows
+    int: byte offset just past the last complete line read
+"""
+def run_incremental_ingestion(input_path, offset=0, last_timestamp=None, lateness=0, duplicates="keep"):
+    _require_input(input_path)
+    if not os.path.isfile(input_path):
+        _read_csv(input_path)  # reports the missing file / directory and exits
+    with open(input_path, "rb") as f:
+        header = f.readline()
+        start = max(offset, len(header))
+        f.seek(start)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    logging.info(f"Incremental ingestion started: {input_path} from byte {start} ({end} new bytes)")
+
+    df = _read_csv(io.BytesIO(header + data[:end]))
+    initial_num_rows = len(df)
+    df, rejections = validate_metrics(df, last_timestamp, lateness, duplicates)
+    logging.info(f"New rows: {initial_num_rows}, valid rows ingested: {len(df)}")
+    if initial_num_rows > len(df):
+        logging.warning(f"Number of rows deleted during validation: {initial_num_rows - len(df)}")
+    instrument.record("ingestion", rows_in=initial_num_rows, rows_out=len(df))
+    return df, start + end
+
+def _require_input(input_path):
     if input_path is None:
         print(
             "No input file provided.\n"
@@ -17,8 +149,9 @@ def run_ingestion(input_path):
         )
         exit(1)
 
+def _read_csv(input_path, **kwargs):
     try:
-        df = pd.read_csv(input_path)
+        return pd.read_csv(input_path, **kwargs)
     except FileNotFoundError:
         print(
             f"File not found: {input_path}\n"
@@ -33,111 +166,174 @@ def run_ingestion(input_path):
     except Exception as e:
         print(f"Failed to read CSV: {e}")
         exit(1)
-        df = pd.read_csv(input_path)
-    
-    logging.info(f"Ingestion started: {input_path}")
 
-    initial_num_rows = len(df)
-    ingestion_start_time = datetime.now()
-    #Validate data
-    df['cpu_user_percent'] = pd.to_numeric(df['cpu_user_percent'], errors="coerce")
-    df['cpu_system_percent'] = pd.to_numeric(df['cpu_system_percent'], errors="coerce")
-    df['cpu_idle_percent'] = pd.to_numeric(df['cpu_idle_percent'], errors="coerce")
-    df['memory_used_percent'] = pd.to_numeric(df['memory_used_percent'], errors="coerce")
-    df['disk_used_percent'] = pd.to_numeric(df['disk_used_percent'], errors="coerce")
-
-    timestamp = df.columns[0]
-    temp_time = df[timestamp][0]
-    for row_index in df.index:
-        row_value = df.at[row_index, timestamp]
-        if pd.isnull(row_value):
-            print(f"Null/bad value found in timestamp column")
-            df = df.drop(row_index)
-            continue
-        try:
-            datetime.fromisoformat(row_value)
-        except ValueError:
-            print(f"Invalid timestamp format found: {row_value}")
-            df = df.drop(row_index)
-            continue
-        if row_value < temp_time:
-            print(f"Timestamps are not in chronological order: {temp_time} followed by {row_value}")
-            df = df.drop(row_index)
-            continue
-        temp_time = row_value
-    cpu_user_percent = df.columns[1]
-    for row_index in df.index:
-        row_value = df.at[row_index, cpu_user_percent]
-        if pd.isnull(row_value):
-            print(f"Null/bad value found in cpu_user_percent column")
-            df = df.drop(row_index)
-            continue
-        if not (0 <= row_value <= 100):
-            print(f"Invalid cpu_user_percent value found: {round(row_value,1)}")
-            df = df.drop(row_index)
-    cpu_system_percent = df.columns[2]
-    for row_index in df.index:
-        row_value = df.at[row_index, cpu_system_percent]
-        if pd.isnull(row_value):
-            print(f"Null/bad value found in cpu_system_percent column")
-            df = df.drop(row_index)
-            continue
-        if not (0 <= row_value <= 100):
-            print(f"Invalid cpu_system_percent value found: {round(row_value,1)}")
-            df = df.drop(row_index)
-    cpu_idle_percent = df.columns[3]
-    for row_index in df.index:
-        row_value = df.at[row_index, cpu_idle_percent]
-        if pd.isnull(row_value):
-            print(f"Null/bad value found in cpu_idle_percent column")
-            df = df.drop(row_index)
-            continue
-        if not (0 <= row_value <= 100):
-            print(f"Invalid cpu_idle_percent value found: {round(row_value,1)}")
-            df = df.drop(row_index)
-    tollerance = 0.1
-    for row_index in df.index:
-        total = df.at[row_index, cpu_user_percent] + df.at[row_index, cpu_system_percent] + df.at[row_index, cpu_idle_percent]
-        if not (total <= 100+tollerance):
-            print(f"CPU percentages do not sum to 100 at row {row_index}: total={round(total,1)}")
-            df = df.drop(row_index)
-
-    memory_used_percent = df.columns[4]
-    for row_index in df.index:
-        row_value = df.at[row_index, memory_used_percent]
-        if pd.isnull(row_value):
-            print(f"Null/bad value found in memory_used_percent column")
-            df = df.drop(row_index)
-            continue
-        if not (0 <= row_value <= 100):
-            print(f"Invalid memory_used_percent value found: {round(row_value,1)}")
-            df = df.drop(row_index)
-    
-    disk_used_percent = df.columns[5]
-    for row_index in df.index:
-        row_value = df.at[row_index, disk_used_percent]
-        if pd.isnull(row_value):
-            print(f"Null/bad value found in disk_used_percent column")
-            df = df.drop(row_index)
-            continue
-        if not (0 <= row_value <= 100):
-            print(f"Invalid disk_used_percent value found: {round(row_value,1)}")
-            df = df.drop(row_index)
-    ingestion_end_time = datetime.now()
-    final_num_rows = len(df)
-    num_rows_deleted = initial_num_rows - final_num_rows
-    logging.info(f"Total number of rows: {initial_num_rows}")
-    logging.info(f"Valid rows ingested: {final_num_rows}")
-    logging.warning(f"Number of rows deleted during validation: {num_rows_deleted}")
-    # Compute statistics
-    cpu_user_min = df[cpu_user_percent].min()
-    cpu_user_max = df[cpu_user_percent].max()
-    cpu_user_avg = df[cpu_user_percent].mean()
-    logging.info(f"CPU user percent — min: {cpu_user_min:.1f}, max: {cpu_user_max:.1f}, avg: {cpu_user_avg:.1f}")
-    memory_used_avg = df[memory_used_percent].mean()
-    logging.info(f"Memory used percent — avg: {memory_used_avg:.1f}")
-    time_elapsed = (ingestion_end_time - ingestion_start_time).total_seconds()
-    logging.info(f"Ingestion completed in {time_elapsed} seconds")
+"""
+Validates raw metric rows with one boolean mask per rule and filters the frame once.
 
-    # Return results
-    return df
\ No newline at end of file
+After the timestamp checks, the column groups declared in pipeline.schema are applied
+in order, each as one mask over the matrix of all its columns. Within a group columns
+are reported left to right and a row is only reported by the first rule it fails, so
+the original six-column diagnostics (cpu user, cpu system, cpu idle, cpu sum, memory,
+disk) are unchanged.
+
+A sample older than the newest one seen so far (starting from last_timestamp) by more
+than lateness seconds is rejected; with the default lateness of 0 that is any sample
+earlier than the one before it. Samples within the lateness are kept and the valid rows
+are returned sorted by timestamp. Samples sharing a timestamp are resolved by the
+duplicates policy: "keep" keeps them all, "first" / "last" keeps the one that arrived
+first / last and reports the others. Filtering and sorting take a single copy of the frame.
+
+The order check advances on every sample whose timestamp passes it, even when the row
+is then rejected by a value check. With return_newest the newest such timestamp is
+returned too, as written in the input; pass it as last_timestamp of the next batch to
+validate a stream in parts exactly as in one call, diagnostics included.
+
+Returns:
+    dataframe: valid data
+    dataframe: rejection report with one row per dropped row (row, column, rule, value, message)
+    str | None: newest timestamp the order check has seen (only if return_newest is True)
+"""
+def validate_metrics(df, last_timestamp=None, lateness=0, duplicates="keep", return_newest=False):
+    if duplicates not in DUPLICATE_POLICIES:
+        raise ValueError(f"Unknown duplicates policy {duplicates!r}, expected one of {DUPLICATE_POLICIES}")
+    for column in schema.numeric_columns(df.columns):
+        if not pd.api.types.is_float_dtype(df[column]) and not pd.api.types.is_integer_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+
+    keep = np.ones(len(df), dtype=bool)
+    report = []
+    labels = df.index.to_numpy()
+
+    # timestamp: null, format and chronological order against the last accepted row
+    raw_timestamps = df['timestamp']
+    null_ts = raw_timestamps.isna().to_numpy()
+    parsed = pd.to_datetime(raw_timestamps, format="ISO8601", errors="coerce")
+    bad_ts = parsed.isna().to_numpy() & ~null_ts
+    ts_ok = ~(null_ts | bad_ts)
+    ts_ns = parsed.to_numpy(dtype="datetime64[ns]").view("int64")
+
+    seed = np.iinfo(np.int64).min if last_timestamp is None else pd.Timestamp(last_timestamp).as_unit("ns").value
+    running_max = np.maximum(np.maximum.accumulate(np.where(ts_ok, ts_ns, seed)), seed)
+    out_of_order = ts_ok & (ts_ns < running_max) & (running_max - ts_ns > round(lateness * 1e9))
+    accepted = ts_ok & ~out_of_order
+    last_accepted_pos = np.maximum.accumulate(np.where(accepted, np.arange(len(df)), -1))
+
+    raw_values = raw_timestamps.to_numpy(dtype=object)
+    for pos in np.flatnonzero(null_ts | bad_ts | out_of_order):
+        value = raw_values[pos]
+        if null_ts[pos]:
+            _reject(report, labels[pos], 'timestamp', 'null', value, "Null/bad value found in timestamp column")
+        elif bad_ts[pos]:
+            _reject(report, labels[pos], 'timestamp', 'format', value, f"Invalid timestamp format found: {value}")
+        elif lateness:
+            newest = pd.Timestamp(running_max[pos]).isoformat()
+            _reject(report, labels[pos], 'timestamp', 'order', value, f"Timestamp arrived more than {lateness:g}s late: {newest} followed by {value}")
+        else:
+            prev = raw_values[last_accepted_pos[pos]] if last_accepted_pos[pos] >= 0 else last_timestamp
+            _reject(report, labels[pos], 'timestamp', 'order', value, f"Timestamps are not in chronological order: {prev} followed by {value}")
+    keep &= accepted
+    # keep the parsed timestamps so later stages do not parse them again
+    df['timestamp'] = parsed
+
+    for group in schema.resolve_groups(tuple(df.columns)):
+        if group['kind'] == 'sum_max':
+            keep = _check_sum(df, group, keep, labels, report)
+        else:
+            keep = _check_range(df, group, keep, labels, report)
+
+    positions, dropped, reordered = _order(ts_ns, np.flatnonzero(keep), duplicates)
+    _reject_duplicates(report, labels, raw_values, dropped, duplicates)
+    _print_report(report)
+    rejections = pd.DataFrame(report, columns=REJECTION_COLUMNS)
+    if len(positions) < len(df) or reordered:
+        df = df.iloc[positions]
+    if not return_newest:
+        return df, rejections
+    newest_pos = np.flatnonzero(accepted & (ts_ns == running_max))
+    newest = raw_values[newest_pos[-1]] if len(newest_pos) else last_timestamp
+    return df, rejections, newest
+
+"""
+Sorts the rows at positions by timestamp and resolves equal timestamps by the duplicates
+policy. The sort is stable, so rows sharing a timestamp stay in arrival order, and it is
+skipped when the rows already are in order (the common case).
+
+Returns:
+    ndarray: positions of the rows kept, in timestamp order
+    ndarray: positions of the duplicates dropped
+    bool: whether the rows had to be sorted
+"""
+def _order(ts_ns, positions, duplicates):
+    timestamps = ts_ns[positions]
+    reordered = bool((timestamps[1:] < timestamps[:-1]).any())
+    if reordered:
+        order = np.argsort(timestamps, kind="stable")
+        positions, timestamps = positions[order], timestamps[order]
+    same = timestamps[1:] == timestamps[:-1]
+    if duplicates == "keep" or not same.any():
+        return positions, positions[:0], reordered
+    # "first" drops every row equal to the one before it, "last" every row equal to the one after it
+    dropped = np.insert(same, 0, False) if duplicates == "first" else np.append(same, False)
+    return positions[~dropped], positions[dropped], reordered
+
+def _reject_duplicates(report, labels, values, dropped, duplicates):
+    for pos in dropped:
+        _reject(report, labels[pos], 'timestamp', 'duplicate', values[pos], f"Duplicate timestamp found: {values[pos]} (keeping the {duplicates} sample)")
+
+# merges the samples held back from earlier chunks with the next validated chunk (None
+# once the input is exhausted) and holds back those within lateness of the newest one;
+# raw_timestamps maps row labels to the timestamps as read, for the duplicate messages
+def _release(held, chunk, lateness, duplicates, raw_timestamps):
+    if chunk is None:
+        return held, None
+    if held is not None and not held.empty:
+        chunk = pd.concat([held, chunk])
+        ts_ns = chunk['timestamp'].to_numpy(dtype="datetime64[ns]").view("int64")
+        positions, dropped, _ = _order(ts_ns, np.arange(len(chunk)), duplicates)
+        report = []
+        _reject_duplicates(report, chunk.index.to_numpy(), raw_timestamps.loc[chunk.index].to_numpy(dtype=object), dropped, duplicates)
+        _print_report(report)
+        chunk = chunk.iloc[positions]
+    if chunk.empty:
+        return chunk, None
+    timestamps = chunk['timestamp'].to_numpy(dtype="datetime64[ns]")
+    split = np.searchsorted(timestamps, timestamps[-1] - np.timedelta64(round(lateness * 1e9), "ns"), side="left")
+    return chunk.iloc[:split], chunk.iloc[split:]
+
+def _check_range(df, group, keep, labels, report):
+    columns = group['columns']
+    values = df[columns].to_numpy(dtype=float)
+    null = np.isnan(values)
+    in_range = values >= group['min']
+    if group['max'] is not None:
+        in_range &= values <= group['max']
+    if group.get('nullable'):
+        in_range |= null
+    bad = ~in_range & keep[:, None]
+    bad_rows = bad.any(axis=1)
+    if not bad_rows.any():
+        return keep
+    # report each row under the first column it fails, column by column
+    first_bad = bad.argmax(axis=1)
+    for col in np.unique(first_bad[bad_rows]):
+        column = columns[col]
+        for pos in np.flatnonzero(bad_rows & (first_bad == col)):
+            if null[pos, col]:
+                _reject(report, labels[pos], column, 'null', None, f"Null/bad value found in {column} column")
+            else:
+                _reject(report, labels[pos], column, 'range', values[pos, col], f"Invalid {column} value found: {round(values[pos, col],1)}")
+    return keep & ~bad_rows
+
+def _check_sum(df, group, keep, labels, report):
+    total = df[group['columns']].to_numpy(dtype=float).sum(axis=1)
+    within = total <= group['max']
+    for pos in np.flatnonzero(keep & ~within):
+        _reject(report, labels[pos], group['name'], group['name'] + '_sum', total[pos], group['message'].format(row=labels[pos], total=round(total[pos],1)))
+    return keep & within
+
+def _reject(report, row, column, rule, value, message):
+    report.append((row, column, rule, value, message))
+
+def _print_report(report):
+    if report:
+        print("\n".join(entry[4] for entry in report))
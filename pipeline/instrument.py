@@ -0,0 +1,215 @@
+"""
+Stage instrumentation and the JSON run report.
+
+main.py starts a run, wraps every pipeline stage in stage(name) and writes the report
+when the run ends ({output}/analytics/run_report.json by default). For every stage it
+holds:
+
+wall_seconds     elapsed time
+cpu_seconds      user + system CPU time of the process and of the worker processes
+                 it reaped (process pools) during the stage
+peak_rss_bytes   the process's peak resident set size so far, at the end of the stage
+rss_bytes        resident set size at the end of the stage
+bytes_read       bytes read and written by the process during the stage (all files,
+bytes_written    including the page cache), when the platform reports them
+rows_in          added by the pipeline modules through record(): raw rows read,
+rows_out         valid rows, windows written, ...
+
+Stages are not nested. A stage that runs lazily inside another (chunked ingestion
+inside the transformation) only records its rows; its cost is counted in the other
+stage. Counters recorded inside worker processes are not collected.
+
+With a profile directory every stage is also run under cProfile and tracemalloc:
+{stage}.prof (load with pstats or snakeviz), {stage}.txt (top functions by cumulative
+time) and {stage}.tracemalloc.txt (top allocation sites), and the stage gets
+traced_peak_bytes, the peak of memory allocated by Python and numpy during the stage.
+
+on_record, when given to start_run, is called with the stages (a list of copies, as in
+the report) every time a stage ends or records counters; the --serve endpoint keeps its
+stage timings current through it.
+
+Without a started run, stage() and record() do nothing, so library callers and tests
+pay nothing for them. On Linux the counters come from /proc; elsewhere psutil is
+imported for them on first use.
+"""
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_TOP = 30
+
+_active = None
+
+"""
+Starts collecting a run report; stage() and record() report to it until finish().
+
+Returns:
+    RunReport: the active report
+"""
+def start_run(command, profile_dir=None, on_record=None):
+    global _active
+    _active = RunReport(command, profile_dir, on_record)
+    return _active
+
+"""
+Ends the active run and writes its report to path.
+
+Returns:
+    dict | None: the run report, None without an active run
+"""
+def finish(path, status="ok"):
+    global _active
+    report, _active = _active, None
+    if report is None:
+        return None
+    report.status = status
+    return report.write(path)
+
+"""
+Measures the enclosed block as a stage of the active run (a no-op without one).
+"""
+@contextlib.contextmanager
+def stage(name):
+    if _active is None:
+        yield
+        return
+    with _active.stage(name):
+        yield
+
+"""
+Adds counters (rows_in, rows_out, ...) to a stage of the active run (a no-op without one).
+"""
+def record(name, **counters):
+    if _active is not None:
+        _active.record(name, **counters)
+
+"""
+Stages of one run, in the order they were first entered or recorded.
+"""
+class RunReport:
+    def __init__(self, command, profile_dir=None, on_record=None):
+        self.command = command
+        self.profile_dir = profile_dir
+        self.on_record = on_record
+        self.started = datetime.now()
+        self.status = "running"
+        self._start = _sample()
+        self._stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        profiler = None
+        if self.profile_dir:
+            import cProfile
+            import tracemalloc
+            os.makedirs(self.profile_dir, exist_ok=True)
+            tracemalloc.start()
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = _sample()
+        try:
+            yield
+        finally:
+            end = _sample()
+            measured = _difference(start, end)
+            if profiler is not None:
+                profiler.disable()
+                measured['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                self._write_profile(name, profiler, tracemalloc.take_snapshot())
+                tracemalloc.stop()
+            self.record(name, **measured)
+
+    def record(self, name, **counters):
+        entry = self._stages.setdefault(name, {"name": name})
+        for key, value in counters.items():
+            # timings of a repeated stage add up, gauges keep their latest value
+            if key in entry and key not in ("peak_rss_bytes", "rss_bytes", "traced_peak_bytes") and value is not None:
+                entry[key] += value
+            else:
+                entry[key] = value
+        if self.on_record:
+            self.on_record(self.stages())
+
+    def stages(self):
+        return [dict(entry) for entry in self._stages.values()]
+
+    def snapshot(self):
+        total = _difference(self._start, _sample())
+        return {
+            "command": self.command,
+            "started": self.started.isoformat(timespec="seconds"),
+            "status": self.status,
+            "python": sys.version.split()[0],
+            **total,
+            "stages": self.stages(),
+        }
+
+    def write(self, path):
+        snapshot = self.snapshot()
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(snapshot, f, indent=2)
+        except OSError as e:
+            logging.warning(f"Could not write the run report to {path}: {e}")
+            return snapshot
+        logging.info(f"Run report written to {path}")
+        return snapshot
+
+    def _write_profile(self, name, profiler, snapshot):
+        import pstats
+        profiler.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        with open(os.path.join(self.profile_dir, f"{name}.txt"), "w") as f:
+            f.write(text.getvalue())
+        with open(os.path.join(self.profile_dir, f"{name}.tracemalloc.txt"), "w") as f:
+            for statistic in snapshot.statistics("lineno")[:PROFILE_TOP]:
+                f.write(f"{statistic}\n")
+
+# process counters at one point in time
+def _sample():
+    sample = {"wall": time.perf_counter(), "cpu": time.process_time(), "peak_rss": None}
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        sample['cpu'] += children.ru_utime + children.ru_stime
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        sample['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    sample['rss'], sample['read'], sample['written'] = _proc_counters() if os.path.exists("/proc/self/io") else _psutil_counters()
+    return sample
+
+# resident set size and characters read / written, from /proc (Linux)
+def _proc_counters():
+    with open("/proc/self/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    with open("/proc/self/io") as f:
+        io_counters = dict(line.split(": ") for line in f.read().splitlines())
+    return rss, int(io_counters['rchar']), int(io_counters['wchar'])
+
+def _psutil_counters():
+    import psutil
+    process = psutil.Process()
+    if not hasattr(process, "io_counters"):  # macOS
+        return process.memory_info().rss, None, None
+    counters = process.io_counters()
+    return process.memory_info().rss, getattr(counters, "read_chars", counters.read_bytes), getattr(counters, "write_chars", counters.write_bytes)
+
+def _difference(start, end):
+    return {
+        "wall_seconds": round(end['wall'] - start['wall'], 6),
+        "cpu_seconds": round(end['cpu'] - start['cpu'], 6),
+        "peak_rss_bytes": end['peak_rss'],
+        "rss_bytes": end['rss'],
+        "bytes_read": end['read'] - start['read'] if end['read'] is not None else None,
+        "bytes_written": end['written'] - start['written'] if end['written'] is not None else None,
+    }
@@ -0,0 +1,133 @@
+"""
+Analytics kernels over processed windows.
+
+Batch kernels work on whole columns with NumPy (run-length encoding for streaks, a
+partial sort for peaks). Each has an online counterpart that is updated one window at
+a time in constant memory, so the same analytics can run on live data.
+"""
+import heapq
+import numpy as np
+import pandas as pd
+from pipeline import storage
+
+"""
+Run-length encodes a boolean column.
+
+Returns:
+    ndarray: start position of every run of True values
+    ndarray: length of every run
+"""
+def find_streaks(flags):
+    flags = np.asarray(flags, dtype=bool).astype(np.int8)
+    edges = np.diff(np.concatenate(([0], flags, [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return starts, ends - starts
+
+"""
+Streaks of a flag column with their time ranges.
+
+Returns:
+    dict: longest streak length, number of streaks and one entry (start, end, windows) per streak
+"""
+def streak_summary(flags, window_start, window_end):
+    starts, lengths = find_streaks(flags)
+    window_start = np.asarray(window_start)
+    window_end = np.asarray(window_end)
+    return {
+        "longest": int(lengths.max()) if len(lengths) else 0,
+        "count": int(len(lengths)),
+        "streaks": [
+            {"start": format_time(window_start[start]), "end": format_time(window_end[start + length - 1]), "windows": int(length)}
+            for start, length in zip(starts, lengths)
+        ],
+    }
+
+"""
+Positions of the k largest values in one pass (argpartition), ordered by value
+descending and, for equal values, by position, so the first entry matches idxmax().
+NaN values are ignored.
+
+Returns:
+    ndarray: up to k positions
+"""
+def top_k_peaks(values, k):
+    values = np.asarray(values, dtype=float)
+    values = np.where(np.isnan(values), -np.inf, values)
+    valid = int(np.count_nonzero(values > -np.inf))
+    k = min(k, valid)
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    kth_value = values[np.argpartition(values, len(values) - k)[len(values) - k]]
+    candidates = np.flatnonzero(values >= kth_value)
+    order = np.lexsort((candidates, -values[candidates]))
+    return candidates[order][:k]
+
+"""
+Online streak detection: feed one window at a time with update(). Only the current and
+longest streak are kept; each finished streak is returned by update() (or close()) as it ends.
+"""
+class StreakTracker:
+    def __init__(self):
+        self.longest = 0
+        self.count = 0
+        self.current = 0
+        self.current_start = None
+        self.current_end = None
+
+    def update(self, flag, window_start=None, window_end=None):
+        if flag:
+            if self.current == 0:
+                self.current_start = window_start
+                self.count += 1
+            self.current += 1
+            self.current_end = window_end
+            self.longest = max(self.longest, self.current)
+            return None
+        return self.close()
+
+    def close(self):
+        if self.current == 0:
+            return None
+        streak = {"start": format_time(self.current_start), "end": format_time(self.current_end), "windows": self.current}
+        self.current = 0
+        self.current_start = None
+        self.current_end = None
+        return streak
+
+"""
+Online top-K peak detection: keeps a min-heap of the k largest values seen so far.
+Ties keep the earliest window, like top_k_peaks.
+"""
+class TopKTracker:
+    def __init__(self, k):
+        self.k = k
+        self.seen = 0
+        self._heap = []
+
+    def update(self, value, window_start=None, window_end=None):
+        self.seen += 1
+        if value is None or np.isnan(value):
+            return
+        item = (value, -self.seen, window_start, window_end)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def peaks(self):
+        return [
+            {"start": format_time(start), "end": format_time(end), "value": value}
+            for value, _, start, end in sorted(self._heap, key=lambda item: item[:2], reverse=True)
+        ]
+
+"""
+Formats a window boundary the way processed CSVs and analytics summaries write it.
+
+Returns:
+    str | None: timestamp in storage.CSV_DATE_FORMAT, None for None
+"""
+def format_time(value):
+    if value is None:
+        return None
+    return pd.Timestamp(value).strftime(storage.CSV_DATE_FORMAT)
@@ -0,0 +1,266 @@
+"""
+Live mode: collect -> ingest -> transform -> analytics running concurrently.
+
+A producer thread samples system metrics (pipeline.collect.iter_samples) into a queue.
+The consumer drains the queue in micro-batches, validates them (carrying the last
+accepted timestamp), appends them to the raw CSV and feeds them to a streaming
+WindowAggregator. Every window is emitted as soon as it closes: its row is appended to
+the processed dataset, memory pressure / CPU saturation alerts are logged, and
+closed-window latency and queue depth are exported to {output}/analytics/live_metrics.json.
+"""
+import contextlib
+import io
+import json
+import logging
+import os
+import queue
+import threading
+import pandas as pd
+from pipeline import aggregate, anomaly, collect, ingest, kernels, storage
+
+STOP = object()
+# streaks tracked per window size: name -> flag column
+STREAK_FLAGS = {"memory_pressure": "memory_pressure_flag", "cpu_saturation": "cpu_saturation_flag"}
+
+"""
+Runs the live pipeline for `duration` seconds (or until interrupted).
+on_window is called with (window, row) for every closed window, where row is a
+series holding the processed window. samples replaces the collector with any
+iterable of rows matching header (collect.HEADER by default); wide/top_n select the
+collector schema (see collect.make_sampler). With a percentiles config every window
+also gets its percentiles and its sketch is appended next to the processed dataset.
+With an anomaly config (config.yaml anomaly section) every closed window updates an
+online anomaly.AnomalyTracker per window size and metric, and each anomaly interval is
+logged as an alert when it ends. With a cache (serve.MetricsCache) every closed
+window, anomaly interval and the live counters are published to it as they happen.
+ingestion is the ingestion section of config.yaml: samples up to
+allowed_lateness_seconds late are accepted and windows stay open that much longer, so
+a late sample still lands in its window before the window is emitted. Duplicates are
+resolved within each micro-batch.
+Memory pressure and CPU saturation streaks and the top_k CPU peaks are tracked online
+per window size (kernels.StreakTracker, kernels.TopKTracker); each streak is logged when
+it ends and both are exported with the live metrics.
+
+Returns:
+    dict: final live metrics
+"""
+def run_live(output_dir, window_sizes, duration, interval, thresholds, raw_path=None, fmt="csv", on_window=None, samples=None, header=None, wide=False, top_n=5, max_batch=1000, percentiles=None, anomalies=None, cache=None, ingestion=None, top_k=5):
+    sample_queue = queue.Queue()
+    metrics = LiveMetrics(window_sizes, f"{output_dir}/analytics/live_metrics.json", top_k)
+    if samples is None:
+        header, sample = collect.make_sampler(wide, top_n)
+        samples = collect.iter_samples(duration, interval, sample)
+    header = header or collect.HEADER
+    producer = threading.Thread(target=_produce, args=(samples, sample_queue), daemon=True)
+
+    lateness = ingestion['allowed_lateness_seconds'] if ingestion else 0
+    duplicates = ingestion['duplicates'] if ingestion else "keep"
+    aggregator = aggregate.WindowAggregator(window_sizes, percentiles, lateness)
+    outputs = {window: storage.output_path(output_dir, window, fmt) for window in window_sizes}
+    written = {window: False for window in window_sizes}
+    sketches_written = {window: False for window in window_sizes}
+    anomaly_metrics = anomalies['metrics'] if anomalies else []
+    trackers = {(window, metric): anomaly.AnomalyTracker(metric, anomalies) for window in window_sizes for metric in anomaly_metrics}
+    last_timestamp = None
+    raw_writer = collect.BufferedCsvWriter(raw_path) if raw_path else contextlib.nullcontext()
+
+    def emit(closed):
+        for window, partials in closed.items():
+            if partials.empty:
+                continue
+            rows = aggregate.finalize(partials, thresholds)
+            storage.write_frame(rows, outputs[window], append=written[window])
+            written[window] = True
+            for _, row in rows.iterrows():
+                finished = metrics.window_closed(window, row)
+                _log_window(window, row)
+                _log_streaks(window, finished)
+                if cache:
+                    cache.window_closed(window, row)
+                for metric in anomaly_metrics:
+                    if metric in row:
+                        intervals = trackers[(window, metric)].update(row[metric], row['window_start'], row['window_end'])
+                        _log_anomalies(window, intervals)
+                        if cache:
+                            cache.anomalies(window, intervals)
+                if on_window:
+                    on_window(window, row)
+            if cache:
+                cache.live(metrics.snapshot())
+        for window, window_sketch in aggregator.take_sketches().items():
+            if not window_sketch.empty:
+                storage.write_frame(window_sketch, storage.sketch_path(outputs[window]), append=sketches_written[window])
+                sketches_written[window] = True
+
+    logging.info(f"Live mode started: {len(window_sizes)} window sizes, sampling every {interval}s")
+    producer.start()
+    with raw_writer as writer:
+        if raw_path:
+            writer.writerow(header)
+        done = False
+        while not done:
+            try:
+                batch = [sample_queue.get(timeout=max(interval, 0.05))]
+            except queue.Empty:
+                # no new samples: close windows the clock has moved past by more than the lateness
+                emit(aggregator.close_until(pd.Timestamp.now() - pd.Timedelta(seconds=interval + lateness)))
+                continue
+            while len(batch) < max_batch:
+                try:
+                    batch.append(sample_queue.get_nowait())
+                except queue.Empty:
+                    break
+            metrics.queue_depth(sample_queue.qsize())
+            if batch[-1] is STOP:
+                batch.pop()
+                done = True
+            if not batch:
+                continue
+            if raw_path:
+                for row in batch:
+                    writer.writerow(row)
+            df = pd.DataFrame(batch, columns=header)
+            with contextlib.redirect_stdout(io.StringIO()) as diagnostics:
+                df, rejections, last_timestamp = ingest.validate_metrics(df, last_timestamp, lateness, duplicates, return_newest=True)
+            for message in diagnostics.getvalue().splitlines():
+                logging.warning(f"Rejected live sample: {message}")
+            metrics.samples(len(batch), len(rejections))
+            if df.empty:
+                continue
+            emit(aggregator.add(df))
+        emit(aggregator.flush())
+    for (window, _), tracker in trackers.items():
+        intervals = tracker.close()
+        _log_anomalies(window, intervals)
+        if cache:
+            cache.anomalies(window, intervals)
+
+    _log_all_streaks(metrics.close_streaks())
+    producer.join()
+    metrics.write()
+    if cache:
+        cache.live(metrics.snapshot())
+    logging.info(f"Live mode finished: {metrics.snapshot()['samples_accepted']} samples, {sum(metrics.snapshot()['windows_closed'].values())} windows closed")
+    return metrics.snapshot()
+
+def _produce(samples, sample_queue):
+    try:
+        for row in samples:
+            sample_queue.put(row)
+    finally:
+        sample_queue.put(STOP)
+
+def _log_window(window, row):
+    logging.info(f"{window}s window closed: {row['window_start']:%Y-%m-%dT%H:%M:%S} to {row['window_end']:%Y-%m-%dT%H:%M:%S}, samples={row['sample_count']}, avg cpu={row['avg_cpu_total_percent']}%, max memory={row['max_memory_usage_percent']}%")
+    if row['memory_pressure_flag']:
+        logging.warning(f"ALERT memory pressure in {window}s window starting {row['window_start']:%Y-%m-%dT%H:%M:%S}: max memory {row['max_memory_usage_percent']}%")
+    if row['cpu_saturation_flag']:
+        logging.warning(f"ALERT CPU saturation in {window}s window starting {row['window_start']:%Y-%m-%dT%H:%M:%S}: min idle {row['min_cpu_idle_percent']}%")
+
+def _log_streaks(window, streaks):
+    for name, streak in streaks:
+        logging.info(f"{name.replace('_', ' ')} streak in {window}s windows ended: {streak['start']} to {streak['end']}, {streak['windows']} windows")
+
+def _log_all_streaks(streaks):
+    for window, finished in streaks.items():
+        _log_streaks(window, finished)
+
+def _log_anomalies(window, intervals):
+    for interval in intervals:
+        logging.warning(f"ALERT anomaly in {window}s windows: {interval['metric']} from {interval['start']} to {interval['end']} ({', '.join(interval['detectors'])}), peak {interval['peak_value']}")
+
+"""
+Counters exported by live mode: samples accepted/rejected, windows closed per size,
+closed-window latency (seconds from the window's end boundary to its emission), queue
+depth, and per window size the flag streaks and top_k CPU peaks so far. Thread safe;
+snapshot() returns a JSON-serializable copy.
+"""
+class LiveMetrics:
+    def __init__(self, window_sizes, path=None, top_k=5):
+        self.path = path
+        self._lock = threading.Lock()
+        self._samples_accepted = 0
+        self._samples_rejected = 0
+        self._queue_depth = 0
+        self._max_queue_depth = 0
+        self._windows_closed = {window: 0 for window in window_sizes}
+        self._last_latency = {window: None for window in window_sizes}
+        self._max_latency = {window: 0.0 for window in window_sizes}
+        self._total_latency = {window: 0.0 for window in window_sizes}
+        self._streaks = {window: {name: kernels.StreakTracker() for name in STREAK_FLAGS} for window in window_sizes}
+        self._peaks = {window: kernels.TopKTracker(top_k) for window in window_sizes}
+
+    def samples(self, received, rejected):
+        with self._lock:
+            self._samples_accepted += received - rejected
+            self._samples_rejected += rejected
+
+    def queue_depth(self, depth):
+        with self._lock:
+            self._queue_depth = depth
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+
+    """
+    Returns:
+        list[tuple[str, dict]]: (name, streak) of every streak this window ended
+    """
+    def window_closed(self, window, row):
+        window_close = pd.Timestamp(row['window_start']).floor(f"{window}s") + pd.Timedelta(seconds=window)
+        latency = max((pd.Timestamp.now() - window_close).total_seconds(), 0.0)
+        finished = []
+        with self._lock:
+            self._windows_closed[window] += 1
+            self._last_latency[window] = latency
+            self._max_latency[window] = max(self._max_latency[window], latency)
+            self._total_latency[window] += latency
+            for name, column in STREAK_FLAGS.items():
+                streak = self._streaks[window][name].update(bool(row[column]), row['window_start'], row['window_end'])
+                if streak:
+                    finished.append((name, streak))
+            self._peaks[window].update(float(row['avg_cpu_total_percent']), row['window_start'], row['window_end'])
+        self.write()
+        return finished
+
+    """
+    Ends the streaks still running when live mode stops.
+
+    Returns:
+        dict[int, list[tuple[str, dict]]]: (name, streak) of every streak ended, per window size
+    """
+    def close_streaks(self):
+        with self._lock:
+            return {
+                window: [(name, streak) for name, tracker in trackers.items() if (streak := tracker.close())]
+                for window, trackers in self._streaks.items()
+            }
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "samples_accepted": self._samples_accepted,
+                "samples_rejected": self._samples_rejected,
+                "queue_depth": self._queue_depth,
+                "max_queue_depth": self._max_queue_depth,
+                "windows_closed": {str(w): n for w, n in self._windows_closed.items()},
+                "window_latency_seconds": {
+                    str(w): {
+                        "last": self._last_latency[w],
+                        "max": self._max_latency[w],
+                        "avg": self._total_latency[w] / self._windows_closed[w] if self._windows_closed[w] else None,
+                    }
+                    for w in self._windows_closed
+                },
+                "streaks": {
+                    str(w): {name: {"longest": tracker.longest, "count": tracker.count} for name, tracker in trackers.items()}
+                    for w, trackers in self._streaks.items()
+                },
+                "peaks": {str(w): tracker.peaks() for w, tracker in self._peaks.items()},
+            }
+
+    def write(self):
+        if self.path:
+            # written to a temporary file and renamed, so a reader never sees a half-written file
+            partial = self.path + ".tmp"
+            with open(partial, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(partial, self.path)
@@ -0,0 +1,325 @@
+"""
+Time-range queries over processed windows and raw samples.
+
+Processed datasets are sorted by window_start. Columnar datasets are memory-mapped and
+the requested range is found by binary search, so only the rows in the range are read
+(see storage.read_frame). CSV files (processed exports and raw samples) get a sparse
+index: the timestamp and byte offset of every INDEX_EVERY-th row, saved next to the
+file as <file>.index.npz and extended as the file grows. A range query reads only the
+bytes between the two index entries around the range.
+
+Of the processed window sizes on disk, a query uses the coarsest one that divides the
+requested granularity (by default: that divides both range bounds, so every window is
+fully inside the range). Rows are rolled up to the granularity when it is coarser.
+"""
+import io
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+from pipeline import aggregate, settings, sketch, storage
+
+INDEX_EVERY = 1000
+INDEX_BLOCK_BYTES = 64 * 2**20
+# bytes of the file head, and before the indexed end, remembered to notice a rewritten file
+FINGERPRINT_BYTES = 4096
+TAIL_BYTES = 256
+
+"""
+Processed window sizes available in an output directory. When a window exists in both
+formats the columnar dataset is used.
+
+Returns:
+    dict[int, str]: window size -> dataset path, sorted by window size
+"""
+def available_windows(output_dir):
+    found = {}
+    for fmt in reversed(storage.FORMATS):
+        extension = re.escape(storage.EXTENSIONS[fmt])
+        for name in os.listdir(f"{output_dir}/processed"):
+            match = re.fullmatch(r"metrics_(\d+)s" + extension, name)
+            if match:
+                found[int(match.group(1))] = f"{output_dir}/processed/{name}"
+    return dict(sorted(found.items()))
+
+"""
+Picks the coarsest available window that divides the granularity in seconds. Without a
+granularity, the coarsest window that divides both range bounds (epoch-aligned) is used,
+so that every window lies fully inside the range; if none does, the finest window.
+
+Returns:
+    int: window size in seconds
+"""
+def choose_window(windows, start, end, granularity=None):
+    if granularity is not None:
+        fitting = [window for window in windows if granularity % window == 0]
+        if not fitting:
+            raise ValueError(f"No processed window size divides a granularity of {granularity}s (available: {list(windows)})")
+        return max(fitting)
+    start_s = pd.Timestamp(start).as_unit("ns").value // aggregate.NS_PER_SECOND
+    end_s = pd.Timestamp(end).as_unit("ns").value // aggregate.NS_PER_SECOND
+    aligned = [window for window in windows if start_s % window == 0 and end_s % window == 0]
+    return max(aligned) if aligned else min(windows)
+
+"""
+Processed windows starting in [start, end), at the resolution of the chosen window or
+rolled up to granularity, plus a summary of the whole range (including percentiles
+merged from the window sketches when they exist).
+
+Returns:
+    dict: window (int), granularity (int), source (str), rows (dataframe), summary (dict)
+"""
+def query(output_dir, start, end, granularity=None, config=None):
+    percentiles = (config or settings.load())['percentiles']
+    windows = available_windows(output_dir)
+    if not windows:
+        raise FileNotFoundError(f"No processed datasets in {output_dir}/processed")
+    window = choose_window(windows, start, end, granularity)
+    source = windows[window]
+    rows = read_range(source, start, end)
+    window_sketch = read_sketch_range(source, window, rows)
+
+    granularity = granularity or window
+    rows, window_sketch = rollup_range(rows, window_sketch, window, granularity, percentiles)
+
+    summary = summarize_rows(rows)
+    if window_sketch is not None:
+        exact = sketch.is_exact(granularity, percentiles) and sketch.is_exact(window, percentiles)
+        summary['percentiles'] = sketch.percentile_summary(window_sketch, percentiles['quantiles'], exact, percentiles['relative_accuracy'])
+    return {"window": window, "granularity": granularity, "source": source, "rows": rows, "summary": summary}
+
+"""
+Rows of a processed dataset with window_start in [start, end).
+
+Returns:
+    dataframe: processed windows
+"""
+def read_range(path, start, end):
+    if storage.is_columnar(path):
+        return storage.read_frame(path, start=start, end=end)
+    rows = read_csv_range(path, start, end)
+    rows['window_end'] = pd.to_datetime(rows['window_end'])
+    return rows
+
+"""
+Sketch rows of the given processed windows, or None if the dataset has no sketch.
+
+Returns:
+    dataframe | None: sketch rows
+"""
+def read_sketch_range(path, window, rows):
+    sketch_path = storage.sketch_path(path)
+    if not storage.exists(sketch_path):
+        return None
+    buckets = aggregate.bucket_starts(rows['window_start'], window)
+    if len(buckets) == 0:
+        return sketch.empty()
+    window_sketch = storage.read_frame(sketch_path, start=int(buckets[0]), end=int(buckets[-1]) + 1, on="bucket")
+    return window_sketch[window_sketch['bucket'].isin(buckets)].reset_index(drop=True)
+
+"""
+Rolls processed windows of one size and their sketch (None if there is none) up into a
+coarser granularity. Percentile columns are recomputed from the rolled-up sketch; an
+exact sketch becomes a binned one when the granularity is past exact_max_window
+(percentiles: the percentiles section of the config).
+
+Returns:
+    dataframe: one row per granularity window
+    dataframe | None: sketch of the granularity windows
+"""
+def rollup_range(rows, window_sketch, window, granularity, percentiles):
+    if granularity == window:
+        return rows, window_sketch
+    rows = rollup_rows(rows, granularity)
+    if window_sketch is None:
+        return rows, None
+    exact = sketch.is_exact(window, percentiles)
+    if exact and not sketch.is_exact(granularity, percentiles):
+        window_sketch = sketch.to_bins(window_sketch, percentiles['relative_accuracy'])
+        exact = False
+    window_sketch = sketch.rollup(window_sketch, granularity)
+    quantiles = sketch.quantiles(window_sketch, percentiles['quantiles'], exact, percentiles['relative_accuracy'])
+    quantiles = quantiles.reindex(aggregate.bucket_starts(rows['window_start'], granularity)).reset_index(drop=True)
+    return pd.concat([rows, quantiles], axis=1), window_sketch
+
+"""
+Rolls processed windows up into coarser windows: avg_ columns are averaged weighted by
+sample count, min_/max_ columns and flags keep their extreme. Percentile columns are
+dropped (query recomputes them from the rolled-up sketches).
+
+Returns:
+    dataframe: one row per granularity window
+"""
+def rollup_rows(rows, granularity):
+    weights = rows['sample_count'].to_numpy(dtype=float)
+    columns = {}
+    weighted = {}
+    for column in rows.columns:
+        if column.startswith("avg_"):
+            weighted[column] = rows[column] * weights
+            columns[column] = "sum"
+        elif column.startswith("min_") or column == "window_start":
+            columns[column] = "min"
+        elif column.startswith("max_") or column.endswith("_flag") or column == "window_end":
+            columns[column] = "max"
+        elif column == "sample_count":
+            columns[column] = "sum"
+    grouped = rows.assign(**weighted).groupby(aggregate.bucket_starts(rows['window_start'], granularity), sort=True)
+    rolled = grouped.agg(columns)
+    for column in weighted:
+        rolled[column] = (rolled[column] / rolled['sample_count']).round(1)
+    return rolled.reset_index(drop=True)[list(columns)]
+
+"""
+Aggregates of a range of processed windows.
+
+Returns:
+    dict: JSON-serializable summary
+"""
+def summarize_rows(rows):
+    if rows.empty:
+        return {"windows": 0, "samples": 0, "start": None, "end": None}
+    weights = rows['sample_count'].to_numpy(dtype=float)
+    return {
+        "windows": len(rows),
+        "samples": int(weights.sum()),
+        "start": rows['window_start'].min().strftime(storage.CSV_DATE_FORMAT),
+        "end": rows['window_end'].max().strftime(storage.CSV_DATE_FORMAT),
+        "avg_cpu_total_percent": round(float(np.average(rows['avg_cpu_total_percent'], weights=weights)), 1),
+        "max_cpu_total_percent": float(rows['avg_cpu_total_percent'].max()),
+        "min_cpu_idle_percent": float(rows['min_cpu_idle_percent'].min()),
+        "max_memory_usage_percent": float(rows['max_memory_usage_percent'].max()),
+        "avg_disk_usage_percent": round(float(np.average(rows['avg_disk_usage_percent'], weights=weights)), 1),
+        "memory_pressure_windows": int(rows['memory_pressure_flag'].sum()),
+        "cpu_saturation_windows": int(rows['cpu_saturation_flag'].sum()),
+    }
+
+"""
+Rows of a CSV whose first column is a timestamp (raw samples or processed windows)
+with that timestamp in [start, end). Only the bytes between the sparse index entries
+around the range are read; rows are assumed to be in time order.
+
+Returns:
+    dataframe: rows in range, first column parsed as timestamps
+"""
+def read_csv_range(path, start, end):
+    index = csv_index(path)
+    timestamps = np.maximum.accumulate(index['timestamps']) if len(index['timestamps']) else index['timestamps']
+    start_ns = pd.Timestamp(start).as_unit("ns").value
+    end_ns = pd.Timestamp(end).as_unit("ns").value
+    # start before every entry equal to start: duplicates of it may precede that entry
+    first = np.searchsorted(timestamps, start_ns, side="left") - 1
+    last = np.searchsorted(timestamps, end_ns, side="left")
+    lo = index['offsets'][first] if first >= 0 else index['data_offset']
+    hi = index['offsets'][last] if last < len(index['offsets']) else index['indexed_to']
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(lo)
+        data = f.read(max(hi - lo, 0))
+    if not data:
+        return pd.read_csv(io.BytesIO(header))
+    df = pd.read_csv(io.BytesIO(header + data))
+    key = df.columns[0]
+    df[key] = pd.to_datetime(df[key], format="ISO8601", errors="coerce")
+    in_range = (df[key] >= pd.Timestamp(start)) & (df[key] < pd.Timestamp(end))
+    return df[in_range].reset_index(drop=True)
+
+"""
+Loads the sparse index of a CSV, building it on first use and extending it when rows
+were appended. If the file shrank (an incremental run rewrote its last rows) the entries
+past the new end are dropped and the rest is rescanned; a replaced file is re-indexed.
+
+Returns:
+    dict: timestamps (int64 ns) and offsets of every INDEX_EVERY-th row, data_offset
+    (end of the header) and indexed_to (end of the last complete line indexed)
+"""
+def csv_index(path):
+    index_path = path + ".index.npz"
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(0)
+        fingerprint = np.frombuffer(f.read(FINGERPRINT_BYTES), dtype=np.uint8)
+
+    index = None
+    if os.path.exists(index_path):
+        with np.load(index_path) as saved:
+            index = {name: saved[name] for name in saved.files}
+        known = min(int(index['fingerprint_size']), len(fingerprint))
+        if not np.array_equal(index['fingerprint'][:known], fingerprint[:known]):
+            index = None
+        elif int(index['indexed_to']) <= size and not np.array_equal(index['tail'], _tail(path, int(index['indexed_to']))):
+            index = None  # rewritten rather than appended to
+    if index is None:
+        index = {"timestamps": np.empty(0, dtype=np.int64), "offsets": np.empty(0, dtype=np.int64), "rows": np.empty(0, dtype=np.int64), "indexed_to": len(header), "row_count": 0}
+    elif int(index['indexed_to']) > size:
+        # rescan from the last entry that still starts inside the file
+        last = int(np.count_nonzero(index['offsets'] < size)) - 1
+        if last >= 0:
+            index['indexed_to'], index['row_count'] = int(index['offsets'][last]), int(index['rows'][last])
+        else:
+            index['indexed_to'], index['row_count'] = len(header), 0
+        for name in ("timestamps", "offsets", "rows"):
+            index[name] = index[name][:max(last, 0)]
+
+    saved_to = int(index['indexed_to']) if 'fingerprint' in index else None
+    if int(index['indexed_to']) != size:
+        index = _extend_index(path, index, size)
+    if int(index['indexed_to']) != saved_to:
+        np.savez(index_path, timestamps=index['timestamps'], offsets=index['offsets'], rows=index['rows'],
+                 indexed_to=index['indexed_to'], row_count=index['row_count'],
+                 fingerprint=fingerprint, fingerprint_size=len(fingerprint), tail=_tail(path, int(index['indexed_to'])))
+    index['data_offset'] = len(header)
+    index['indexed_to'] = int(index['indexed_to'])
+    return index
+
+def _tail(path, end):
+    with open(path, "rb") as f:
+        f.seek(max(end - TAIL_BYTES, 0))
+        return np.frombuffer(f.read(end - max(end - TAIL_BYTES, 0)), dtype=np.uint8)
+
+def _extend_index(path, index, size):
+    position = int(index['indexed_to'])
+    row_count = int(index['row_count'])
+    timestamps = [index['timestamps']]
+    offsets = [index['offsets']]
+    rows = [index['rows']]
+    block = INDEX_BLOCK_BYTES
+    with open(path, "rb") as f:
+        while position < size:
+            f.seek(position)
+            data = f.read(min(block, size - position))
+            line_ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n"))
+            if len(line_ends) == 0:
+                if position + len(data) >= size:
+                    break  # only an incomplete last line is left
+                block *= 2
+                continue
+            starts = np.concatenate(([0], line_ends[:-1] + 1))
+            ordinals = row_count + np.arange(len(starts))
+            sampled = ordinals % INDEX_EVERY == 0
+            values = [data[start:data.find(b",", start)].decode() for start in starts[sampled]]
+            parsed = pd.to_datetime(pd.Series(values, dtype=object), format="ISO8601", errors="coerce")
+            valid = ~parsed.isna().to_numpy()
+            timestamps.append(parsed.to_numpy(dtype="datetime64[ns]").view("int64")[valid])
+            offsets.append(position + starts[sampled][valid])
+            rows.append(ordinals[sampled][valid])
+            position += int(line_ends[-1]) + 1
+            row_count += len(starts)
+    return {
+        "timestamps": np.concatenate(timestamps).astype(np.int64),
+        "offsets": np.concatenate(offsets).astype(np.int64),
+        "rows": np.concatenate(rows).astype(np.int64),
+        "indexed_to": position,
+        "row_count": row_count,
+    }
+
+"""
+Formats a query result for the command line.
+
+Returns:
+    str: JSON with the chosen window, granularity, source and range summary
+"""
+def format_result(result):
+    return json.dumps({key: result[key] for key in ("window", "granularity", "source", "summary")}, indent=2)
@@ -0,0 +1,208 @@
+"""
+Retention tiers and compaction of processed windows and raw samples.
+
+The retention section of config.yaml says how long raw samples and each processed
+window size (a tier) are kept. compact() first brings every tier up to date, then
+deletes what has expired:
+
+1. Each tier is rolled up from the largest finer tier that divides it, the same way a
+   range query rolls windows up to a coarser granularity (query.rollup_range):
+   sample-weighted averages, extremes of min_/max_ columns and flags, and percentiles
+   from the merged sketches. A window is added once the source has rows past its end,
+   and only after the last window already in the tier, so a tier that the
+   transformation stage also writes is never duplicated.
+2. Windows older than a tier's retention are removed from the head of its dataset and
+   sketch, but never before the coarser tiers rolled up from it cover them.
+3. Raw samples older than raw_days are removed from the head of the input CSV, as far
+   as the finest processed windows have closed over them and incremental runs have
+   consumed them.
+
+The offsets in incremental state files are moved back by what was removed, so
+--incremental runs carry on where they were. A full (non-incremental) run rewrites the
+processed datasets from the raw samples that are left, so after compaction keep using
+--incremental. Do not compact while another run is writing to the same files.
+"""
+import glob
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+from pipeline import aggregate, instrument, query, settings, storage, transform
+
+"""
+Rolls every tier up from its source tier and deletes expired windows and raw samples.
+now defaults to the current local time (the time base of collected samples); policy to
+the retention section of config (by default settings.load()).
+
+Returns:
+    dict: per tier the windows rolled up and expired, and the raw samples expired
+"""
+def compact(output_dir, raw_path=None, now=None, policy=None, config=None):
+    config = config or settings.load()
+    policy = policy or config['retention']
+    now = pd.Timestamp(now) if now is not None else pd.Timestamp.now()
+    tiers = {int(window): days for window, days in policy['tiers'].items()}
+    plan = tier_plan(tiers)
+    datasets = query.available_windows(output_dir) if os.path.isdir(f"{output_dir}/processed") else {}
+    report = {window: {"rolled_up": 0, "expired": 0} for window in sorted(tiers)}
+
+    for window, source in plan:
+        if source not in datasets:
+            continue
+        path = datasets.get(window, _tier_path(datasets[source], window))
+        report[window]['rolled_up'] = roll_up_tier(datasets[source], source, path, window, config['percentiles'])
+        if storage.exists(path):
+            datasets[window] = path
+
+    for window, days in sorted(tiers.items()):
+        if days is None or window not in datasets:
+            continue
+        cut = now - pd.Timedelta(days=days)
+        for coarse, source in plan:
+            if source == window:
+                cut = min(cut, _covered_until(datasets.get(coarse), coarse))
+        report[window]['expired'] = expire_windows(datasets[window], cut)
+
+    if raw_path and policy.get('raw_days') is not None and os.path.exists(raw_path) and datasets:
+        closed_until = _last_start(datasets[min(datasets)])
+        if closed_until is not None:
+            cut = min(now - pd.Timedelta(days=policy['raw_days']), closed_until)
+            report['raw'] = {"expired": expire_raw(output_dir, raw_path, cut, datasets)}
+
+    _log_report(report)
+    instrument.record("compaction", rows_out=sum(counts.get('rolled_up', 0) for counts in report.values()), rows_expired=sum(counts['expired'] for counts in report.values()))
+    return report
+
+"""
+Orders the tiers so each is rolled up from the largest finer tier that divides it.
+
+Returns:
+    list[tuple[int, int]]: (tier, source tier) pairs, sources always come first
+"""
+def tier_plan(tiers):
+    finest = min(tiers)
+    misaligned = [window for window in tiers if window % finest]
+    if misaligned:
+        raise ValueError(f"Retention tiers {misaligned} are not multiples of the finest tier ({finest}s)")
+    return aggregate.rollup_plan(finest, tiers)
+
+"""
+Appends the complete windows of the source tier that the target tier does not have
+yet, rolled up to the target's window size, together with their sketch.
+
+Returns:
+    int: windows added to the target tier
+"""
+def roll_up_tier(source_path, source, path, window, percentiles):
+    source_last = _last_start(source_path)
+    if source_last is None:
+        return 0
+    start = _covered_until(path, window)
+    # the window holding the source's last (possibly still open) row is not complete
+    end = source_last.floor(f"{window}s")
+    if start >= end:
+        return 0
+    rows = query.read_range(source_path, start, end)
+    if rows.empty:
+        return 0
+    rows, window_sketch = query.rollup_range(rows, query.read_sketch_range(source_path, source, rows), source, window, percentiles)
+    appending = storage.exists(path)
+    storage.write_frame(rows[_columns(path)] if appending else rows, path, append=appending)
+    if window_sketch is not None:
+        sketch_path = storage.sketch_path(path)
+        storage.write_frame(window_sketch, sketch_path, append=storage.exists(sketch_path))
+    return len(rows)
+
+"""
+Removes the windows starting before cut, and their sketch rows, from a processed dataset.
+
+Returns:
+    int: windows removed
+"""
+def expire_windows(path, cut):
+    count = len(storage.read_frame(path, columns=["window_start"], end=cut))
+    if count == 0:
+        return 0
+    removed = _drop(path, count)
+    removed_sketch = 0
+    sketch_path = storage.sketch_path(path)
+    if storage.exists(sketch_path):
+        first_kept = -(-pd.Timestamp(cut).as_unit("ns").value // aggregate.NS_PER_SECOND)
+        removed_sketch = _drop(sketch_path, len(storage.read_frame(sketch_path, columns=["bucket"], end=first_kept, on="bucket")))
+    transform.shift_state(path, rows=removed, sketch_rows=removed_sketch)
+    return count
+
+"""
+Removes the leading raw samples with a timestamp before cut from the input CSV. Rows an
+incremental run has not consumed yet are kept whatever their timestamp.
+
+Returns:
+    int: raw samples removed
+"""
+def expire_raw(output_dir, raw_path, cut, datasets):
+    consumed = _consumed_bytes(output_dir, raw_path)
+    with open(raw_path, "rb") as f:
+        header = f.readline()
+        data = f.read(consumed - len(header) if consumed is not None else -1)
+    line_ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n"))
+    if len(line_ends) == 0:
+        return 0
+    starts = np.concatenate(([0], line_ends[:-1] + 1))
+    values = [data[start:end].split(b",", 1)[0].decode() for start, end in zip(starts, line_ends)]
+    timestamps = pd.to_datetime(pd.Series(values, dtype=object), format="ISO8601", errors="coerce")
+    keep = (timestamps >= cut).to_numpy()
+    count = int(np.argmax(keep)) if keep.any() else len(line_ends)
+    if count == 0:
+        return 0
+    removed = _drop(raw_path, count)
+    for path in datasets.values():
+        transform.shift_state(path, input_path=raw_path, input_bytes=removed)
+    return count
+
+# drops rows from the head of a dataset, returns how far its position moved back
+def _drop(path, count):
+    before = storage.position(path)
+    storage.drop_rows(path, count)
+    return before - storage.position(path)
+
+def _tier_path(source_path, window):
+    root, extension = os.path.splitext(source_path)
+    return f"{os.path.dirname(root)}/metrics_{window}s{extension}"
+
+def _last_start(path):
+    if path is None or not storage.exists(path):
+        return None
+    if storage.is_columnar(path):
+        starts = storage.open_columns(path)['window_start']
+    else:
+        starts = storage.read_frame(path, columns=["window_start"])['window_start'].to_numpy()
+    return pd.Timestamp(starts[-1]) if len(starts) else None
+
+# end of the last window a tier holds; nothing before it can be lost from the finer tier.
+# window_start is the window's first sample, so the end comes from its epoch bucket
+def _covered_until(path, window):
+    last = _last_start(path)
+    return last.floor(f"{window}s") + pd.Timedelta(seconds=window) if last is not None else pd.Timestamp(0)
+
+def _columns(path):
+    if storage.is_columnar(path):
+        return list(storage.open_columns(path))
+    return list(pd.read_csv(path, nrows=0).columns)
+
+# bytes of the input consumed by every incremental run writing to output_dir, None if there are none
+def _consumed_bytes(output_dir, raw_path):
+    offsets = []
+    for state_path in glob.glob(f"{output_dir}/processed/*.state.json"):
+        with open(state_path) as f:
+            state = json.load(f)
+        if state['input_path'] == os.path.abspath(raw_path):
+            offsets.append(state['input_offset'])
+    return min(offsets) if offsets else None
+
+def _log_report(report):
+    for window, counts in report.items():
+        if window == "raw":
+            logging.info(f"Raw samples: {counts['expired']} expired")
+        else:
+            logging.info(f"{window}-second tier: {counts['rolled_up']} windows rolled up, {counts['expired']} expired")
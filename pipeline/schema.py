@@ -0,0 +1,101 @@
+"""
+Declarative schema for raw metric columns.
+
+Columns are declared in groups, either by explicit name or by a regular expression
+that matches any number of columns (one per CPU, mounted disk or top process).
+Each group carries its validation rule and AGGREGATES declares the partial aggregates
+the transformation keeps per column pattern, so ingest and transform handle hundreds
+of columns without per-column code: validation runs one mask over each group's value
+matrix and aggregation reduces every column of the same kind in one groupby call.
+"""
+import re
+from functools import lru_cache
+
+"""
+Validation groups in the order their rules run (and their diagnostics are printed).
+
+kind:
+    range     every value must lie in [min, max] (max None = unbounded); null values are
+              rejected unless nullable is set
+    sum_max   the row sum of the group's columns must not exceed max
+"""
+COLUMN_GROUPS = [
+    {"name": "cpu", "columns": ["cpu_user_percent", "cpu_system_percent", "cpu_idle_percent"], "kind": "range", "min": 0, "max": 100},
+    {"name": "cpu_total", "columns": ["cpu_user_percent", "cpu_system_percent", "cpu_idle_percent"], "kind": "sum_max", "max": 100.1, "message": "CPU percentages do not sum to 100 at row {row}: total={total}"},
+    {"name": "memory", "columns": ["memory_used_percent"], "kind": "range", "min": 0, "max": 100},
+    {"name": "disk", "columns": ["disk_used_percent"], "kind": "range", "min": 0, "max": 100},
+    {"name": "per_cpu", "pattern": r"cpu\d+_(user|system|idle)_percent", "kind": "range", "min": 0, "max": 100},
+    {"name": "per_disk", "pattern": r"disk_.+_used_percent", "kind": "range", "min": 0, "max": 100},
+    {"name": "io_rates", "pattern": r"(disk_read|disk_write|net_sent|net_recv)_bytes_per_s", "kind": "range", "min": 0, "max": None},
+    {"name": "top_processes", "pattern": r"top_(rss_\d+_rss_mb|cpu_\d+_percent)", "kind": "range", "min": 0, "max": None, "nullable": True},
+]
+
+# partial aggregates kept per window for columns beyond the base schema, by column pattern (first match wins)
+AGGREGATES = [
+    (r"cpu\d+_(user|system)_percent", ["sum", "max"]),
+    (r"cpu\d+_idle_percent", ["min"]),
+    (r"disk_.+_used_percent", ["max"]),
+    (r"(disk_read|disk_write|net_sent|net_recv)_bytes_per_s", ["sum", "max"]),
+    (r"top_(rss_\d+_rss_mb|cpu_\d+_percent)", ["max"]),
+]
+
+# metrics kept as quantile sketches per window (see pipeline.sketch): name -> raw columns summed per sample
+SKETCHES = {
+    "cpu_total_percent": ["cpu_user_percent", "cpu_system_percent"],
+    "memory_used_percent": ["memory_used_percent"],
+}
+
+# partial aggregates of the original six-column schema, always computed
+BASE_PARTIALS = [("sum", "cpu_user_percent"), ("sum", "cpu_system_percent"), ("min", "cpu_idle_percent"), ("max", "memory_used_percent"), ("sum", "disk_used_percent")]
+
+"""
+Resolves the validation groups against the columns of a frame. Groups declared by
+name are always present (a missing required column raises KeyError downstream);
+pattern groups are dropped when nothing matches.
+
+Returns:
+    list[dict]: groups with their concrete column lists
+"""
+@lru_cache(maxsize=32)
+def resolve_groups(columns):
+    resolved = []
+    for group in COLUMN_GROUPS:
+        if "columns" in group:
+            matched = list(group["columns"])
+        else:
+            matched = [column for column in columns if re.fullmatch(group["pattern"], column)]
+        if matched:
+            resolved.append(dict(group, columns=matched))
+    return resolved
+
+"""
+Partial aggregates to keep for a frame's columns: the base schema's plus those declared
+in AGGREGATES for every extra column.
+
+Returns:
+    list[tuple[str, str]]: (reduction, source column) pairs
+"""
+@lru_cache(maxsize=32)
+def partial_spec(columns):
+    spec = list(BASE_PARTIALS)
+    base_columns = {column for _, column in BASE_PARTIALS}
+    for column in columns:
+        if column in base_columns:
+            continue
+        for pattern, reductions in AGGREGATES:
+            if re.fullmatch(pattern, column):
+                spec.extend((reduction, column) for reduction in reductions)
+                break
+    return spec
+
+"""
+All numeric columns covered by the schema, in frame order.
+
+Returns:
+    list[str]: column names
+"""
+def numeric_columns(columns):
+    seen = []
+    for group in resolve_groups(tuple(columns)):
+        seen.extend(column for column in group["columns"] if column not in seen)
+    return seen
@@ -0,0 +1,251 @@
+"""
+Local HTTP endpoint for the latest results (main.py --serve).
+
+GET /metrics        Prometheus text exposition format (version 0.0.4)
+GET /metrics.json   the same data as JSON
+
+Both are served from a MetricsCache. The pipeline pushes into the cache as results
+appear: every closed window in live mode, the last window of each processed dataset
+and its anomaly intervals after a batch run, live counters, and stage timings through
+pipeline.instrument. Every update renders both documents once, under the cache's lock,
+and swaps them in; a scrape only reads the rendered bytes, so it never recomputes
+anything and concurrent scrapers do not wait on each other or on the pipeline.
+
+The server is the standard library ThreadingHTTPServer (one thread per connection,
+HTTP/1.1 keep-alive) running in a daemon thread. Port 0 picks a free port, which is
+how the tests run it.
+"""
+import json
+import logging
+import math
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from pipeline import storage
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+JSON_CONTENT_TYPE = "application/json"
+PREFIX = "metrics_pipeline"
+
+"""
+Latest pipeline results, pre-rendered as Prometheus text and JSON. Thread safe: the
+pipeline updates it from its own thread while the server threads read rendered().
+"""
+class MetricsCache:
+    def __init__(self, recent_anomalies=20):
+        self.recent_anomalies = recent_anomalies
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._window_lines = {}
+        self._windows_closed = {}
+        self._anomalies = {}
+        self._anomaly_counts = {}
+        self._live = None
+        self._stages = []
+        self._render()
+
+    """
+    Publishes the latest closed window of a window size (a row of a processed dataset).
+    count is the number of windows it stands for, more than one after a batch run.
+    """
+    def window_closed(self, window, row, count=1):
+        latest = {column: _json_value(value) for column, value in row.items()}
+        # only this window's series change, so its sample lines are formatted once here
+        values = [({"window": window, "column": column}, value) for column, value in latest.items()
+                  if not column.endswith("_flag") and (isinstance(value, (int, float)) or value is None)]
+        flags = [({"window": window, "flag": column[:-len("_flag")]}, value) for column, value in latest.items() if column.endswith("_flag")]
+        lines = (_sample_lines("window_value", values), _sample_lines("window_flag", flags))
+        with self._lock:
+            self._windows[window] = latest
+            self._window_lines[window] = lines
+            self._windows_closed[window] = self._windows_closed.get(window, 0) + count
+            self._render()
+
+    """
+    Publishes finished anomaly intervals (see pipeline.anomaly) of a window size; the
+    most recent recent_anomalies are kept.
+    """
+    def anomalies(self, window, intervals):
+        if not intervals:
+            return
+        with self._lock:
+            recent = self._anomalies.setdefault(window, [])
+            recent.extend(intervals)
+            del recent[:-self.recent_anomalies]
+            for interval in intervals:
+                key = (window, interval['metric'])
+                self._anomaly_counts[key] = self._anomaly_counts.get(key, 0) + 1
+            self._render()
+
+    """
+    Publishes the live mode counters (LiveMetrics.snapshot()).
+    """
+    def live(self, snapshot):
+        with self._lock:
+            self._live = snapshot
+            self._render()
+
+    """
+    Publishes stage timings and counters (the stages of an instrument.RunReport);
+    passed to instrument.start_run as on_record.
+    """
+    def stages(self, stages):
+        with self._lock:
+            self._stages = stages
+            self._render()
+
+    """
+    Returns:
+        tuple[bytes, bytes]: the Prometheus text and the JSON document, as of the last update
+    """
+    def rendered(self):
+        return self._rendered
+
+    # called with the lock held; the tuple is swapped in whole, so readers need no lock
+    def _render(self):
+        document = {
+            "updated": datetime.now().isoformat(timespec="seconds"),
+            "windows": {
+                str(window): {"closed": self._windows_closed[window], "latest": latest}
+                for window, latest in sorted(self._windows.items())
+            },
+            "anomalies": {str(window): list(intervals) for window, intervals in sorted(self._anomalies.items())},
+            "live": self._live,
+            "stages": self._stages,
+        }
+        self._rendered = (self._prometheus().encode(), json.dumps(document).encode())
+
+    def _prometheus(self):
+        lines = []
+        windows = sorted(self._window_lines)
+        _add_lines(lines, "window_value", "gauge", "Latest closed window, one series per processed column",
+                   [line for window in windows for line in self._window_lines[window][0]])
+        _add_lines(lines, "window_flag", "gauge", "Threshold flags of the latest closed window (1 = raised)",
+                   [line for window in windows for line in self._window_lines[window][1]])
+        _add_metric(lines, "windows_closed_total", "counter", "Windows closed per window size",
+                    [({"window": window}, count) for window, count in sorted(self._windows_closed.items())])
+        _add_metric(lines, "anomaly_intervals_total", "counter", "Anomaly intervals finished per window size and metric",
+                    [({"window": window, "metric": metric}, count) for (window, metric), count in sorted(self._anomaly_counts.items())])
+        if self._live is not None:
+            live = self._live
+            _add_metric(lines, "samples_total", "counter", "Live samples validated",
+                        [({"result": "accepted"}, live['samples_accepted']), ({"result": "rejected"}, live['samples_rejected'])])
+            _add_metric(lines, "queue_depth", "gauge", "Live samples waiting to be processed", [({}, live['queue_depth'])])
+            _add_metric(lines, "window_latency_seconds", "gauge", "Seconds from a window's end to its emission in live mode",
+                        [({"window": window, "stat": stat}, value) for window, latency in live['window_latency_seconds'].items() for stat, value in latency.items()])
+        for key, help_text in [("wall_seconds", "Wall time of the stage"), ("cpu_seconds", "CPU time of the stage"), ("peak_rss_bytes", "Peak resident set size at the end of the stage"),
+                               ("rows_in", "Rows the stage read"), ("rows_out", "Rows the stage produced")]:
+            _add_metric(lines, f"stage_{key}", "gauge", help_text,
+                        [({"stage": stage['name']}, stage[key]) for stage in self._stages if stage.get(key) is not None])
+        return "".join(lines)
+
+"""
+Starts serving the cache on host:port in a daemon thread.
+
+Returns:
+    ThreadingHTTPServer: the running server; server_address holds the bound port
+"""
+def start_server(cache, host="127.0.0.1", port=0):
+    server = _Server((host, port), _handler(cache))
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    server.thread = thread
+    logging.info(f"Serving metrics on http://{server.server_address[0]}:{server.server_address[1]}/metrics (JSON at /metrics.json)")
+    return server
+
+"""
+Keeps serving until interrupted (Ctrl-C), then stops the server.
+"""
+def wait(server):
+    try:
+        while server.thread.is_alive():
+            server.thread.join(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop(server)
+
+def stop(server):
+    server.shutdown()
+    server.server_close()
+
+"""
+Publishes the results of a batch run: the last window of every processed dataset and
+the anomaly intervals of the analytics summaries.
+"""
+def publish_batch(cache, processed_data, summaries):
+    for window, source in processed_data.items():
+        df = storage.load(source)
+        if not df.empty:
+            cache.window_closed(window, df.iloc[-1], count=len(df))
+        cache.anomalies(window, summaries[window]['anomalies']['intervals'])
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # the socketserver default backlog of 5 drops connections when many scrapers arrive at once
+    request_queue_size = 128
+
+def _handler(cache):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/metrics":
+                self._send(200, PROMETHEUS_CONTENT_TYPE, cache.rendered()[0])
+            elif path == "/metrics.json":
+                self._send(200, JSON_CONTENT_TYPE, cache.rendered()[1])
+            else:
+                self._send(404, "text/plain; charset=utf-8", b"Not found: use /metrics or /metrics.json\n")
+
+        def _send(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(f"{self.address_string()} {format % args}")
+
+    return Handler
+
+def _add_metric(lines, name, kind, help_text, samples):
+    _add_lines(lines, name, kind, help_text, _sample_lines(name, samples))
+
+def _add_lines(lines, name, kind, help_text, sample_lines):
+    if sample_lines:
+        lines.append(f"# HELP {PREFIX}_{name} {help_text}\n# TYPE {PREFIX}_{name} {kind}\n")
+        lines.extend(sample_lines)
+
+def _sample_lines(name, samples):
+    sample_lines = []
+    for labels, value in samples:
+        label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+        sample_lines.append(f"{PREFIX}_{name}{{{label_text}}} {_sample_value(value)}\n" if label_text else f"{PREFIX}_{name} {_sample_value(value)}\n")
+    return sample_lines
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _sample_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+def _json_value(value):
+    if isinstance(value, (pd.Timestamp, datetime, np.datetime64)):
+        return pd.Timestamp(value).strftime(storage.CSV_DATE_FORMAT)
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return None if math.isnan(value) else float(value)
+    return value
@@ -0,0 +1,26 @@
+"""
+Central configuration.
+
+config.yaml is parsed once per process, on first use, and the same dict is handed to
+every stage: main.py loads it and passes it down, and stages called directly (tests,
+benchmarks, worker processes) fall back to load(). The YAML parser is only imported
+when a file is actually read, so commands that never need the config (--help) do not
+pay for it.
+"""
+
+DEFAULT_PATH = "config.yaml"
+
+_loaded = {}
+
+"""
+Parses a config file, or returns the dict parsed by an earlier call for the same path.
+
+Returns:
+    dict: configuration
+"""
+def load(path=DEFAULT_PATH):
+    if path not in _loaded:
+        import yaml
+        with open(path, "r") as f:
+            _loaded[path] = yaml.safe_load(f)
+    return _loaded[path]
@@ -0,0 +1,210 @@
+"""
+Mergeable quantile sketches per window.
+
+A sketch is a long-format frame of value counts: one row per (bucket, metric, key)
+with the number of samples that fell on that key. Two representations share it:
+
+exact      key is the sample value itself. Percentiles match numpy's linear
+           interpolation, at the cost of one row per distinct value, so it is used
+           for small windows (up to percentiles.exact_max_window seconds).
+binned     key is a logarithmic bin index as in DDSketch: bin i covers
+           (gamma^(i-1), gamma^i] with gamma = (1 + a) / (1 - a), so any reported
+           percentile is within relative accuracy a of the true value and a sketch of
+           percent metrics never has more than a few hundred rows per window.
+           Values <= 0 share the bin -inf.
+
+Both merge by adding counts of equal keys, so fine windows roll up into coarse ones
+and hosts merge into a fleet without touching the raw samples again. An exact sketch
+converts losslessly to a binned one (to_bins), never the other way round.
+"""
+import numpy as np
+import pandas as pd
+from pipeline import schema
+
+SKETCH_COLUMNS = ["bucket", "metric", "key", "count"]
+METRICS = list(schema.SKETCHES)
+
+"""
+Whether windows of this size keep exact sketches under the percentiles config.
+
+Returns:
+    bool: True for exact sketches
+"""
+def is_exact(window, settings):
+    return window <= settings['exact_max_window']
+
+"""
+Builds the sketches of raw samples, one per window bucket and metric in schema.SKETCHES.
+
+Returns:
+    dataframe: sketch rows (SKETCH_COLUMNS) sorted by bucket, metric and key
+"""
+def sample_sketches(df, buckets, exact, relative_accuracy):
+    buckets = np.asarray(buckets, dtype=np.int64)
+    keys = []
+    for metric in METRICS:
+        values = df[schema.SKETCHES[metric]].to_numpy(dtype=float).sum(axis=1)
+        keys.append(values if exact else bin_index(values, relative_accuracy))
+    return _group(
+        np.tile(buckets, len(METRICS)),
+        np.repeat(np.arange(len(METRICS), dtype=np.int64), len(buckets)),
+        np.concatenate(keys),
+        np.ones(len(buckets) * len(METRICS), dtype=np.int64),
+    )
+
+"""
+Combines sketches, adding the counts of rows with the same bucket, metric and key.
+
+Returns:
+    dataframe: merged sketch sorted by bucket, metric and key
+"""
+def merge(*sketches):
+    sketches = [s for s in sketches if s is not None and not s.empty]
+    if not sketches:
+        return empty()
+    if len(sketches) == 1:
+        return sketches[0]
+    return _group_frame(pd.concat(sketches, ignore_index=True))
+
+"""
+Rolls sketches up into a coarser window that is a multiple of theirs.
+
+Returns:
+    dataframe: sketch indexed by the coarser window's buckets
+"""
+def rollup(sketch, window):
+    return _group_frame(sketch.assign(bucket=sketch['bucket'].to_numpy() // window * window))
+
+"""
+Converts an exact sketch into a binned one.
+
+Returns:
+    dataframe: binned sketch
+"""
+def to_bins(sketch, relative_accuracy):
+    binned = sketch.assign(key=bin_index(sketch['key'].to_numpy(dtype=float), relative_accuracy))
+    return _group_frame(binned)
+
+"""
+Percentiles of every (bucket, metric) in a sketch. Ranks are interpolated linearly
+between neighbouring keys like numpy.quantile; binned keys stand for their bin's
+representative value.
+
+Returns:
+    dataframe: indexed by bucket, one p{q}_{metric} column per metric and percentile
+"""
+def quantiles(sketch, percentiles, exact, relative_accuracy):
+    columns = quantile_columns(percentiles)
+    if sketch.empty:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name="bucket"), dtype=float)
+    keys = sketch['key'].to_numpy(dtype=float)
+    values = keys if exact else bin_value(keys, relative_accuracy)
+    counts = sketch['count'].to_numpy(dtype=np.int64)
+    cumulative = np.cumsum(counts)
+    groups = sketch[['bucket', 'metric']].to_numpy()
+    starts = np.flatnonzero(np.concatenate(([True], (groups[1:] != groups[:-1]).any(axis=1))))
+    ends = np.append(starts[1:], len(sketch))
+    before = cumulative[starts] - counts[starts]
+    total = cumulative[ends - 1] - before
+
+    group_buckets = groups[starts, 0]
+    new_bucket = np.concatenate(([True], group_buckets[1:] != group_buckets[:-1]))
+    row = np.cumsum(new_bucket) - 1
+    result = np.full((int(row[-1]) + 1, len(columns)), np.nan)
+    for i, q in enumerate(percentiles):
+        rank = q / 100 * (total - 1)
+        low = np.floor(rank)
+        low_pos = np.searchsorted(cumulative, before + low, side="right")
+        # the next rank is on the same key unless that key's samples run out
+        high_pos = np.where(cumulative[low_pos] > before + np.ceil(rank), low_pos, low_pos + 1)
+        result[row, groups[starts, 1] * len(percentiles) + i] = values[low_pos] + (values[high_pos] - values[low_pos]) * (rank - low)
+    return pd.DataFrame(result.round(2), columns=columns, index=pd.Index(group_buckets[new_bucket], name="bucket"))
+
+"""
+Returns:
+    list[str]: p{q}_{metric} column names, metric by metric
+"""
+def quantile_columns(percentiles):
+    return [f"{_label(q)}_{metric}" for metric in METRICS for q in percentiles]
+
+"""
+Percentiles over every sample of a sketch, whatever its buckets.
+
+Returns:
+    dict[str, dict]: metric -> {p{q}: value}; values are None for an empty sketch
+"""
+def percentile_summary(sketch, percentiles, exact, relative_accuracy):
+    merged = quantiles(collapse(sketch), percentiles, exact, relative_accuracy) if not sketch.empty else None
+    return {
+        metric: {_label(q): float(merged[f"{_label(q)}_{metric}"].iloc[0]) if merged is not None else None for q in percentiles}
+        for metric in METRICS
+    }
+
+"""
+Collapses every bucket of a sketch into one (bucket 0), e.g. for a whole-run summary.
+
+Returns:
+    dataframe: sketch with a single bucket
+"""
+def collapse(sketch):
+    return _group_frame(sketch.assign(bucket=0))
+
+def bin_index(values, relative_accuracy):
+    gamma = _gamma(relative_accuracy)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        index = np.ceil(np.log(values) / np.log(gamma))
+    return np.where(values > 0, index, -np.inf)
+
+def bin_value(keys, relative_accuracy):
+    gamma = _gamma(relative_accuracy)
+    return 2 * np.power(gamma, keys) / (gamma + 1)
+
+def empty():
+    return pd.DataFrame({"bucket": pd.Series(dtype="int64"), "metric": pd.Series(dtype="int64"), "key": pd.Series(dtype="float64"), "count": pd.Series(dtype="int64")})
+
+def _group_frame(sketch):
+    return _group(*(sketch[column].to_numpy() for column in SKETCH_COLUMNS))
+
+# sorts by (bucket, metric, key) and adds up the counts of equal rows. The three are
+# packed into one int64 so a single integer sort does the work of a three-key lexsort;
+# keys are encoded directly when they are small integers (bin indexes), otherwise by
+# the rank of their distinct value
+def _group(bucket, metric, key, count):
+    if len(bucket) == 0:
+        return empty()
+    bucket = np.asarray(bucket, dtype=np.int64)
+    metric = np.asarray(metric, dtype=np.int64)
+    key = np.asarray(key, dtype=np.float64)
+    finite = np.isfinite(key)
+    low = key[finite].min() if finite.any() else 0.0
+    high = key[finite].max() if finite.any() else 0.0
+    if np.array_equal(key[finite], np.floor(key[finite])) and high - low < 2**20:
+        key_code = np.where(finite, key - low + 1, 0).astype(np.int64)
+        num_keys = int(high - low) + 2
+    else:
+        # hash the keys, then sort only the distinct values
+        key_code, key_values = pd.factorize(key, use_na_sentinel=False)
+        rank = np.empty(len(key_values), dtype=np.int64)
+        rank[np.argsort(key_values)] = np.arange(len(key_values))
+        key_code = rank[key_code]
+        num_keys = len(key_values)
+    first_bucket = bucket.min()
+    packed = ((bucket - first_bucket) * len(METRICS) + metric) * num_keys + key_code
+    order = np.argsort(packed)
+    packed = packed[order]
+    first = np.ones(len(packed), dtype=bool)
+    first[1:] = packed[1:] != packed[:-1]
+    starts = np.flatnonzero(first)
+    rows = order[starts]
+    return pd.DataFrame({
+        "bucket": bucket[rows],
+        "metric": metric[rows],
+        "key": key[rows],
+        "count": np.add.reduceat(np.asarray(count, dtype=np.int64)[order], starts),
+    })
+
+def _gamma(relative_accuracy):
+    return (1 + relative_accuracy) / (1 - relative_accuracy)
+
+def _label(q):
+    return "p" + f"{q:g}".replace(".", "_")
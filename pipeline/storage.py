@@ -0,0 +1,205 @@
+"""
+Columnar storage for processed windows.
+
+A columnar dataset is a directory holding one raw little-endian binary file per column
+(<column>.bin) plus schema.json with the column dtypes and row count. Columns keep their
+types (datetime64[ns], float64, int64, bool), appending only writes to the end of each
+file, and readers memory-map the files so a slice only touches the rows it needs.
+CSV is kept as an export format with the same write/read/truncate interface.
+"""
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+FORMATS = ["columnar", "csv"]
+EXTENSIONS = {"columnar": ".cols", "csv": ".csv"}
+CSV_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+"""
+Path of the processed output for a window size in the given format.
+
+Returns:
+    str: output path
+"""
+def output_path(output_dir, window, fmt="csv"):
+    return f"{output_dir}/processed/metrics_{window}s{EXTENSIONS[fmt]}"
+
+"""
+Path of the quantile sketches (see pipeline.sketch) kept next to a processed dataset.
+
+Returns:
+    str: sketch path in the same format as the processed dataset
+"""
+def sketch_path(path):
+    root, extension = os.path.splitext(path)
+    return root + ".sketch" + extension
+
+def is_columnar(path):
+    return not str(path).endswith(".csv")
+
+"""
+Writes (or appends) a dataframe to a CSV file or columnar dataset.
+"""
+def write_frame(df, path, append=False):
+    if not is_columnar(path):
+        df.to_csv(path, index=False, date_format=CSV_DATE_FORMAT, mode="a" if append else "w", header=not append)
+        return
+
+    schema = _read_schema(path) if append else None
+    if schema is None:
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            os.remove(os.path.join(path, name))
+        schema = {"columns": [[column, _dtype(df[column]).str] for column in df.columns], "rows": 0}
+    for column, dtype in schema['columns']:
+        values = np.ascontiguousarray(df[column].to_numpy(dtype=np.dtype(dtype)))
+        with open(_column_path(path, column), "ab") as f:
+            f.write(values.tobytes())
+    schema['rows'] += len(df)
+    _write_schema(path, schema)
+
+"""
+Current end position of a dataset: byte size for CSV, row count for columnar.
+Pass it to truncate() to drop everything written after it.
+
+Returns:
+    int: end position
+"""
+def position(path):
+    if not is_columnar(path):
+        return os.path.getsize(path)
+    schema = _read_schema(path)
+    return schema['rows'] if schema else 0
+
+def truncate(path, pos):
+    if not is_columnar(path):
+        with open(path, "r+b") as f:
+            f.truncate(pos)
+        return
+    schema = _read_schema(path)
+    for column, dtype in schema['columns']:
+        with open(_column_path(path, column), "r+b") as f:
+            f.truncate(pos * np.dtype(dtype).itemsize)
+    schema['rows'] = pos
+    _write_schema(path, schema)
+
+"""
+Removes the first `count` rows of a dataset (e.g. windows past their retention). The
+remaining rows are copied as they are; the file is replaced only once the copy is complete.
+"""
+def drop_rows(path, count):
+    if count <= 0:
+        return
+    if not is_columnar(path):
+        with open(path, "rb") as f, open(path + ".tmp", "wb") as out:
+            out.write(f.readline())
+            for _ in range(count):
+                f.readline()
+            shutil.copyfileobj(f, out)
+        os.replace(path + ".tmp", path)
+        return
+    schema = _read_schema(path)
+    count = min(count, schema['rows'])
+    for column, dtype in schema['columns']:
+        with open(_column_path(path, column), "rb") as f, open(_column_path(path, column) + ".tmp", "wb") as out:
+            f.seek(count * np.dtype(dtype).itemsize)
+            shutil.copyfileobj(f, out)
+    for column, dtype in schema['columns']:
+        os.replace(_column_path(path, column) + ".tmp", _column_path(path, column))
+    schema['rows'] -= count
+    _write_schema(path, schema)
+
+def exists(path):
+    if not is_columnar(path):
+        return os.path.exists(path)
+    return _read_schema(path) is not None
+
+"""
+Memory-maps every column of a columnar dataset without reading it.
+
+Returns:
+    dict[str, np.ndarray]: read-only array per column
+"""
+def open_columns(path):
+    schema = _read_schema(path)
+    if schema is None:
+        raise FileNotFoundError(f"No columnar dataset at {path}")
+    columns = {}
+    for column, dtype in schema['columns']:
+        if schema['rows'] == 0:
+            columns[column] = np.empty(0, dtype=dtype)
+        else:
+            columns[column] = np.memmap(_column_path(path, column), dtype=dtype, mode="r", shape=(schema['rows'],))
+    return columns
+
+"""
+Reads a processed dataset. For columnar datasets only the requested columns and the
+rows with `on` (window_start by default, or any other sorted column such as a sketch's
+bucket) in [start, end) are copied out of the memory map; the row range is found by
+binary search.
+
+Returns:
+    dataframe: processed windows
+"""
+def read_frame(path, columns=None, start=None, end=None, on="window_start"):
+    if not is_columnar(path):
+        df = pd.read_csv(path)
+        for column in ("window_start", "window_end"):
+            if column in df:
+                df[column] = pd.to_datetime(df[column])
+        if start is not None:
+            df = df[df[on] >= _bound(start, df[on].dtype)]
+        if end is not None:
+            df = df[df[on] < _bound(end, df[on].dtype)]
+        return df[columns].reset_index(drop=True) if columns else df.reset_index(drop=True)
+
+    arrays = open_columns(path)
+    lo, hi = 0, len(next(iter(arrays.values())))
+    if start is not None:
+        lo = np.searchsorted(arrays[on], _bound(start, arrays[on].dtype), side="left")
+    if end is not None:
+        hi = np.searchsorted(arrays[on], _bound(end, arrays[on].dtype), side="left")
+    return pd.DataFrame({column: np.array(arrays[column][lo:hi]) for column in (columns or arrays)})
+
+"""
+Accepts a processed dataset in any supported form: an in-memory dataframe (returned as
+is), a CSV file or a columnar dataset.
+
+Returns:
+    dataframe: processed windows
+"""
+def load(source, columns=None):
+    if isinstance(source, pd.DataFrame):
+        return source[columns] if columns else source
+    return read_frame(source, columns)
+
+# a range bound in the type of the column it is compared with
+def _bound(value, dtype):
+    if np.dtype(dtype).kind == "M":
+        return np.datetime64(pd.Timestamp(value).as_unit("ns"))
+    return value
+
+def _dtype(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return np.dtype("<M8[ns]")
+    if pd.api.types.is_bool_dtype(series):
+        return np.dtype("|b1")
+    if pd.api.types.is_integer_dtype(series):
+        return np.dtype("<i8")
+    return np.dtype("<f8")
+
+def _column_path(path, column):
+    return os.path.join(path, column + ".bin")
+
+def _read_schema(path):
+    try:
+        with open(os.path.join(path, "schema.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_schema(path, schema):
+    with open(os.path.join(path, "schema.json"), "w") as f:
+        json.dump(schema, f)
@@ -1,57 +1,209 @@
+import json
+import os
 import pandas as pd
-import yaml
-from datetime import datetime
-
-with open("config.yaml", "r") as f:
-    config = yaml.safe_load(f)
+from pipeline import aggregate, instrument, settings, sketch, storage
 
 """
-Applies time window aggregations and writes processed CSVs.
+Applies time window aggregations and writes one processed dataset per window size,
+as CSV or as a typed columnar dataset (fmt, see pipeline.storage).
+
+Raw samples are aggregated once into the finest window every requested size is a
+multiple of; each coarser window is rolled up from the largest already computed
+window that divides it (sum/count for means, min/max as-is), so cost grows with
+the number of raw rows rather than rows x windows.
+
+df_valid may be a single dataframe or an iterator of dataframes (see
+ingest.iter_ingestion). Windows that are still open are kept as partial aggregates
+and merged with the next chunk; closed windows are appended to their CSV, so memory
+stays bounded by one chunk. With ingestion.allowed_lateness_seconds in config.yaml,
+windows stay open until the newest sample is that far past their end (see
+aggregate.WindowAggregator).
+
+Incremental runs pass the window state returned by load_state (None on a first run)
+and the input cursor reached by ingest.run_incremental_ingestion. The open windows
+saved by the previous run are removed from the end of each CSV and merged with the
+new rows, so only new or changed windows are written: a late sample updates the
+window it belongs to, as long as it arrives within the allowed lateness. The new open
+windows and cursor are saved to metrics_{window}s.state.json.
+
+Every processed window also carries the percentiles listed in config.yaml (p{q}_
+columns) and its quantile sketch is appended to metrics_{window}s.sketch next to the
+output, so percentiles of any range of windows, coarser windows or several hosts can
+be computed later by merging sketches.
+
+With return_frames the processed windows are also kept in memory and returned instead
+of the paths, so analytics running in the same process can skip reading them back.
+
+config is the loaded configuration (thresholds, percentiles and ingestion sections),
+by default settings.load().
 
 Returns:
-    dict[int, str]: mapping window size -> output CSV path
+    dict[int, str]: mapping window size -> output path
+    (dict[int, dataframe] with return_frames)
 """
-def run_transformation(df_valid, output_dir, window_sizes):
-    outputs = {}
+def run_transformation(df_valid, output_dir, window_sizes, state=None, cursor=None, fmt="csv", return_frames=False, config=None):
+    config = config or settings.load()
+    chunks = [df_valid] if isinstance(df_valid, pd.DataFrame) else df_valid
+    outputs = {window: storage.output_path(output_dir, window, fmt) for window in window_sizes}
+    sketch_outputs = {window: storage.sketch_path(outputs[window]) for window in window_sizes}
+    frames = {window: [] for window in window_sizes} if return_frames else None
+    aggregator = aggregate.WindowAggregator(window_sizes, config['percentiles'], config['ingestion']['allowed_lateness_seconds'])
+    written = {window: False for window in window_sizes}
+    sketches_written = {window: False for window in window_sizes}
     for window in window_sizes:
-        out_path = f"{output_dir}/processed/metrics_{window}s.csv"
-        df_out = pd.DataFrame(columns=["window_start", "window_end", "sample_count", "avg_cpu_total_percent", "min_cpu_idle_percent", "max_memory_usage_percent", "avg_disk_usage_percent", "memory_pressure_flag", "cpu_saturation_flag"])
-        #setup window
-        df = df_valid.copy()
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-    
-        df['start_timestamp'] = df['timestamp']
-        df['end_timestamp'] = df['timestamp']
-        df.set_index('timestamp', inplace=True)
-
-        df['temp'] = 1  # Temporary column to count samples
-
-        # Transform data
-        df = df.resample(str(window)+'s').agg({
-            'start_timestamp': 'min',
-            'end_timestamp': 'max',
-            'cpu_user_percent': 'mean',
-            'cpu_system_percent': 'mean',
-            'cpu_idle_percent': 'min',
-            'memory_used_percent': 'max', 
-            'disk_used_percent': 'mean',
-            'temp': 'sum'
-        })
-
-        df_out['window_start'] = df['start_timestamp']
-        df_out['window_end'] = df['end_timestamp']
-        df_out['sample_count'] = df['temp']
-        df_out['avg_cpu_total_percent'] = (df['cpu_user_percent'] + df['cpu_system_percent']).round(1)
-        df_out['min_cpu_idle_percent'] = df['cpu_idle_percent']
-        df_out['max_memory_usage_percent'] = df['memory_used_percent'].round(1)
-        df_out['avg_disk_usage_percent'] = df['disk_used_percent'].round(1)
-        df_out['memory_pressure_flag'] = df_out['max_memory_usage_percent'] > config['thresholds']['memory_pressure_percent']
-        df_out['cpu_saturation_flag'] = df_out['min_cpu_idle_percent'] < config['thresholds']['cpu_saturation_percent']
-        df_out = df_out.dropna(subset=['avg_cpu_total_percent', 'max_memory_usage_percent', 'min_cpu_idle_percent'])
-        df_out.reset_index(drop=True, inplace=True)
-
-        df_out.to_csv(out_path, index=False, date_format="%Y-%m-%dT%H:%M:%S")
-
-        outputs[window] = out_path
+        if state is not None:
+            # re-open the windows the previous run left open
+            storage.truncate(outputs[window], state[window]['open_row_offset'])
+            storage.truncate(sketch_outputs[window], state[window]['open_sketch_row_offset'])
+            aggregator.open_partials[window] = _partials_from_json(state[window]['open_windows'])
+            aggregator.open_sketches[window] = _sketch_from_json(state[window]['open_sketch'])
+            written[window] = True
+            sketches_written[window] = True
+        elif os.path.exists(_state_path(outputs[window])):
+            os.remove(_state_path(outputs[window]))
+
+    for chunk in chunks:
+        instrument.record("transformation", rows_in=len(chunk))
+        for window, partials in aggregator.add(chunk).items():
+            written[window] = _write_windows(partials, outputs[window], written[window], config['thresholds'], frames=frames[window] if return_frames else None)
+        for window, window_sketch in aggregator.take_sketches().items():
+            sketches_written[window] = _write_sketch(window_sketch, sketch_outputs[window], sketches_written[window])
 
+    flushed = aggregator.flush()
+    open_sketches = aggregator.take_sketches()
+    for window, partials in flushed.items():
+        if cursor is None:
+            _write_windows(partials, outputs[window], written[window], config['thresholds'], final=True, frames=frames[window] if return_frames else None)
+            _write_sketch(open_sketches[window], sketch_outputs[window], sketches_written[window], final=True)
+            continue
+        if not written[window]:
+            _write_windows(partials.iloc[:0], outputs[window], False, config['thresholds'], final=True)
+        if not sketches_written[window]:
+            _write_sketch(open_sketches[window].iloc[:0], sketch_outputs[window], False, final=True)
+        # remember where the open windows start so the next run can rewrite them
+        open_row_offset = storage.position(outputs[window])
+        open_sketch_row_offset = storage.position(sketch_outputs[window])
+        _write_windows(partials, outputs[window], True, config['thresholds'], final=True, frames=frames[window] if return_frames else None)
+        _write_sketch(open_sketches[window], sketch_outputs[window], True, final=True)
+        _save_state(outputs[window], partials, cursor, open_row_offset, open_sketches[window], open_sketch_row_offset, config['percentiles'])
+
+    if return_frames:
+        return {window: pd.concat(frames[window], ignore_index=True) for window in window_sizes}
     return outputs
+
+def _write_windows(partials, out_path, appending, thresholds, final=False, frames=None):
+    if partials.empty and not final:
+        return appending
+    df_out = aggregate.finalize(partials, thresholds)
+    storage.write_frame(df_out, out_path, append=appending)
+    instrument.record("transformation", rows_out=len(df_out))
+    if frames is not None:
+        frames.append(df_out)
+    return True
+
+def _write_sketch(window_sketch, out_path, appending, final=False):
+    if window_sketch.empty and not final:
+        return appending
+    storage.write_frame(window_sketch, out_path, append=appending)
+    return True
+
+"""
+Loads the incremental state saved next to each window's CSV.
+
+Returns:
+    dict[int, dict] | None: state per window, or None if any window has no usable
+    state for input_path (the caller should then recompute from the start)
+"""
+def load_state(output_dir, window_sizes, input_path, fmt="csv"):
+    state = {}
+    for window in window_sizes:
+        out_path = storage.output_path(output_dir, window, fmt)
+        try:
+            with open(_state_path(out_path)) as f:
+                state[window] = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if state[window]['input_path'] != os.path.abspath(input_path):
+            return None
+        if not storage.exists(out_path) or storage.position(out_path) < state[window]['open_row_offset']:
+            return None
+        sketch_out_path = storage.sketch_path(out_path)
+        if 'open_windows' not in state[window] or 'open_sketch_row_offset' not in state[window] or not storage.exists(sketch_out_path) or storage.position(sketch_out_path) < state[window]['open_sketch_row_offset']:
+            return None
+        if os.path.getsize(input_path) < state[window]['input_offset']:
+            return None  # input was truncated or replaced
+    cursors = {(s['input_offset'], s['high_water_mark']) for s in state.values()}
+    if len(cursors) != 1:
+        return None
+    return state
+
+"""
+Where an incremental run should continue reading its input.
+
+Returns:
+    tuple[int, str | None]: byte offset and high-water-mark timestamp
+"""
+def resume_point(state):
+    if state is None:
+        return 0, None
+    first = next(iter(state.values()))
+    return first['input_offset'], first['high_water_mark']
+
+"""
+Moves the incremental state of a processed dataset back after rows were removed from
+the head of the dataset, of its sketch or of the input (see pipeline.retention), so the
+saved offsets keep pointing at the same rows. A state whose open window was removed is
+deleted and the next incremental run starts over.
+"""
+def shift_state(out_path, rows=0, sketch_rows=0, input_path=None, input_bytes=0):
+    try:
+        with open(_state_path(out_path)) as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return
+    state['open_row_offset'] -= rows
+    state['open_sketch_row_offset'] = state.get('open_sketch_row_offset', 0) - sketch_rows
+    if input_path is not None and state['input_path'] == os.path.abspath(input_path):
+        state['input_offset'] -= input_bytes
+    if min(state['open_row_offset'], state['open_sketch_row_offset'], state['input_offset']) < 0:
+        os.remove(_state_path(out_path))
+        return
+    with open(_state_path(out_path), "w") as f:
+        json.dump(state, f)
+
+def _state_path(out_path):
+    return os.path.splitext(out_path)[0] + ".state.json"
+
+def _save_state(out_path, partials, cursor, open_row_offset, open_sketch, open_sketch_row_offset, percentiles):
+    open_windows = []
+    high_water_mark = cursor.get('high_water_mark')
+    # percentiles are recomputed from the sketch when the window closes
+    partials = partials.drop(columns=sketch.quantile_columns(percentiles['quantiles']), errors="ignore")
+    if not partials.empty:
+        # the newest sample is in the last open window, later runs check lateness against it
+        high_water_mark = partials['window_end'].max().isoformat()
+        for open_window in partials.reset_index().to_dict(orient="records"):
+            open_window['window_start'] = open_window['window_start'].isoformat()
+            open_window['window_end'] = open_window['window_end'].isoformat()
+            open_windows.append({k: v.item() if hasattr(v, 'item') else v for k, v in open_window.items()})
+    with open(_state_path(out_path), "w") as f:
+        json.dump({
+            "input_path": os.path.abspath(cursor['input_path']),
+            "input_offset": cursor['input_offset'],
+            "high_water_mark": high_water_mark,
+            "open_row_offset": open_row_offset,
+            "open_windows": open_windows,
+            "open_sketch_row_offset": open_sketch_row_offset,
+            "open_sketch": open_sketch.to_dict(orient="list"),
+        }, f)
+
+def _partials_from_json(open_windows):
+    if not open_windows:
+        return None
+    partials = pd.DataFrame(open_windows).set_index("bucket")
+    partials['window_start'] = pd.to_datetime(partials['window_start'])
+    partials['window_end'] = pd.to_datetime(partials['window_end'])
+    return partials
+
+def _sketch_from_json(open_sketch):
+    return pd.DataFrame(open_sketch).astype(sketch.empty().dtypes.to_dict())
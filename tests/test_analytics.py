@@ -3,12 +3,14 @@ import os
 import pandas as pd
 import json
 import pytest
+import shutil
 from pipeline.transform import run_transformation
 from pipeline.ingest import run_ingestion
 from pipeline.analytics import run_analytics
 
 test_file = 'data/raw/temp.csv'
 temp_file = 'temp/processed/metrics_2s.csv'
+temp_sketch_file = 'temp/processed/metrics_2s.sketch.csv'
 temp_file2 = 'temp/analytics/analytics_summary_2s.json'
 
 def test_run_analytics():
@@ -24,12 +26,64 @@ def test_run_analytics():
     print(data)
     assert data['window_size_seconds'] == 2
     assert data['total_windows'] >= 3 and data['total_windows'] <=4
+    assert data['anomalies'] == {"intervals": []}#too few windows for a baseline
     os.remove(temp_file)
+    os.remove(temp_sketch_file)
     os.remove(temp_file2)
     os.removedirs('temp/processed')
     os.removedirs('temp/analytics')
     delete_temp_file()
 
+def test_run_analytics_in_memory_frames():
+    create_temp_csv_data()
+    df = run_ingestion(test_file)
+    os.makedirs('temp/processed')
+    os.makedirs('temp/analytics')
+    processed_frames = run_transformation(df,'temp',[2], fmt="columnar", return_frames=True)
+    assert isinstance(processed_frames[2], pd.DataFrame)
+    run_analytics(processed_frames, 'temp', False)
+    with open(temp_file2) as f:
+        data = json.load(f)
+    assert data['total_windows'] == len(processed_frames[2])
+    assert data['peak_cpu_time_range']['start'] == '2026-01-30T13:26:44'
+    assert data['peaks']['avg_cpu_total_percent'][0]['start'] == '2026-01-30T13:26:44'
+    assert data['streaks']['memory_pressure'] == [{'start': '2026-01-30T13:26:39', 'end': '2026-01-30T13:26:44', 'windows': 4}]
+    assert data['longest_memory_pressure_streak'] == 4
+    shutil.rmtree('temp')
+    delete_temp_file()
+
+def test_run_analytics_parallel_writes_plots():
+    create_temp_csv_data()
+    df = run_ingestion(test_file)
+    os.makedirs('temp/processed')
+    os.makedirs('temp/analytics')
+    processed_outputs = run_transformation(df,'temp',[2,4], fmt="columnar")
+    summaries = run_analytics(processed_outputs, 'temp', True, workers=2, plot_format="svg")
+    assert sorted(summaries) == [2, 4]
+    assert os.path.exists('temp/analytics/metrics_2s.svg')
+    assert os.path.exists('temp/analytics/metrics_4s.svg')
+    assert os.path.exists('temp/analytics/analytics_summary_4s.json')
+    shutil.rmtree('temp')
+    delete_temp_file()
+
+def test_run_analytics_empty_dataset():
+    create_empty_csv_data()
+    df = run_ingestion(test_file)
+    assert df.empty
+    os.makedirs('temp/processed')
+    os.makedirs('temp/analytics')
+    processed_outputs = run_transformation(df,'temp',[2])
+    run_analytics(processed_outputs, 'temp', False)
+    with open(temp_file2) as f:
+        data = json.load(f)
+    assert data['total_windows'] == 0
+    assert data['percent_memory_pressure'] == 0
+    assert data['avg_cpu_total_percent'] is None
+    assert data['max_cpu_total_percent'] is None
+    assert data['peak_memory_used_percent'] is None
+    shutil.rmtree('temp')
+    delete_temp_file()
+
 
 def create_temp_csv_data():
     with open(test_file, "w", newline="") as f:
@@ -42,5 +96,10 @@ def create_temp_csv_data():
         writer.writerow(['2026-01-30T13:26:43', '21.2', '13.5', '63.9', '83.0', '53.4'])
         writer.writerow(['2026-01-30T13:26:44', '21.2', '13.5', '63.9', '83.0', '53.4'])
 
+def create_empty_csv_data():
+    with open(test_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"])
+
 def delete_temp_file():
     os.remove(test_file)
\ No newline at end of file
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from pipeline import anomaly
+
+settings = {"metrics": ["avg_cpu_total_percent"], "ewma_alpha": 0.05, "z_threshold": 4, "min_std": 1.0, "warmup_windows": 20, "cusum_drift": 0.5, "cusum_threshold": 12}
+
+def make_windows():
+    starts = pd.date_range('2026-01-01', periods=3 * 1440, freq='60s')
+    hours = starts.hour.to_numpy()
+    rng = np.random.default_rng(0)
+    cpu = 20 + 15 * ((hours >= 9) & (hours < 17)) + rng.normal(0, 1, len(starts))#busy office hours every day
+    cpu[2 * 1440 + 120:2 * 1440 + 123] += 30#spike on day 3 at 02:00
+    cpu[2 * 1440 + 240:2 * 1440 + 360] += 2#small regression on day 3 from 04:00, never 4 std away
+    cpu[500] = np.nan
+    return pd.DataFrame({"window_start": starts, "window_end": starts + pd.Timedelta(seconds=59), "avg_cpu_total_percent": cpu})
+
+def test_detect_intervals_finds_spike_and_regression():
+    intervals = anomaly.detect_intervals(make_windows(), settings)
+    day3 = [interval for interval in intervals if interval['start'] >= '2026-01-03']
+    spike = next(interval for interval in day3 if interval['start'] <= '2026-01-03T02:00:00' <= interval['end'])
+    assert spike['detectors'] == ['ewma', 'seasonal', 'cusum']
+    assert spike['windows'] <= 5
+    assert spike['peak_value'] > 45
+    regression = [interval for interval in day3 if '2026-01-03T04:00:00' <= interval['start'] < '2026-01-03T06:00:00']
+    assert all('cusum' in interval['detectors'] and 'ewma' not in interval['detectors'] for interval in regression)
+    assert sum(interval['windows'] for interval in regression) >= 60#most of the two hours
+    #office hours are normal for their hour of day once there is a seasonal baseline
+    assert not any('2026-01-02T08:55:00' <= interval['start'] <= '2026-01-02T09:30:00' for interval in intervals)
+    assert not any('2026-01-03T08:55:00' <= interval['start'] <= '2026-01-03T09:30:00' for interval in intervals)
+
+def test_detect_intervals_matches_online_tracker():
+    df = make_windows()
+    tracker = anomaly.AnomalyTracker("avg_cpu_total_percent", settings)
+    online_intervals = []
+    for value, start, end in zip(df['avg_cpu_total_percent'], df['window_start'], df['window_end']):
+        online_intervals.extend(tracker.update(value, start, end))
+    online_intervals.extend(tracker.close())
+    assert online_intervals == anomaly.detect_intervals(df, settings)
+
+def test_cusum_alarms_match_recursion():
+    steps = np.random.default_rng(1).normal(0.2, 1, 5000) - 0.5
+    total, start, expected = 0.0, None, []
+    for position, step in enumerate(steps):
+        total = max(0.0, total + step)
+        if total == 0:
+            start = None
+        elif start is None:
+            start = position
+        if total > 5:
+            expected.append((start, position))
+            total, start = 0.0, None
+    assert anomaly._cusum_alarms(steps, 5) == expected
@@ -0,0 +1,27 @@
+import contextlib
+import io
+import pandas as pd
+from benchmarks.generate import make_frame, iter_frames
+from benchmarks.bench_pipeline import find_regressions
+from pipeline.ingest import validate_metrics
+
+def test_generator_is_deterministic():
+    df = make_frame(5000, error_rate=0.01, disorder_rate=0.01, seed=3)
+    pd.testing.assert_frame_equal(df, make_frame(5000, error_rate=0.01, disorder_rate=0.01, seed=3))
+    assert list(df.columns) == ["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"]
+    assert df['timestamp'].iloc[0] == "2026-01-01T00:00:00.000"
+    assert sum(len(chunk) for chunk in iter_frames(5000, chunk_rows=1200)) == 5000
+
+def test_generated_errors_and_disorder_are_rejected():
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, clean = validate_metrics(make_frame(20000, error_rate=0, disorder_rate=0))
+        _, rejections = validate_metrics(make_frame(20000, error_rate=0.01, disorder_rate=0.01))
+    assert len(clean) == 0
+    assert set(rejections['rule']) == {"range", "null", "cpu_total_sum", "format", "order"}
+    assert 300 < len(rejections) < 500#about 1% errors plus 1% disorder
+
+def test_find_regressions_applies_tolerances():
+    baseline = {"1000": {"ingestion": {"rows_per_second": 1000, "peak_rss_bytes": 100}}}
+    assert find_regressions({"1000": {"ingestion": {"rows_per_second": 850, "peak_rss_bytes": 115}}}, baseline) == []
+    regressions = find_regressions({"1000": {"ingestion": {"rows_per_second": 700, "peak_rss_bytes": 130}}, "10": {"analytics": {"rows_per_second": 1, "peak_rss_bytes": 1}}}, baseline)
+    assert len(regressions) == 2
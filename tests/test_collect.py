@@ -0,0 +1,16 @@
+import os
+import pandas as pd
+import pytest
+from pipeline.collect import collect_metrics
+
+test_file = 'data/raw/temp_collected.csv'
+
+def test_collect_sub_second_interval():
+    collect_metrics(test_file, 0.5, 0.1, flush_rows=2)
+    df = pd.read_csv(test_file)
+    os.remove(test_file)
+    assert list(df.columns) == ["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"]
+    assert 4 <= len(df) <= 5
+    assert len(df['timestamp'][0]) == len('2026-01-30T13:26:39.123')#millisecond timestamps
+    spacing = pd.to_datetime(df['timestamp']).diff().dropna().dt.total_seconds()
+    assert spacing.between(0.05, 0.2).all()
@@ -0,0 +1,74 @@
+import csv
+import os
+import shutil
+import pandas as pd
+from pipeline.fleet import run_fleet, resolve_inputs, is_fleet_input
+
+hosts_dir = 'temp/raw'
+
+def test_resolve_inputs_directory_and_glob():
+    create_host_files()
+    assert is_fleet_input(hosts_dir)
+    assert is_fleet_input(hosts_dir + '/web*.csv')
+    assert not is_fleet_input(hosts_dir + '/web01.csv')
+    assert list(resolve_inputs(hosts_dir)) == ['db01', 'web01', 'web02']
+    assert list(resolve_inputs(hosts_dir + '/web*.csv')) == ['web01', 'web02']
+    shutil.rmtree('temp')
+
+def test_run_fleet_per_host_and_fleet_windows():
+    create_host_files()
+    os.makedirs('temp/processed')
+    outputs, host_windows = run_fleet(hosts_dir, 'temp', [2], workers=2)
+    assert outputs == {2: 'temp/processed/fleet_metrics_2s.csv'}
+    assert os.path.exists('temp/hosts/web01/processed/metrics_2s.csv')
+    assert sorted(host_windows[2]['host'].unique()) == ['db01', 'web01', 'web02']
+
+    fleet = pd.read_csv(outputs[2])
+    assert list(fleet['host_count']) == [3, 3, 3]
+    assert list(fleet['sample_count']) == [6, 6, 6]
+    assert list(fleet['hosts_memory_pressure']) == [1, 1, 1]#only db01 is over 80%
+    # host averages in the first window: 15.0, 20.0, 90.0
+    assert fleet['max_cpu_total_percent'].iloc[0] == 90.0
+    assert fleet['p95_cpu_total_percent'].iloc[0] == 83.0
+    assert fleet['avg_cpu_total_percent'].iloc[0] == 41.7
+    shutil.rmtree('temp')
+
+def test_run_fleet_merges_host_sketches():
+    create_host_files()
+    os.makedirs('temp/processed')
+    percentiles = {"quantiles": [50, 95], "relative_accuracy": 0.01, "exact_max_window": 60}
+    outputs, host_windows = run_fleet(hosts_dir, 'temp', [2, 120], percentiles=percentiles)
+    fleet = pd.read_csv(outputs[2])
+    # every window holds two samples per host: 15.0, 15.0, 20.0, 20.0, 90.0, 90.0
+    assert list(fleet['sample_p50_cpu_total_percent']) == [20.0, 20.0, 20.0]
+    assert list(fleet['sample_p95_cpu_total_percent']) == [90.0, 90.0, 90.0]
+    # 120s windows use binned sketches, within the relative accuracy
+    fleet = pd.read_csv(outputs[120])
+    assert abs(fleet['sample_p50_cpu_total_percent'].iloc[0] - 20.0) <= 20.0 * 0.01
+    assert abs(fleet['sample_p50_memory_used_percent'].iloc[0] - 60.0) <= 60.0 * 0.01
+    shutil.rmtree('temp')
+
+def create_host_files():
+    os.makedirs(hosts_dir)
+    for host, cpu_user, memory in [('web01', 10.0, 50.0), ('web02', 15.0, 60.0), ('db01', 85.0, 90.0)]:
+        with open(f"{hosts_dir}/{host}.csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"])
+            for second in range(40, 46):
+                writer.writerow([f'2026-01-30T13:26:{second}', cpu_user, 5.0, 95.0 - cpu_user, memory, 53.4])
+
+def test_run_fleet_merges_hosts_sampling_at_different_offsets():
+    os.makedirs(hosts_dir)
+    os.makedirs('temp/processed')
+    for host, seconds in [('a', range(40, 60, 2)), ('b', range(41, 60, 2))]:
+        with open(f"{hosts_dir}/{host}.csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"])
+            for second in seconds:
+                writer.writerow([f'2026-01-30T13:26:{second}', 10.0, 5.0, 85.0, 50.0, 53.4])
+    outputs, host_windows = run_fleet(hosts_dir, 'temp', [10])
+    fleet = pd.read_csv(outputs[10])
+    assert list(fleet['host_count']) == [2, 2]
+    assert list(fleet['sample_count']) == [10, 10]
+    assert list(fleet['window_start']) == ['2026-01-30T13:26:40', '2026-01-30T13:26:50']
+    shutil.rmtree('temp')
@@ -1,7 +1,8 @@
 import os
 import csv
 import pytest
-from pipeline.ingest import run_ingestion
+import pandas as pd
+from pipeline.ingest import run_ingestion, iter_ingestion
 
 test_file = 'data/raw/temp.csv'
 
@@ -31,6 +32,115 @@ Null/bad value found in cpu_user_percent column\n\
 Null/bad value found in cpu_user_percent column\n\
 Null/bad value found in memory_used_percent column\n"
     
+def test_ingestion_rejection_report():
+    create_temp_csv_data3()
+    df, report = run_ingestion(test_file, return_report=True)
+    delete_temp_file()
+    assert len(df) == 1
+    assert list(report['row']) == [4, 0, 3, 2]
+    assert list(report['rule']) == ['format', 'null', 'null', 'null']
+    assert list(report['column']) == ['timestamp', 'cpu_user_percent', 'cpu_user_percent', 'memory_used_percent']
+
+def test_iter_ingestion_carries_order_check(capsys):
+    with open(test_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"])
+        writer.writerow(['2026-01-30T13:26:41', '9.6', '6.8', '83.1', '82.8', '53.4'])
+        writer.writerow(['2026-01-30T13:26:42', '8.1', '5.2', '86.1', '82.8', '53.4'])
+        writer.writerow(['2026-01-30T13:26:40', '7.7', '4.5', '87.3', '82.8', '53.4'])#earlier than previous chunk
+        writer.writerow(['2026-01-30T13:26:43', '9.8', '8.8', '81.1', '82.8', '53.4'])
+    df = pd.concat(iter_ingestion(test_file, 2))
+    delete_temp_file()
+    captured = capsys.readouterr()
+    assert len(df) == 3
+    assert captured.out == "Timestamps are not in chronological order: 2026-01-30T13:26:42 followed by 2026-01-30T13:26:40\n"
+
+def test_iter_ingestion_carries_timestamp_of_rejected_row(capsys):
+    with open(test_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"])
+        writer.writerow(['2026-01-30T13:26:40', '9.6', '6.8', '83.1', '82.8', '53.4'])
+        writer.writerow(['2026-01-30T13:26:45', '8.1', '5.2', '86.1', '150.0', '53.4'])#last row of the chunk, bad memory
+        writer.writerow(['2026-01-30T13:26:42', '7.7', '4.5', '87.3', '82.8', '53.4'])#earlier than the rejected row
+    batch = run_ingestion(test_file)
+    batch_out = capsys.readouterr().out
+    chunked = pd.concat(iter_ingestion(test_file, 2))
+    chunked_out = capsys.readouterr().out
+    delete_temp_file()
+    assert len(batch) == len(chunked) == 1
+    assert sorted(chunked_out.splitlines()) == sorted(batch_out.splitlines()) == ["Invalid memory_used_percent value found: 150.0",
+        "Timestamps are not in chronological order: 2026-01-30T13:26:45 followed by 2026-01-30T13:26:42"]
+
+def test_ingestion_reorders_within_lateness(capsys):
+    with open(test_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"])
+        writer.writerow(['2026-01-30T13:26:41', '9.6', '6.8', '83.1', '82.8', '53.4'])
+        writer.writerow(['2026-01-30T13:26:44', '8.1', '5.2', '86.1', '82.8', '53.4'])
+        writer.writerow(['2026-01-30T13:26:42', '7.7', '4.5', '87.3', '82.8', '53.4'])#2s late, kept
+        writer.writerow(['2026-01-30T13:26:40', '9.8', '8.8', '81.1', '82.8', '53.4'])#4s late, rejected
+        writer.writerow(['2026-01-30T13:26:42', '9.9', '8.8', '81.1', '82.8', '53.4'])#duplicate
+    df, report = run_ingestion(test_file, return_report=True, lateness=3, duplicates="last")
+    delete_temp_file()
+    captured = capsys.readouterr()
+    assert list(df['timestamp'].dt.second) == [41, 42, 44]
+    assert list(df['cpu_user_percent']) == [9.6, 9.9, 8.1]#last arrival of 13:26:42 kept
+    assert list(report['rule']) == ['order', 'duplicate']
+    assert list(report['row']) == [3, 2]
+    assert captured.out == "Timestamp arrived more than 3s late: 2026-01-30T13:26:44 followed by 2026-01-30T13:26:40\n\
+Duplicate timestamp found: 2026-01-30T13:26:42 (keeping the last sample)\n"
+
+def test_iter_ingestion_reorders_across_chunks(capsys):
+    with open(test_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"])
+        writer.writerow(['2026-01-30T13:26:40', '9.6', '6.8', '83.1', '82.8', '53.4'])
+        writer.writerow(['2026-01-30T13:26:42', '8.1', '5.2', '86.1', '82.8', '53.4'])
+        writer.writerow(['2026-01-30T13:26:41', '7.7', '4.5', '87.3', '82.8', '53.4'])#earlier than previous chunk, within lateness
+        writer.writerow(['2026-01-30T13:26:42', '9.8', '8.8', '81.1', '82.8', '53.4'])#duplicate of previous chunk
+        writer.writerow(['2026-01-30T13:26:43', '9.9', '8.8', '81.1', '82.8', '53.4'])
+    chunks = list(iter_ingestion(test_file, 2, lateness=2, duplicates="first"))
+    delete_temp_file()
+    captured = capsys.readouterr()
+    df = pd.concat(chunks)
+    assert df['timestamp'].is_monotonic_increasing
+    assert list(df['timestamp'].dt.second) == [40, 41, 42, 43]
+    assert list(df['cpu_user_percent']) == [9.6, 7.7, 8.1, 9.9]#first arrival of 13:26:42 kept
+    assert captured.out == "Duplicate timestamp found: 2026-01-30T13:26:42 (keeping the first sample)\n"
+
+def test_iter_ingestion_reports_raw_timestamps_across_chunks(capsys):
+    with open(test_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"])
+        writer.writerow(['2026-01-30T13:26:40.000', '9.6', '6.8', '83.1', '82.8', '53.4'])
+        writer.writerow(['2026-01-30T13:26:42.000', '8.1', '5.2', '86.1', '82.8', '53.4'])
+        writer.writerow(['2026-01-30T13:26:41.000', '7.7', '4.5', '87.3', '82.8', '53.4'])#earlier than previous chunk
+        writer.writerow(['2026-01-30T13:26:42.000', '9.8', '8.8', '81.1', '82.8', '53.4'])#duplicate of previous chunk
+        writer.writerow(['2026-01-30T13:26:43.000', '9.9', '8.8', '81.1', '82.8', '53.4'])
+    batch = run_ingestion(test_file, duplicates="first")
+    batch_out = capsys.readouterr().out
+    chunked = pd.concat(iter_ingestion(test_file, 2, duplicates="first"))
+    chunked_out = capsys.readouterr().out
+    delete_temp_file()
+    assert len(batch) == len(chunked) == 3
+    assert chunked_out == batch_out == "Timestamps are not in chronological order: 2026-01-30T13:26:42.000 followed by 2026-01-30T13:26:41.000\n\
+Duplicate timestamp found: 2026-01-30T13:26:42.000 (keeping the first sample)\n"
+
+def test_ingestion_wide_schema(capsys):
+    with open(test_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent", "cpu0_user_percent", "cpu1_user_percent", "disk_boot_used_percent", "net_sent_bytes_per_s", "top_cpu_1_name", "top_cpu_1_percent"])
+        writer.writerow(['2026-01-30T13:26:39', '9.6', '6.8', '83.1', '82.8', '53.4', '9.0', '10.2', '20.0', '1500.0', 'python', '12.5'])
+        writer.writerow(['2026-01-30T13:26:40', '8.1', '5.2', '86.1', '82.8', '53.4', '8.0', '108.2', '20.0', '1500.0', 'python', '12.5'])#bad cpu1
+        writer.writerow(['2026-01-30T13:26:41', '7.7', '4.5', '87.3', '82.8', '53.4', '7.0', '8.4', '20.0', '-3.0', 'python', '12.5'])#bad net rate
+        writer.writerow(['2026-01-30T13:26:42', '9.8', '8.8', '81.1', '82.8', '53.4', '9.5', '10.1', '20.0', '1500.0', '', ''])#no process is fine
+    df = run_ingestion(test_file)
+    delete_temp_file()
+    captured = capsys.readouterr()
+    assert len(df) == 2
+    assert captured.out == "Invalid cpu1_user_percent value found: 108.2\n\
+Invalid net_sent_bytes_per_s value found: -3.0\n"
+
 
 def create_temp_csv_data():
     with open(test_file, "w", newline="") as f:
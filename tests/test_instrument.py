@@ -0,0 +1,44 @@
+import json
+import os
+import shutil
+from pipeline import instrument
+
+report_file = 'temp/run_report.json'
+
+def test_stages_are_measured_and_reported():
+    instrument.start_run(["main.py"])
+    with instrument.stage("transformation"):
+        sum(range(100000))
+        instrument.record("transformation", rows_in=10, rows_out=2)
+    with instrument.stage("transformation"):
+        instrument.record("transformation", rows_in=5, rows_out=1)
+    instrument.record("ingestion", rows_in=20, rows_out=15)
+    report = instrument.finish(report_file)
+
+    with open(report_file) as f:
+        assert json.load(f) == report
+    assert report['status'] == "ok"
+    assert [stage['name'] for stage in report['stages']] == ["transformation", "ingestion"]
+    transformation = report['stages'][0]
+    assert transformation['rows_in'] == 15#repeated stages add up
+    assert transformation['rows_out'] == 3
+    assert transformation['wall_seconds'] > 0 and transformation['cpu_seconds'] >= 0
+    assert transformation['rss_bytes'] > 0
+    assert report['stages'][1] == {"name": "ingestion", "rows_in": 20, "rows_out": 15}
+    shutil.rmtree('temp')
+
+def test_profile_writes_cprofile_and_tracemalloc_output():
+    instrument.start_run(["main.py", "--profile"], profile_dir='temp/profile')
+    with instrument.stage("analytics"):
+        values = [float(i) for i in range(10000)]
+    report = instrument.finish(report_file, status="failed")
+    assert report['status'] == "failed"
+    assert report['stages'][0]['traced_peak_bytes'] > 0
+    assert sorted(os.listdir('temp/profile')) == ["analytics.prof", "analytics.tracemalloc.txt", "analytics.txt"]
+    shutil.rmtree('temp')
+
+def test_no_active_run_records_nothing():
+    with instrument.stage("ingestion"):
+        instrument.record("ingestion", rows_in=1)
+    assert instrument.finish(report_file) is None
+    assert not os.path.exists(report_file)
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pipeline import kernels
+
+flags = [False, True, True, False, True, True, True, False, True]
+starts = pd.date_range('2026-01-30T13:26:00', periods=len(flags), freq='5s')
+ends = starts + pd.Timedelta(seconds=4)
+cpu = [10.0, 35.5, 20.1, 35.5, 5.0, np.nan, 40.2, 12.3, 35.5]
+
+def test_find_streaks():
+    positions, lengths = kernels.find_streaks(flags)
+    assert list(positions) == [1, 4, 8]
+    assert list(lengths) == [2, 3, 1]
+
+def test_streak_summary_matches_online_tracker():
+    summary = kernels.streak_summary(flags, starts, ends)
+    assert summary['longest'] == 3
+    assert summary['streaks'][1] == {"start": "2026-01-30T13:26:20", "end": "2026-01-30T13:26:34", "windows": 3}
+
+    tracker = kernels.StreakTracker()
+    online_streaks = []
+    for flag, start, end in zip(flags, starts, ends):
+        streak = tracker.update(flag, start, end)
+        if streak:
+            online_streaks.append(streak)
+    online_streaks.append(tracker.close())
+    assert online_streaks == summary['streaks']
+    assert tracker.longest == summary['longest']
+    assert tracker.count == summary['count']
+
+def test_top_k_peaks_matches_online_tracker():
+    peaks = kernels.top_k_peaks(cpu, 3)
+    assert list(peaks) == [6, 1, 3]#ties keep the earliest window first
+    assert peaks[0] == pd.Series(cpu).idxmax()
+
+    tracker = kernels.TopKTracker(3)
+    for value, start, end in zip(cpu, starts, ends):
+        tracker.update(value, start, end)
+    assert [peak['value'] for peak in tracker.peaks()] == [cpu[pos] for pos in peaks]
+    assert tracker.peaks()[1]['start'] == "2026-01-30T13:26:05"
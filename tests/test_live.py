@@ -0,0 +1,54 @@
+import json
+import shutil
+import os
+import pandas as pd
+import pytest
+from pipeline.live import run_live
+
+thresholds = {"memory_pressure_percent": 80, "cpu_saturation_percent": 20}
+
+def test_live_emits_each_closed_window_with_alerts():
+    os.makedirs('temp/processed')
+    os.makedirs('temp/analytics')
+    emitted = []
+    anomalies = {"metrics": ["avg_cpu_total_percent"], "ewma_alpha": 0.5, "z_threshold": 4, "min_std": 1.0, "warmup_windows": 1, "cusum_drift": 0.5, "cusum_threshold": 12}
+    metrics = run_live('temp', [2], duration=None, interval=1, thresholds=thresholds,
+                       on_window=lambda window, row: emitted.append((window, row)), samples=create_samples(), anomalies=anomalies)
+    assert [row['sample_count'] for _, row in emitted] == [1, 2, 2]
+    assert [bool(row['memory_pressure_flag']) for _, row in emitted] == [False, True, False]
+    assert metrics['samples_accepted'] == 5
+    assert metrics['samples_rejected'] == 1
+    assert metrics['windows_closed'] == {"2": 3}
+    assert metrics['streaks'] == {"2": {"memory_pressure": {"longest": 1, "count": 1}, "cpu_saturation": {"longest": 0, "count": 0}}}
+    assert [peak['value'] for peak in metrics['peaks']['2']] == [26.6, 16.4, 12.8]
+    with open('temp/analytics/live_metrics.json') as f:
+        assert json.load(f)['windows_closed'] == {"2": 3}
+    assert len(pd.read_csv('temp/processed/metrics_2s.csv')) == 3
+    shutil.rmtree('temp')
+
+def test_live_late_sample_updates_its_window():
+    os.makedirs('temp/processed')
+    os.makedirs('temp/analytics')
+    emitted = []
+    ingestion = {"allowed_lateness_seconds": 2, "duplicates": "keep"}
+    metrics = run_live('temp', [2], duration=None, interval=1, thresholds=thresholds,
+                       on_window=lambda window, row: emitted.append(row), samples=create_late_samples(), ingestion=ingestion)
+    assert metrics['samples_rejected'] == 0
+    assert [row['window_start'].second for row in emitted] == [39, 40, 42]
+    assert [row['sample_count'] for row in emitted] == [1, 2, 2]
+    shutil.rmtree('temp')
+
+def create_late_samples():
+    yield ['2026-01-30T13:26:39.000', 9.6, 6.8, 83.1, 52.8, 53.4]
+    yield ['2026-01-30T13:26:40.000', 8.1, 5.2, 86.1, 82.8, 53.4]
+    yield ['2026-01-30T13:26:43.000', 7.7, 4.5, 87.3, 52.8, 53.4]
+    yield ['2026-01-30T13:26:41.000', 9.8, 8.8, 81.1, 52.8, 53.4]#2s late, still counted in its window
+    yield ['2026-01-30T13:26:42.000', 21.2, 13.5, 63.9, 53.0, 53.4]
+
+def create_samples():
+    yield ['2026-01-30T13:26:39.000', 9.6, 6.8, 83.1, 52.8, 53.4]
+    yield ['2026-01-30T13:26:40.000', 8.1, 5.2, 86.1, 82.8, 53.4]
+    yield ['2026-01-30T13:26:41.000', 7.7, 4.5, 87.3, 52.8, 53.4]
+    yield ['2026-01-30T13:26:41.500', 7.7, 4.5, 87.3, 152.8, 53.4]#invalid memory
+    yield ['2026-01-30T13:26:42.000', 9.8, 8.8, 81.1, 52.8, 53.4]
+    yield ['2026-01-30T13:26:43.000', 21.2, 13.5, 63.9, 53.0, 53.4]
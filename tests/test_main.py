@@ -0,0 +1,24 @@
+import json
+import subprocess
+import sys
+from pipeline import settings
+
+HEAVY = ["pandas", "numpy", "yaml", "psutil", "matplotlib"]
+
+def loaded_modules(code):
+    result = subprocess.run([sys.executable, "-c", code + "\nimport json, sys\nprint(json.dumps(sorted(sys.modules)))"], capture_output=True, text=True, check=True)
+    return set(json.loads(result.stdout.splitlines()[-1]))
+
+def test_help_imports_no_heavy_modules():
+    modules = loaded_modules("import sys, main\nsys.argv = ['main.py', '--help']\ntry:\n    main.main()\nexcept SystemExit:\n    pass")
+    assert [name for name in HEAVY if name in modules] == []
+    assert not any(name.startswith("pipeline.") for name in modules)
+
+def test_stages_import_without_yaml_psutil_or_matplotlib():
+    modules = loaded_modules("import pipeline.transform, pipeline.analytics, pipeline.query, pipeline.instrument")
+    assert [name for name in ["yaml", "psutil", "matplotlib"] if name in modules] == []
+
+def test_config_is_parsed_once():
+    config = settings.load()
+    assert settings.load() is config
+    assert config['windows']['default']
@@ -0,0 +1,70 @@
+import csv
+import os
+import shutil
+from pipeline import query
+from pipeline.transform import run_transformation
+from pipeline.ingest import run_ingestion
+
+test_file = 'temp/raw.csv'
+
+def test_choose_window_prefers_coarsest_fitting_window():
+    windows = {5: 'a', 60: 'b', 300: 'c'}
+    assert query.choose_window(windows, '2026-01-30T13:05:00', '2026-01-30T13:10:00') == 300
+    assert query.choose_window(windows, '2026-01-30T13:05:00', '2026-01-30T13:06:00') == 60
+    assert query.choose_window(windows, '2026-01-30T13:05:01', '2026-01-30T13:06:00') == 5
+    assert query.choose_window(windows, '2026-01-30T13:05:00', '2026-01-30T13:10:00', granularity=120) == 60
+
+def test_query_processed_range_matches_full_read():
+    create_raw_csv(40)
+    os.makedirs('temp/processed')
+    df = run_ingestion(test_file)
+    for fmt in ["csv", "columnar"]:
+        run_transformation(df, 'temp', [2, 10], fmt=fmt)
+        result = query.query('temp', '2026-01-30T13:26:10', '2026-01-30T13:26:30')
+        assert result['window'] == 10
+        assert result['summary']['windows'] == 2
+        assert result['summary']['samples'] == 20
+        assert result['summary']['max_memory_usage_percent'] == 69.0
+        assert result['summary']['percentiles']['memory_used_percent']['p50'] == 59.5
+        rolled = query.query('temp', '2026-01-30T13:26:00', '2026-01-30T13:26:40', granularity=20)
+        assert rolled['window'] == 10
+        assert list(rolled['rows']['sample_count']) == [20, 20]
+        assert list(rolled['rows']['p50_memory_used_percent']) == [49.5, 69.5]
+        shutil.rmtree('temp/processed')
+        os.makedirs('temp/processed')
+    shutil.rmtree('temp')
+
+def test_csv_index_range_reads_follow_appends_and_truncation(monkeypatch):
+    monkeypatch.setattr(query, "INDEX_EVERY", 3)
+    monkeypatch.setattr(query, "INDEX_BLOCK_BYTES", 32)#smaller than one line
+    create_raw_csv(20)
+    rows = query.read_csv_range(test_file, '2026-01-30T13:26:04', '2026-01-30T13:26:11')
+    assert list(rows['memory_used_percent']) == [44.0, 45.0, 46.0, 47.0, 48.0, 49.0, 50.0]
+    with open(test_file) as f:
+        lines = f.readlines()
+    create_raw_csv(30)#rows appended
+    assert len(query.read_csv_range(test_file, '2026-01-30T13:26:18', '2026-01-30T13:26:25')) == 7
+    with open(test_file, "w") as f:
+        f.writelines(lines[:11])#file truncated
+    assert list(query.read_csv_range(test_file, '2026-01-30T13:26:08', '2026-01-30T13:26:30')['memory_used_percent']) == [48.0, 49.0]
+    shutil.rmtree('temp')
+
+def test_csv_index_range_read_keeps_duplicates_of_start(monkeypatch):
+    monkeypatch.setattr(query, "INDEX_EVERY", 3)
+    os.makedirs('temp', exist_ok=True)
+    with open(test_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"])
+        for row, second in enumerate([0, 1, 2, 3, 3, 3, 3, 4]):#rows 3 and 6 are index entries, both 13:26:03
+            writer.writerow([f'2026-01-30T13:26:{second:02d}', 10.0, 5.0, 85.0, 40.0 + row, 53.4])
+    rows = query.read_csv_range(test_file, '2026-01-30T13:26:03', '2026-01-30T13:26:04')
+    assert list(rows['memory_used_percent']) == [43.0, 44.0, 45.0, 46.0]
+    shutil.rmtree('temp')
+
+def create_raw_csv(num_rows):
+    os.makedirs('temp', exist_ok=True)
+    with open(test_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"])
+        for second in range(num_rows):
+            writer.writerow([f'2026-01-30T13:26:{second:02d}', 10.0, 5.0, 85.0, 40.0 + second, 53.4])
@@ -0,0 +1,85 @@
+import csv
+import os
+import shutil
+import pandas as pd
+import pytest
+from pipeline import retention, storage
+from pipeline.transform import run_transformation, load_state, resume_point
+from pipeline.ingest import run_ingestion, run_incremental_ingestion
+
+test_file = 'temp/raw.csv'
+policy = {"raw_days": 90 / 86400, "tiers": {2: 60 / 86400, 10: 30 / 86400, 60: None}}
+
+def test_tier_plan_rejects_misaligned_tiers():
+    assert retention.tier_plan({5: 7, 60: 90, 3600: None}) == [(60, 5), (3600, 60)]
+    with pytest.raises(ValueError):
+        retention.tier_plan({5: 7, 12: None})
+
+def test_compact_rolls_up_expires_and_keeps_incremental_runs_going():
+    for fmt in ["csv", "columnar"]:
+        create_raw_csv(0, 120)
+        os.makedirs('temp/processed')
+        run_incremental('temp', fmt)
+        report = retention.compact('temp', test_file, now='2026-01-30T13:28:00', policy=policy)
+        assert report[10] == {"rolled_up": 11, "expired": 6}
+        assert report[60] == {"rolled_up": 1, "expired": 0}
+        assert report[2]['expired'] == 30#capped at 13:27:00 by its retention, not by the 10s tier
+        assert report['raw'] == {"expired": 30}
+
+        hourly = storage.read_frame(storage.output_path('temp', 60, fmt))
+        assert list(hourly['sample_count']) == [60]
+        assert list(hourly['avg_cpu_total_percent']) == [15.0]
+        assert list(hourly['max_memory_usage_percent']) == [59.5]
+        assert list(hourly['p50_memory_used_percent']) == [44.75]
+        assert storage.read_frame(storage.output_path('temp', 10, fmt))['window_start'].min() == pd.Timestamp('2026-01-30T13:27:00')
+
+        create_raw_csv(120, 140, append=True)
+        run_incremental('temp', fmt)#continues from the shifted state
+        incremental = storage.read_frame(storage.output_path('temp', 2, fmt))
+        create_raw_csv(0, 140)
+        os.makedirs('temp/batch/processed')
+        batch = run_transformation(run_ingestion(test_file), 'temp/batch', [2], fmt=fmt, return_frames=True)[2]
+        pd.testing.assert_frame_equal(incremental, batch.iloc[30:].reset_index(drop=True), check_dtype=False)
+        shutil.rmtree('temp')
+
+def test_compact_rolls_up_windows_whose_first_sample_is_late():
+    # no samples in the first five seconds of every other 10s window, so those windows start late
+    seconds = [second for second in range(0, 60) if not 10 <= second % 20 < 15]
+    write_raw_seconds([second for second in seconds if second < 30])
+    os.makedirs('temp/processed')
+    tiers = {"raw_days": None, "tiers": {2: None, 10: None}}
+    run_incremental('temp', "csv")
+    retention.compact('temp', test_file, now='2026-01-30T13:28:00', policy=tiers)
+    write_raw_seconds([second for second in seconds if second >= 30], append=True)
+    run_incremental('temp', "csv")
+    retention.compact('temp', test_file, now='2026-01-30T13:28:00', policy=tiers)
+    tier = storage.read_frame(storage.output_path('temp', 10, "csv"))
+    assert list(tier['window_start'].dt.second) == [0, 15, 20, 35, 40]
+    assert list(tier['sample_count']) == [10, 5, 10, 5, 10]
+    shutil.rmtree('temp')
+
+def write_raw_seconds(seconds, append=False):
+    os.makedirs('temp', exist_ok=True)
+    with open(test_file, "a" if append else "w", newline="") as f:
+        writer = csv.writer(f)
+        if not append:
+            writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"])
+        for second in seconds:
+            writer.writerow([(pd.Timestamp('2026-01-30T13:26:00') + pd.Timedelta(seconds=second)).isoformat(), 10.0, 5.0, 85.0, 30.0, 53.4])
+
+def run_incremental(output_dir, fmt):
+    state = load_state(output_dir, [2], test_file, fmt)
+    offset, high_water_mark = resume_point(state)
+    df, offset = run_incremental_ingestion(test_file, offset, high_water_mark)
+    cursor = {"input_path": test_file, "input_offset": offset, "high_water_mark": high_water_mark}
+    run_transformation(df, output_dir, [2], state=state, cursor=cursor, fmt=fmt)
+
+def create_raw_csv(first, last, append=False):
+    os.makedirs('temp', exist_ok=True)
+    with open(test_file, "a" if append else "w", newline="") as f:
+        writer = csv.writer(f)
+        if not append:
+            writer.writerow(["timestamp", "cpu_user_percent", "cpu_system_percent", "cpu_idle_percent", "memory_used_percent", "disk_used_percent"])
+        for second in range(first, last):
+            timestamp = pd.Timestamp('2026-01-30T13:26:00') + pd.Timedelta(seconds=second)
+            writer.writerow([timestamp.isoformat(), 10.0, 5.0, 85.0, 30.0 + (second % 60) / 2, 53.4])
@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pytest
+from pipeline import instrument, serve
+from pipeline.live import run_live
+from tests.test_live import create_samples, thresholds
+
+def fetch(server, path):
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}{path}", timeout=5) as response:
+        return response.headers['Content-Type'], response.read()
+
+def test_serves_cached_windows_flags_and_stages():
+    cache = serve.MetricsCache()
+    server = serve.start_server(cache, port=0)
+    try:
+        row = pd.Series({"window_start": pd.Timestamp("2026-01-30T13:26:40"), "window_end": pd.Timestamp("2026-01-30T13:26:45"), "sample_count": 5,
+                         "avg_cpu_total_percent": 12.5, "max_memory_usage_percent": 86.1, "memory_pressure_flag": True, "cpu_saturation_flag": False})
+        cache.window_closed(5, row)
+        cache.anomalies(5, [{"metric": "avg_cpu_total_percent", "start": "2026-01-30T13:26:40", "end": "2026-01-30T13:26:45", "windows": 1, "detectors": ["ewma"], "peak_value": 12.5, "peak_score": 6.0}])
+        instrument.start_run(["main.py"], on_record=cache.stages)
+        instrument.record("ingestion", rows_in=20, rows_out=15)
+        instrument.finish(os.devnull)
+
+        content_type, body = fetch(server, "/metrics")
+        assert content_type.startswith("text/plain; version=0.0.4")
+        text = body.decode()
+        assert 'metrics_pipeline_window_value{window="5",column="avg_cpu_total_percent"} 12.5' in text
+        assert 'metrics_pipeline_window_flag{window="5",flag="memory_pressure"} 1' in text
+        assert 'metrics_pipeline_window_flag{window="5",flag="cpu_saturation"} 0' in text
+        assert 'metrics_pipeline_windows_closed_total{window="5"} 1' in text
+        assert 'metrics_pipeline_anomaly_intervals_total{window="5",metric="avg_cpu_total_percent"} 1' in text
+        assert 'metrics_pipeline_stage_rows_out{stage="ingestion"} 15' in text
+        assert "window_start" not in text
+
+        content_type, body = fetch(server, "/metrics.json")
+        assert content_type == "application/json"
+        document = json.loads(body)
+        assert document['windows']['5']['latest']['window_start'] == "2026-01-30T13:26:40"
+        assert document['windows']['5']['latest']['memory_pressure_flag'] is True
+        assert document['anomalies']['5'][0]['detectors'] == ["ewma"]
+        assert document['stages'] == [{"name": "ingestion", "rows_in": 20, "rows_out": 15}]
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            fetch(server, "/other")
+        assert error.value.code == 404
+    finally:
+        serve.stop(server)
+
+def test_scrapes_read_the_rendered_cache():
+    cache = serve.MetricsCache()
+    server = serve.start_server(cache, port=0)
+    try:
+        cache.window_closed(5, pd.Series({"sample_count": 5, "avg_cpu_total_percent": 12.5}))
+        rendered = cache.rendered()
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            bodies = list(pool.map(lambda _: fetch(server, "/metrics")[1], range(64)))
+        assert set(bodies) == {rendered[0]}
+        assert cache.rendered() is rendered#scrapes never re-render
+    finally:
+        serve.stop(server)
+
+def test_live_mode_publishes_each_closed_window():
+    os.makedirs('temp/processed')
+    os.makedirs('temp/analytics')
+    cache = serve.MetricsCache()
+    run_live('temp', [2], duration=None, interval=1, thresholds=thresholds, samples=create_samples(), cache=cache)
+    document = json.loads(cache.rendered()[1])
+    assert document['windows']['2']['closed'] == 3
+    assert document['windows']['2']['latest']['window_start'] == "2026-01-30T13:26:42"
+    assert document['live']['samples_accepted'] == 5
+    assert 'metrics_pipeline_samples_total{result="rejected"} 1' in cache.rendered()[0].decode()
+    shutil.rmtree('temp')
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+from pipeline import sketch
+
+def test_exact_sketch_matches_numpy_quantiles():
+    df, buckets = create_samples()
+    window_sketch = sketch.sample_sketches(df, buckets, True, 0.01)
+    quantiles = sketch.quantiles(window_sketch, [50, 95, 99], True, 0.01)
+    cpu_total = df['cpu_user_percent'] + df['cpu_system_percent']
+    for q in [50, 95, 99]:
+        expected = cpu_total.groupby(buckets).quantile(q / 100).round(2).to_numpy()
+        assert np.allclose(quantiles[f'p{q}_cpu_total_percent'].to_numpy(), expected)
+
+def test_binned_sketch_within_relative_accuracy():
+    df, buckets = create_samples()
+    quantiles = sketch.quantiles(sketch.sample_sketches(df, buckets, False, 0.01), [50, 95], False, 0.01)
+    expected = df['memory_used_percent'].groupby(buckets).quantile(0.95).to_numpy()
+    assert np.all(np.abs(quantiles['p95_memory_used_percent'].to_numpy() / expected - 1) <= 0.0101)
+
+def test_rollup_and_merge_match_sketch_of_all_samples():
+    df, buckets = create_samples()
+    direct = sketch.sample_sketches(df, buckets // 100 * 100, False, 0.01)
+    rolled = sketch.rollup(sketch.to_bins(sketch.sample_sketches(df, buckets, True, 0.01), 0.01), 100)
+    pd.testing.assert_frame_equal(direct, rolled)
+    halves = [sketch.sample_sketches(df.iloc[i::2], buckets[i::2] // 100 * 100, False, 0.01) for i in range(2)]
+    pd.testing.assert_frame_equal(direct, sketch.merge(*halves))
+
+def create_samples():
+    rng = np.random.default_rng(0)
+    num_rows = 5000
+    df = pd.DataFrame({
+        "cpu_user_percent": rng.uniform(0, 60, num_rows).round(1),
+        "cpu_system_percent": rng.uniform(0, 30, num_rows).round(1),
+        "memory_used_percent": rng.normal(70, 8, num_rows).round(1),
+    })
+    buckets = np.arange(num_rows) // 100 * 10
+    return df, buckets
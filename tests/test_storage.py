@@ -0,0 +1,32 @@
+import shutil
+import pandas as pd
+from pipeline import storage
+
+temp_dir = 'temp/processed/metrics_2s.cols'
+
+def test_columnar_round_trip_and_slice():
+    df = create_windows()
+    storage.write_frame(df.iloc[:2], temp_dir)
+    storage.write_frame(df.iloc[2:], temp_dir, append=True)
+    assert storage.position(temp_dir) == 4
+    pd.testing.assert_frame_equal(storage.read_frame(temp_dir), df)
+
+    sliced = storage.read_frame(temp_dir, columns=['window_start', 'sample_count'], start='2026-01-30T13:26:42', end='2026-01-30T13:26:46')
+    assert list(sliced['sample_count']) == [3, 4]
+    assert sliced['window_start'].dtype == 'datetime64[ns]'
+    shutil.rmtree('temp')
+
+def test_columnar_truncate():
+    df = create_windows()
+    storage.write_frame(df, temp_dir)
+    storage.truncate(temp_dir, 3)
+    pd.testing.assert_frame_equal(storage.read_frame(temp_dir), df.iloc[:3])
+    shutil.rmtree('temp')
+
+def create_windows():
+    return pd.DataFrame({
+        "window_start": pd.to_datetime(['2026-01-30T13:26:38', '2026-01-30T13:26:40', '2026-01-30T13:26:42', '2026-01-30T13:26:44']).as_unit("ns"),
+        "sample_count": [1, 2, 3, 4],
+        "avg_cpu_total_percent": [16.4, 13.3, 18.6, 34.7],
+        "memory_pressure_flag": [True, False, True, True],
+    })
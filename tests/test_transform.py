@@ -2,11 +2,13 @@ import csv
 import os
 import pandas as pd
 import pytest
-from pipeline.transform import run_transformation
-from pipeline.ingest import run_ingestion
+from pipeline import settings
+from pipeline.transform import run_transformation, load_state, resume_point
+from pipeline.ingest import run_ingestion, iter_ingestion, run_incremental_ingestion
 
 test_file = 'data/raw/temp.csv'
 temp_file = 'temp/processed/metrics_2s.csv'
+temp_sketch_file = 'temp/processed/metrics_2s.sketch.csv'
 
 def test_run_transformation():
     create_temp_csv_data()
@@ -20,9 +22,117 @@ def test_run_transformation():
     assert len(temp_output)-1 <= 3 #should be 3 because starting with 6 rows, halfed for 2 windows, minus the headers. 6/2 -1=3
 
     os.remove(temp_file)
+    os.remove(temp_sketch_file)
     os.removedirs('temp/processed')
     delete_temp_file()
 
+def test_run_transformation_chunked_matches_batch():
+    create_temp_csv_data()
+    os.makedirs('temp/processed')
+    run_transformation(run_ingestion(test_file),'temp',[2])
+    batch_output = pd.read_csv(temp_file)
+    run_transformation(iter_ingestion(test_file, 4),'temp',[2])
+    chunked_output = pd.read_csv(temp_file)
+    pd.testing.assert_frame_equal(batch_output, chunked_output)
+
+    os.remove(temp_file)
+    os.remove(temp_sketch_file)
+    os.removedirs('temp/processed')
+    delete_temp_file()
+
+def test_rolled_up_window_matches_direct():
+    create_temp_csv_data()
+    os.makedirs('temp/processed')
+    df = run_ingestion(test_file)
+    run_transformation(df,'temp',[6])
+    direct_output = pd.read_csv('temp/processed/metrics_6s.csv')
+    run_transformation(df,'temp',[2,6])
+    rolled_output = pd.read_csv('temp/processed/metrics_6s.csv')
+    pd.testing.assert_frame_equal(direct_output, rolled_output)
+
+    os.remove(temp_file)
+    os.remove(temp_sketch_file)
+    os.remove('temp/processed/metrics_6s.csv')
+    os.remove('temp/processed/metrics_6s.sketch.csv')
+    os.removedirs('temp/processed')
+    delete_temp_file()
+
+def test_incremental_transformation_matches_batch():
+    create_temp_csv_data()
+    with open(test_file) as f:
+        lines = f.readlines()
+    os.makedirs('temp/processed')
+    run_transformation(run_ingestion(test_file),'temp',[2])
+    batch_output = pd.read_csv(temp_file)
+
+    with open(test_file, "w") as f:
+        f.writelines(lines[:4])#first three rows, last window still open
+    for _ in range(2):
+        state = load_state('temp', [2], test_file)
+        offset, high_water_mark = resume_point(state)
+        df, offset = run_incremental_ingestion(test_file, offset, high_water_mark)
+        cursor = {"input_path": test_file, "input_offset": offset, "high_water_mark": high_water_mark}
+        run_transformation(df,'temp',[2], state=state, cursor=cursor)
+        with open(test_file, "w") as f:
+            f.writelines(lines)#rest of the rows arrive
+    incremental_output = pd.read_csv(temp_file)
+    pd.testing.assert_frame_equal(batch_output, incremental_output)
+
+    os.remove(temp_file)
+    os.remove(temp_sketch_file)
+    os.remove('temp/processed/metrics_2s.state.json')
+    os.removedirs('temp/processed')
+    delete_temp_file()
+
+def test_incremental_late_sample_updates_open_window():
+    create_temp_csv_data()
+    with open(test_file) as f:
+        header, *rows = f.readlines()
+    os.makedirs('temp/processed')
+    config = {**settings.load(), "ingestion": {"allowed_lateness_seconds": 3, "duplicates": "keep"}}
+    run_transformation(run_ingestion(test_file),'temp',[2], config=config)
+    batch_output = pd.read_csv(temp_file)
+
+    with open(test_file, "w") as f:
+        f.writelines([header, rows[0], rows[1], rows[3], rows[4]])#13:26:41 arrives late
+    for appended in ([], [rows[2], rows[5]]):
+        with open(test_file, "a") as f:
+            f.writelines(appended)
+        state = load_state('temp', [2], test_file)
+        offset, high_water_mark = resume_point(state)
+        df, offset = run_incremental_ingestion(test_file, offset, high_water_mark, lateness=3)
+        cursor = {"input_path": test_file, "input_offset": offset, "high_water_mark": high_water_mark}
+        run_transformation(df,'temp',[2], state=state, cursor=cursor, config=config)
+        if not appended:
+            assert len(load_state('temp', [2], test_file)[2]['open_windows']) == 2#13:26:40 and 13:26:42 wait for late samples
+    incremental_output = pd.read_csv(temp_file)
+    pd.testing.assert_frame_equal(batch_output, incremental_output)
+
+    os.remove(temp_file)
+    os.remove(temp_sketch_file)
+    os.remove('temp/processed/metrics_2s.state.json')
+    os.removedirs('temp/processed')
+    delete_temp_file()
+
+def test_wide_schema_aggregates():
+    df = pd.DataFrame({
+        "timestamp": pd.to_datetime(['2026-01-30T13:26:40', '2026-01-30T13:26:41', '2026-01-30T13:26:42']),
+        "cpu_user_percent": [9.6, 8.1, 7.7], "cpu_system_percent": [6.8, 5.2, 4.5], "cpu_idle_percent": [83.1, 86.1, 87.3],
+        "memory_used_percent": [82.8, 82.8, 82.8], "disk_used_percent": [53.4, 53.4, 53.4],
+        "cpu0_user_percent": [10.0, 20.0, 30.0], "cpu0_idle_percent": [80.0, 70.0, 60.0], "disk_boot_used_percent": [20.0, 21.0, 22.0],
+    })
+    os.makedirs('temp/processed')
+    frames = run_transformation(df,'temp',[2], return_frames=True)
+    assert list(frames[2]['avg_cpu0_user_percent']) == [15.0, 30.0]
+    assert list(frames[2]['max_cpu0_user_percent']) == [20.0, 30.0]
+    assert list(frames[2]['min_cpu0_idle_percent']) == [70.0, 60.0]
+    assert list(frames[2]['max_disk_boot_used_percent']) == [21.0, 22.0]
+    assert 'avg_cpu0_idle_percent' not in frames[2]
+
+    os.remove(temp_file)
+    os.remove(temp_sketch_file)
+    os.removedirs('temp/processed')
+
 
 def create_temp_csv_data():
     with open(test_file, "w", newline="") as f: